@@ -0,0 +1,790 @@
+# analisi.py
+"""
+Motore di analisi senza interfaccia, condiviso dalle pagine Streamlit e dalla
+CLI batch: costruzione del prompt, cache dei risultati, upload e generazione.
+"""
+import concurrent.futures
+import json
+import queue
+import time
+import backend
+import governatore
+import linee_guida
+import prompts
+import os
+import sqlite3
+import result_cache
+import riduzione
+import schemi
+import segmenti
+import store
+import streaming_json
+import strumenti
+import tempfile
+import tracciamento
+import upload_stream
+
+NESSUN_PAESE = "Nessuna selezione specifica"
+SEZIONE_BASE = "base"
+
+
+def _parametri_mercato(paese, controlli):
+    """Parametri della chiave legati al mercato: se il file delle linee guida cambia, cambia anche la chiave."""
+    return {
+        "paese": result_cache.normalizza_paese(paese),
+        "linee_guida": linee_guida.get_default_registro().impronta(paese),
+        "controlli": result_cache.normalizza_controlli(controlli),
+    }
+
+
+def chiave_checker(content_hash, paese=None, controlli="", analisi_persuasiva=False,
+                   ricerca_notizie=False, analisi_performance=False):
+    return result_cache.make_key(
+        "checker",
+        [content_hash],
+        **_parametri_mercato(paese, controlli),
+        analisi_persuasiva=bool(analisi_persuasiva),
+        ricerca_notizie=bool(ricerca_notizie),
+        analisi_performance=bool(analisi_performance),
+        modello=prompts.MODELLO,
+    )
+
+
+def chiave_benchmark(hash_tuo, hash_comp, paese=None, controlli=""):
+    # La coppia è ordinata: scambiare i due video produce un'analisi diversa.
+    return result_cache.make_key(
+        "benchmark",
+        [hash_tuo, hash_comp],
+        **_parametri_mercato(paese, controlli),
+        modello=prompts.MODELLO,
+    )
+
+
+def chiave_estrazione_benchmark(content_hash, paese=None, controlli=""):
+    """Chiave delle informazioni di benchmark estratte da un singolo video."""
+    return result_cache.make_key(
+        "benchmark:estrazione",
+        [content_hash],
+        **_parametri_mercato(paese, controlli),
+        modello=prompts.MODELLO,
+    )
+
+
+def chiave_sezione(content_hash, sezione, paese=None, controlli=""):
+    """Chiave di cache di una singola sezione: solo la base dipende da mercato e controlli."""
+    parametri = _parametri_mercato(paese, controlli) if sezione == SEZIONE_BASE else {}
+    return result_cache.make_key(f"checker:{sezione}", [content_hash], modello=prompts.MODELLO, **parametri)
+
+
+def chiave_segmento(hash_segmento, paese=None, controlli=""):
+    """Chiave della checklist di base di un segmento, indipendente dalla sua posizione nel video."""
+    return result_cache.make_key(
+        "checker:segmento",
+        [hash_segmento],
+        **_parametri_mercato(paese, controlli),
+        modello=prompts.MODELLO,
+    )
+
+
+def _estrai_sezione(sezione, testo):
+    """Decodifica la risposta di una sezione; None se il JSON non è valido."""
+    try:
+        dati = json.loads(testo)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(dati, dict):
+        return None
+    if sezione != SEZIONE_BASE:
+        dati = dati.get(sezione, dati)
+    return dati
+
+
+def _token_usati(response):
+    return getattr(getattr(response, "usage_metadata", None), "total_token_count", None) or None
+
+
+def _genera_json(parti, schema, timeout=600, eventi=None):
+    """
+    Richiesta con output JSON vincolato a `schema` (response_schema). Con una
+    coda `eventi` la risposta è letta in streaming e le sue parti vengono
+    inoltrate appena complete. La richiesta passa dal governatore del processo
+    (limiti di quota, coda equa tra sessioni, ripetizione sui 429).
+    """
+    model = backend.modello(prompts.MODELLO, response_schema=schema)
+    stimati = governatore.stima_token(parti)
+    if eventi is None:
+        with tracciamento.span("generazione", streaming=False, token_stimati=stimati):
+            response = governatore.get_default_governatore().genera(
+                lambda: model.generate_content(parti, request_options={'timeout': timeout}),
+                stimati, _token_usati,
+            )
+        return strumenti.pulisci_risposta_json(response.text)
+
+    chiavi_inviate = set()
+
+    def _in_streaming():
+        # Il governatore ripete la richiesta sui 429: gli eventi del tentativo fallito vanno scartati.
+        if chiavi_inviate:
+            eventi.put((streaming_json.RIPRISTINO, None, sorted(chiavi_inviate)))
+            chiavi_inviate.clear()
+        parser = streaming_json.ParserJsonIncrementale()
+        inizio = time.perf_counter()
+        response = model.generate_content(parti, stream=True, request_options={'timeout': timeout})
+        frammenti = []
+        for chunk in response:
+            if not frammenti:
+                attributi["primo_chunk_s"] = round(time.perf_counter() - inizio, 3)
+            frammenti.append(chunk.text)
+            for evento in parser.feed(chunk.text):
+                chiavi_inviate.add(evento[1])
+                eventi.put(evento)
+        return response, "".join(frammenti)
+
+    with tracciamento.span("generazione", streaming=True, token_stimati=stimati) as attributi:
+        response, testo = governatore.get_default_governatore().genera(
+            _in_streaming, stimati, lambda risultato: _token_usati(risultato[0]))
+    return strumenti.pulisci_risposta_json(testo)
+
+
+def _genera_validato(prompt, media, schema, timeout=600, eventi=None):
+    """
+    Esegue la richiesta, valida la risposta con lo schema e, se alcune sezioni
+    sono difettose, richiede di nuovo solo quelle mantenendo il resto.
+    Restituisce (testo JSON, sezioni riparate, {sezione: errori} ancora presenti).
+    """
+    testo = _genera_json([prompt] + media, schema, timeout, eventi)
+    with tracciamento.span("validazione_json") as attributi:
+        try:
+            dati = json.loads(testo)
+        except ValueError:
+            dati = None
+        difettose = schemi.sezioni_non_valide(dati, schema)
+        attributi["sezioni_difettose"] = len(difettose)
+    if not difettose:
+        schemi.statistiche.registra("risposte_valide")
+        return testo, [], {}
+
+    dati = dati if isinstance(dati, dict) else {}
+    schema_riparazione = schemi.sottoschema(schema, difettose)
+    with tracciamento.span("riparazione", sezioni=",".join(difettose)):
+        testo_riparato = _genera_json([prompts.costruisci_prompt_riparazione(prompt, difettose)] + media,
+                                      schema_riparazione, timeout)
+    try:
+        riparati = json.loads(testo_riparato)
+    except ValueError:
+        riparati = None
+    residui = schemi.sezioni_non_valide(riparati, schema_riparazione)
+    riparate = [chiave for chiave in difettose if chiave not in residui]
+    for chiave in riparate:
+        dati[chiave] = riparati[chiave]
+
+    schemi.statistiche.registra("sezioni_riparate", len(riparate))
+    schemi.statistiche.registra("riparazioni_fallite" if residui else "rerun_evitati")
+    return json.dumps(dati, ensure_ascii=False), riparate, residui
+
+
+def _genera_sezione(file_gemini, sezione, prompt, eventi=None):
+    """
+    Esegue la richiesta di una sezione con validazione e riparazione (vedi
+    _genera_validato). Con una coda `eventi` la sezione base viene letta in streaming.
+    """
+    if sezione != SEZIONE_BASE:
+        eventi = None
+    return _genera_validato(prompt, [file_gemini], schemi.schema_sezione(sezione), eventi=eventi)
+
+
+def _esegui_sezioni(sorgente, content_hash, paesi, controlli_norm, opzionali, display_name, usa_cache,
+                    log=None, on_evento=None, inizio=None):
+    """
+    Esegue le richieste per sezione sullo stesso file. I lavori sono coppie
+    (sezione, paese): la sezione base viene ripetuta per ogni mercato, le
+    sezioni opzionali (indipendenti dal mercato) una sola volta con paese None.
+    I lavori già in cache non vengono rieseguiti e il video viene caricato solo
+    se almeno un lavoro manca. Gli eventi per `on_evento` sono consegnati dal
+    thread chiamante; lo streaming è usato solo con un singolo mercato.
+    Restituisce (dati, testi_base, errori, mancanti, tempi, sezioni riparate).
+    """
+    inizio = inizio or time.perf_counter()
+    lavori = [(SEZIONE_BASE, paese) for paese in paesi] + [(sezione, None) for sezione in opzionali]
+    tempi = {"sezioni": {}}
+    cache = result_cache.get_default_cache()
+    chiavi = {
+        (sezione, paese): chiave_sezione(content_hash, sezione, paese, controlli_norm)
+        for sezione, paese in lavori
+    }
+
+    def _emetti(evento):
+        tempi.setdefault("primo_insight_s", round(time.perf_counter() - inizio, 2))
+        on_evento(evento)
+
+    def _emetti_sezione(sezione, valore):
+        if on_evento is None:
+            return
+        if sezione == SEZIONE_BASE:
+            for chiave in ("verdetto_complessivo", "motivazione_verdetto"):
+                if chiave in valore:
+                    _emetti((streaming_json.VALORE, chiave, valore[chiave]))
+            for item in valore.get("checklist_analisi", []):
+                _emetti((streaming_json.ELEMENTO, "checklist_analisi", item))
+        else:
+            _emetti((streaming_json.VALORE, sezione, valore))
+
+    dati = {}
+    if usa_cache:
+        with tracciamento.span("lettura_cache", richieste=len(lavori)):
+            for lavoro in lavori:
+                testo = cache.get(chiavi[lavoro])
+                if testo is not None:
+                    dati[lavoro] = _estrai_sezione(lavoro[0], testo)
+    mancanti = [lavoro for lavoro in lavori if dati.get(lavoro) is None]
+    for lavoro in lavori:
+        if dati.get(lavoro) is not None:
+            _emetti_sezione(lavoro[0], dati[lavoro])
+
+    testi_base = {}
+    errori = {}
+    riparate = []
+    if mancanti:
+        file_gemini, tempi_video = strumenti.prepara_video(sorgente, display_name, content_hash, log=log)
+        tempi.update(tempi_video)
+        prompt_lavori = {
+            (sezione, paese): prompts.costruisci_prompt_checker(paese or NESSUN_PAESE, controlli_norm)
+            if sezione == SEZIONE_BASE else prompts.costruisci_prompt_sezione(sezione)
+            for sezione, paese in mancanti
+        }
+
+        eventi = queue.Queue() if on_evento is not None and len(paesi) == 1 else None
+        inizio_generazione = time.perf_counter()
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(mancanti), thread_name_prefix="advisor-sezione")
+        try:
+            futures = {
+                pool.submit(governatore.propaga(_genera_sezione), file_gemini, lavoro[0], prompt_lavori[lavoro], eventi): lavoro
+                for lavoro in mancanti
+            }
+            in_corso = set(futures)
+            while in_corso:
+                # Gli eventi vengono consegnati nel thread chiamante (necessario per Streamlit).
+                completati, in_corso = concurrent.futures.wait(in_corso, timeout=0.1,
+                                                               return_when=concurrent.futures.FIRST_COMPLETED)
+                while eventi is not None and not eventi.empty():
+                    _emetti(eventi.get_nowait())
+                for future in completati:
+                    sezione, paese = lavoro = futures[future]
+                    etichetta = f"{sezione}:{paese}" if sezione == SEZIONE_BASE and len(paesi) > 1 else sezione
+                    tempi["sezioni"][etichetta] = round(time.perf_counter() - inizio_generazione, 2)
+                    try:
+                        testo, sezioni_riparate, residui = future.result()
+                    except Exception as e:
+                        if sezione == SEZIONE_BASE and len(paesi) == 1:
+                            raise
+                        errori[lavoro] = str(e)
+                        continue
+                    valore = _estrai_sezione(sezione, testo)
+                    if sezione == SEZIONE_BASE:
+                        testi_base[paese] = testo
+                    riparate += [f"{sezione}.{chiave}" if sezione == SEZIONE_BASE else sezione
+                                 for chiave in sezioni_riparate]
+                    if not valore:
+                        errori[lavoro] = "risposta JSON non valida"
+                        continue
+                    dati[lavoro] = valore
+                    if residui:
+                        # Il risultato parziale viene mostrato ma non salvato in cache.
+                        errori[lavoro] = "; ".join(e for errori_chiave in residui.values() for e in errori_chiave[:2])
+                    else:
+                        cache.put(chiavi[lavoro], testo, meta={"tipo": "checker", "sezione": sezione, "paese": paese})
+                    if sezione != SEZIONE_BASE or eventi is None:
+                        _emetti_sezione(sezione, valore)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        tempi["generazione_s"] = round(time.perf_counter() - inizio_generazione, 2)
+
+    return dati, testi_base, errori, mancanti, tempi, riparate
+
+
+def _unisci(dati, testi_base, paese, opzionali):
+    """Combina la sezione base di un mercato con le sezioni opzionali condivise."""
+    base = dati.get((SEZIONE_BASE, paese))
+    if base is None:
+        # La sezione base non è decodificabile: si restituisce il testo grezzo per la diagnosi.
+        return testi_base.get(paese) or ""
+    unito = dict(base)
+    for sezione in opzionali:
+        if dati.get((sezione, None)) is not None:
+            unito[sezione] = dati[(sezione, None)]
+    return json.dumps(unito, ensure_ascii=False)
+
+
+def _archivia(tipo, sorgente, video_hash, risultato, **campi):
+    """Registra l'analisi nell'archivio del Report Hub; un errore del database non interrompe l'analisi."""
+    if not strumenti.is_valid_json(risultato):
+        return None
+    nome = getattr(sorgente, "name", None)
+    try:
+        with tracciamento.span("archivio", tipo=tipo):
+            return store.get_default_store().salva(
+                tipo, video_hash, risultato, video_nome=os.path.basename(nome) if nome else None, **campi)
+    except sqlite3.Error:
+        return None
+
+
+def _sezioni_opzionali(analisi_persuasiva, ricerca_notizie, analisi_performance):
+    abilitate = {
+        "analisi_persuasiva": analisi_persuasiva,
+        "notizie_recenti": ricerca_notizie,
+        "analisi_performance": analisi_performance,
+    }
+    return [sezione for sezione, attiva in abilitate.items() if attiva]
+
+
+def analizza_checker(sorgente, paese=None, controlli="", analisi_persuasiva=False, ricerca_notizie=False,
+                     analisi_performance=False, display_name="video_checker_file", content_hash=None,
+                     usa_cache=True, log=None, on_evento=None):
+    """
+    Esegue l'analisi del Video Checker su un file-like (UploadedFile o file aperto in "rb").
+
+    Ogni sezione (checklist di base, AIDA, notizie, performance) è una richiesta
+    separata sullo stesso file, eseguita in parallelo alle altre e salvata in cache
+    singolarmente: abilitare una sezione in più costa solo quella sezione.
+    Restituisce un dizionario con il testo JSON unificato (nella forma attesa da
+    utils.visualizza_risultati_checker), l'hash del video, la chiave complessiva,
+    se tutte le sezioni provengono dalla cache e i tempi delle fasi.
+
+    Con `on_evento` la sezione base viene richiesta in streaming e ogni parte
+    completata (vedi streaming_json) viene passata alla callback, sempre dal
+    thread chiamante; il tempo al primo risultato è in tempi["primo_insight_s"].
+    """
+    inizio = time.perf_counter()
+    if content_hash is None:
+        content_hash = strumenti.calcola_hash_video(sorgente)
+    controlli_norm = result_cache.normalizza_controlli(controlli)
+    opzionali = _sezioni_opzionali(analisi_persuasiva, ricerca_notizie, analisi_performance)
+
+    dati, testi_base, errori, mancanti, tempi, riparate = _esegui_sezioni(
+        sorgente, content_hash, [paese], controlli_norm, opzionali, display_name, usa_cache,
+        log=log, on_evento=on_evento, inizio=inizio,
+    )
+    tempi["totale_s"] = round(time.perf_counter() - inizio, 2)
+    risultato = _unisci(dati, testi_base, paese, opzionali)
+    if mancanti:
+        _archivia("checker", sorgente, content_hash, risultato,
+                  mercato=result_cache.normalizza_paese(paese), tempi=tempi,
+                  impostazioni={"controlli": controlli_norm, "sezioni": opzionali})
+    return {
+        "video_hash": content_hash,
+        "cache_key": chiave_checker(content_hash, paese, controlli_norm, analisi_persuasiva,
+                                    ricerca_notizie, analisi_performance),
+        "da_cache": not mancanti,
+        "sezioni_da_cache": [sezione for sezione, p in [(SEZIONE_BASE, paese)] + [(o, None) for o in opzionali]
+                             if (sezione, p) not in mancanti],
+        "errori_sezioni": {sezione: errore for (sezione, _), errore in errori.items()},
+        "sezioni_riparate": riparate,
+        "risultato": risultato,
+        "tempi": tempi,
+    }
+
+
+def analizza_multi_mercato(sorgente, paesi, controlli="", analisi_persuasiva=False, ricerca_notizie=False,
+                           analisi_performance=False, display_name="video_checker_file", content_hash=None,
+                           usa_cache=True, log=None):
+    """
+    Analizza un solo upload rispetto a più mercati in parallelo. La checklist di
+    base (che applica le linee guida culturali) è eseguita per ogni mercato; le
+    sezioni opzionali, indipendenti dal mercato, una sola volta e condivise.
+    Restituisce {"risultati": {paese: testo JSON}, "errori": {paese: messaggio}, ...}.
+    """
+    inizio = time.perf_counter()
+    if content_hash is None:
+        content_hash = strumenti.calcola_hash_video(sorgente)
+    controlli_norm = result_cache.normalizza_controlli(controlli)
+    opzionali = _sezioni_opzionali(analisi_persuasiva, ricerca_notizie, analisi_performance)
+    paesi = list(dict.fromkeys(paesi))
+
+    dati, testi_base, errori, mancanti, tempi, riparate = _esegui_sezioni(
+        sorgente, content_hash, paesi, controlli_norm, opzionali, display_name, usa_cache,
+        log=log, inizio=inizio,
+    )
+    tempi["totale_s"] = round(time.perf_counter() - inizio, 2)
+    risultati = {paese: _unisci(dati, testi_base, paese, opzionali) for paese in paesi}
+    for paese in paesi:
+        if (SEZIONE_BASE, paese) in mancanti:
+            _archivia("checker", sorgente, content_hash, risultati[paese],
+                      mercato=result_cache.normalizza_paese(paese), tempi=tempi,
+                      impostazioni={"controlli": controlli_norm, "sezioni": opzionali, "multi_mercato": paesi})
+    return {
+        "video_hash": content_hash,
+        "risultati": risultati,
+        "errori": {paese or sezione: errore for (sezione, paese), errore in errori.items()},
+        "richieste_eseguite": len(mancanti),
+        "sezioni_riparate": riparate,
+        "tempi": tempi,
+    }
+
+
+def _analizza_segmento(path, display_name, hash_segmento, prompt):
+    with open(path, "rb") as sorgente:
+        file_gemini, _ = strumenti.prepara_video(sorgente, display_name, hash_segmento)
+    testo, _, residui = _genera_validato(prompt, [file_gemini], schemi.SEGMENTO)
+    if residui:
+        raise ValueError(f"risposta non conforme allo schema: {residui}")
+    return testo
+
+
+def _analizza_finestre(finestre, paese, controlli_norm, display_name, usa_cache):
+    """
+    Checklist di base di un insieme di finestre (path, inizio_s, fine_s), in
+    parallelo e con cache per hash del segmento. Restituisce (dati per inizio_s,
+    errori per intervallo, numero di finestre analizzate).
+    """
+    cache = result_cache.get_default_cache()
+    lavori = []
+    for path_segmento, da, a in finestre:
+        with open(path_segmento, "rb") as f:
+            hash_segmento = strumenti.calcola_hash_video(f)
+        lavori.append((path_segmento, da, a, hash_segmento, chiave_segmento(hash_segmento, paese, controlli_norm)))
+
+    dati = {}
+    if usa_cache:
+        for lavoro in lavori:
+            testo = cache.get(lavoro[4])
+            if testo is not None:
+                dati[lavoro[1]] = json.loads(testo)
+    mancanti = [lavoro for lavoro in lavori if lavoro[1] not in dati]
+    errori = {}
+    if not mancanti:
+        return dati, errori, 0
+
+    prompt = prompts.costruisci_prompt_segmento(paese or NESSUN_PAESE, controlli_norm)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(mancanti), thread_name_prefix="advisor-segmento")
+    try:
+        futures = {
+            pool.submit(governatore.propaga(_analizza_segmento), path_segmento,
+                        f"{display_name} [{segmenti.formatta_tempo(da)}-{segmenti.formatta_tempo(a)}]",
+                        hash_segmento, prompt): (da, a, chiave)
+            for path_segmento, da, a, hash_segmento, chiave in mancanti
+        }
+        for future in concurrent.futures.as_completed(futures):
+            da, a, chiave = futures[future]
+            etichetta = f"{segmenti.formatta_tempo(da)}-{segmenti.formatta_tempo(a)}"
+            try:
+                testo = future.result()
+            except Exception as e:
+                errori[etichetta] = str(e)
+                continue
+            if not strumenti.is_valid_json(testo):
+                errori[etichetta] = "risposta JSON non valida"
+                continue
+            dati[da] = json.loads(testo)
+            cache.put(chiave, testo, meta={"tipo": "checker", "sezione": "segmento", "paese": paese})
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return dati, errori, len(mancanti)
+
+
+def analizza_segmentato(sorgente, paese=None, controlli="", analisi_persuasiva=False, ricerca_notizie=False,
+                        analisi_performance=False, display_name="video_checker_file", content_hash=None,
+                        durata_segmento=None, usa_cache=True, log=None):
+    """
+    Video Checker per video lunghi: la checklist di base è eseguita in parallelo
+    su finestre di `durata_segmento` secondi (vedi segmenti.dividi) e le voci
+    vengono fuse con i relativi intervalli ("timestamp"). Ogni segmento è in
+    cache per il proprio hash, quindi dopo un rimontaggio si rianalizzano solo
+    le finestre cambiate. Le sezioni opzionali riguardano il video intero e
+    seguono il percorso di analizza_checker.
+    """
+    log = log or (lambda messaggio: None)
+    inizio = time.perf_counter()
+    if content_hash is None:
+        content_hash = strumenti.calcola_hash_video(sorgente)
+    controlli_norm = result_cache.normalizza_controlli(controlli)
+    opzionali = _sezioni_opzionali(analisi_persuasiva, ricerca_notizie, analisi_performance)
+    nome = getattr(sorgente, "name", display_name)
+
+    with tempfile.TemporaryDirectory(prefix="advisor_segmenti_") as cartella, \
+            upload_stream.file_temporaneo(sorgente, os.path.splitext(nome)[1]) as path:
+        log("Suddivisione del video in segmenti...")
+        finestre = segmenti.dividi(path, cartella, durata_segmento)
+        fine_divisione = time.perf_counter()
+
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="advisor-sezione")
+        try:
+            futuro_opzionali = pool.submit(
+                governatore.propaga(_esegui_sezioni), sorgente, content_hash, [], controlli_norm, opzionali, display_name, usa_cache,
+            ) if opzionali else None
+            dati, errori, analizzati = _analizza_finestre(finestre, paese, controlli_norm, display_name, usa_cache)
+            dati_opzionali, _, errori_opzionali, mancanti_opzionali, _, _ = (
+                futuro_opzionali.result() if futuro_opzionali else ({}, {}, {}, [], {}, []))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        log(f"{len(finestre)} segmenti, {analizzati} analizzati.")
+
+    if not dati:
+        raise RuntimeError(f"Nessun segmento analizzato: {errori}")
+    unito = segmenti.unisci_segmenti([(da, a, dati[da]) for _, da, a in finestre if da in dati])
+    for sezione in opzionali:
+        if dati_opzionali.get((sezione, None)) is not None:
+            unito[sezione] = dati_opzionali[(sezione, None)]
+    risultato = json.dumps(unito, ensure_ascii=False)
+    fine = time.perf_counter()
+    tempi = {
+        "divisione_s": round(fine_divisione - inizio, 2),
+        "analisi_s": round(fine - fine_divisione, 2),
+        "totale_s": round(fine - inizio, 2),
+    }
+    if analizzati or mancanti_opzionali:
+        _archivia("checker", sorgente, content_hash, risultato,
+                  mercato=result_cache.normalizza_paese(paese), tempi=tempi,
+                  impostazioni={"controlli": controlli_norm, "sezioni": opzionali,
+                                "segmentato": True, "segmenti": len(finestre)})
+    errori.update({sezione: errore for (sezione, _), errore in errori_opzionali.items()})
+    return {
+        "video_hash": content_hash,
+        "da_cache": not analizzati and not mancanti_opzionali,
+        "segmenti": len(finestre),
+        "segmenti_analizzati": analizzati,
+        "errori_sezioni": errori,
+        "risultato": risultato,
+        "tempi": tempi,
+    }
+
+
+def analizza_modifiche(sorgente, risultato_precedente, intervalli, paese=None, controlli="",
+                       display_name="video_checker_file", content_hash=None, usa_cache=True, log=None):
+    """
+    Aggiorna l'analisi di una versione precedente dello stesso spot rianalizzando
+    solo gli intervalli modificati (vedi impronte.confronta): le voci trovate
+    nelle parti nuove vengono fuse nella checklist precedente con i loro istanti.
+    Le sezioni opzionali dell'analisi precedente vengono mantenute.
+    """
+    log = log or (lambda messaggio: None)
+    inizio = time.perf_counter()
+    if content_hash is None:
+        content_hash = strumenti.calcola_hash_video(sorgente)
+    controlli_norm = result_cache.normalizza_controlli(controlli)
+    precedente = json.loads(risultato_precedente)
+    nome = getattr(sorgente, "name", display_name)
+
+    with tempfile.TemporaryDirectory(prefix="advisor_modifiche_") as cartella, \
+            upload_stream.file_temporaneo(sorgente, os.path.splitext(nome)[1]) as path:
+        log(f"Rianalisi di {len(intervalli)} parti modificate...")
+        finestre = [(segmenti.taglia(path, cartella, da, a), da, a) for da, a in intervalli]
+        dati, errori, analizzati = _analizza_finestre(finestre, paese, controlli_norm, display_name, usa_cache)
+
+    unito = segmenti.unisci_segmenti([(da, a, dati[da]) for _, da, a in finestre if da in dati], base=precedente)
+    for chiave, valore in precedente.items():
+        unito.setdefault(chiave, valore)
+    risultato = json.dumps(unito, ensure_ascii=False)
+    tempi = {"totale_s": round(time.perf_counter() - inizio, 2)}
+    if analizzati:
+        _archivia("checker", sorgente, content_hash, risultato,
+                  mercato=result_cache.normalizza_paese(paese), tempi=tempi,
+                  impostazioni={"controlli": controlli_norm, "intervalli_rianalizzati": intervalli})
+    return {
+        "video_hash": content_hash,
+        "segmenti_analizzati": analizzati,
+        "errori_sezioni": errori,
+        "risultato": risultato,
+        "tempi": tempi,
+    }
+
+
+def versioni_precedenti(impronta, content_hash, paese=None):
+    """
+    Analisi del Video Checker di video quasi identici già indicizzati (anche
+    analizzati tramite proxy ridotto). Ogni elemento è il confronto di
+    impronte.cerca_simili con in più "analisi": le righe dell'archivio, prima
+    quelle dello stesso mercato.
+    """
+    import impronte
+
+    mercato = result_cache.normalizza_paese(paese)
+    versioni = []
+    for simile in impronte.cerca_simili(impronta, escludi=content_hash):
+        hashes = [simile["video_hash"]] + [
+            riduzione.hash_proxy(simile["video_hash"], preset)
+            for preset in riduzione.PRESET if preset != riduzione.NESSUNA_RIDUZIONE
+        ]
+        righe = store.get_default_store().analisi_per_video(hashes, tipo="checker")
+        if righe:
+            righe.sort(key=lambda r: r["mercato"] != mercato)
+            versioni.append(dict(simile, analisi=righe))
+    return versioni
+
+
+def analizza_benchmark(video_tuo, video_competitor, paese=None, controlli="", hash_tuo=None, hash_comp=None,
+                       usa_cache=True):
+    """
+    Esegue il Competitive Benchmark tra due file-like. I due video vengono
+    caricati e processati in parallelo; i tempi per video sono in esito["tempi_video"].
+    """
+    inizio = time.perf_counter()
+    hash_tuo = hash_tuo or strumenti.calcola_hash_video(video_tuo)
+    hash_comp = hash_comp or strumenti.calcola_hash_video(video_competitor)
+    controlli_norm = result_cache.normalizza_controlli(controlli)
+    cache_key = chiave_benchmark(hash_tuo, hash_comp, paese, controlli_norm)
+    esito = {"video_hash": [hash_tuo, hash_comp], "cache_key": cache_key, "da_cache": False, "tempi_video": [],
+             "sezioni_riparate": [], "errori_sezioni": {}}
+
+    cache = result_cache.get_default_cache()
+    if usa_cache:
+        risultato = cache.get(cache_key)
+        if risultato is not None:
+            esito.update(risultato=risultato, da_cache=True, tempi={"totale_s": round(time.perf_counter() - inizio, 3)})
+            return esito
+
+    (file_tuo, tempi_tuo), (file_comp, tempi_comp) = strumenti.prepara_video_concorrenti([
+        (video_tuo, "Il Tuo Video", hash_tuo),
+        (video_competitor, "Video Competitor", hash_comp),
+    ])
+    fine_preparazione = time.perf_counter()
+
+    prompt_completo = prompts.costruisci_prompt_benchmark(paese or NESSUN_PAESE, controlli_norm)
+    risultato, riparate, residui = _genera_validato(
+        prompt_completo, ["Il Tuo Video:", file_tuo, "Video del Competitor:", file_comp], schemi.BENCHMARK,
+        timeout=900,
+    )
+    fine = time.perf_counter()
+
+    tempi = {
+        "preparazione_s": round(fine_preparazione - inizio, 2),
+        "generazione_s": round(fine - fine_preparazione, 2),
+        "totale_s": round(fine - inizio, 2),
+    }
+    if not residui:
+        cache.put(cache_key, risultato, meta={"tipo": "benchmark", "paese": paese})
+    _archivia("benchmark", video_tuo, hash_tuo, risultato, video_hash_competitor=hash_comp,
+              mercato=result_cache.normalizza_paese(paese), tempi=dict(tempi, video=[tempi_tuo, tempi_comp]),
+              impostazioni={"controlli": controlli_norm})
+    esito.update(risultato=risultato, tempi_video=[tempi_tuo, tempi_comp], tempi=tempi,
+                 sezioni_riparate=riparate, errori_sezioni=residui)
+    return esito
+
+
+def _estrai_benchmark_video(sorgente, display_name, content_hash, prompt):
+    """Carica un video ed estrae le sue informazioni di benchmark; restituisce (testo, tempi)."""
+    file_gemini, tempi_video = strumenti.prepara_video(sorgente, display_name, content_hash)
+    inizio_generazione = time.perf_counter()
+    testo, _, residui = _genera_validato(prompt, [file_gemini], schemi.ESTRAZIONE_BENCHMARK)
+    if residui:
+        raise ValueError(f"risposta non conforme allo schema: {residui}")
+    tempi_video["generazione_s"] = round(time.perf_counter() - inizio_generazione, 2)
+    return testo, tempi_video
+
+
+def etichette_univoche(nomi):
+    """
+    Etichette distinte con cui mostrare i video del confronto: ai nomi ripetuti
+    si aggiunge un numero progressivo, saltando quelli già presi da altri video.
+    """
+    originali = set(nomi)
+    usate = set()
+    etichette = []
+    for nome in nomi:
+        etichetta, n = nome, 1
+        while etichetta in usate or (n > 1 and etichetta in originali):
+            n += 1
+            etichetta = f"{nome} ({n})"
+        usate.add(etichetta)
+        etichette.append(etichetta)
+    return etichette
+
+
+def analizza_benchmark_multiplo(video, paese=None, controlli="", usa_cache=True):
+    """
+    Benchmark tra N video. `video` è una lista di tuple (file-like, nome,
+    content_hash o None); il primo è il video dell'utente. Ogni video richiede
+    al più una chiamata al modello, la cui estrazione è in cache per hash:
+    aggiungere un competitor costa una sola richiesta e il confronto
+    (tabella, classifica, SWOT) è calcolato localmente da `confronto`.
+
+    Estrazioni, errori e tempi sono indicizzati per posizione del video nella
+    lista, perché i nomi dei file possono ripetersi; "etichette" contiene i nomi
+    resi univoci con cui mostrarli.
+    """
+    inizio = time.perf_counter()
+    controlli_norm = result_cache.normalizza_controlli(controlli)
+    video = [(f, nome, h or strumenti.calcola_hash_video(f)) for f, nome, h in video]
+    etichette = etichette_univoche([nome for _, nome, _ in video])
+    chiavi = [chiave_estrazione_benchmark(h, paese, controlli_norm) for _, _, h in video]
+    cache = result_cache.get_default_cache()
+
+    estrazioni = {}
+    if usa_cache:
+        for indice, chiave in enumerate(chiavi):
+            testo = cache.get(chiave)
+            if testo is not None:
+                estrazioni[indice] = json.loads(testo)
+    mancanti = [indice for indice in range(len(video)) if indice not in estrazioni]
+
+    errori = {}
+    tempi_video = {}
+    if mancanti:
+        prompt = prompts.costruisci_prompt_estrazione_benchmark(paese or NESSUN_PAESE, controlli_norm)
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(mancanti), thread_name_prefix="advisor-benchmark")
+        try:
+            futures = {
+                pool.submit(governatore.propaga(_estrai_benchmark_video), video[indice][0], etichette[indice],
+                            video[indice][2], prompt): indice
+                for indice in mancanti
+            }
+            for future in concurrent.futures.as_completed(futures):
+                indice = futures[future]
+                try:
+                    testo, tempi_video[indice] = future.result()
+                except Exception as e:
+                    errori[indice] = str(e)
+                    continue
+                if not strumenti.is_valid_json(testo):
+                    errori[indice] = "risposta JSON non valida"
+                    continue
+                estrazioni[indice] = json.loads(testo)
+                cache.put(chiavi[indice], testo, meta={"tipo": "benchmark:estrazione", "paese": paese})
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # Ordine di caricamento, limitato ai video estratti con successo.
+    estrazioni = {indice: estrazioni[indice] for indice in sorted(estrazioni)}
+    tempi = {"totale_s": round(time.perf_counter() - inizio, 2)}
+    sorgente, _, hash_tuo = video[0]
+    if mancanti and 0 in estrazioni and len(estrazioni) > 1:
+        competitor = [video[indice][2] for indice in estrazioni if indice]
+        _archivia("benchmark", sorgente, hash_tuo,
+                  _risultato_multiplo({etichette[i]: dati for i, dati in estrazioni.items()}, etichette[0]),
+                  video_hash_competitor=competitor[0], mercato=result_cache.normalizza_paese(paese),
+                  tempi=dict(tempi, video={etichette[i]: t for i, t in tempi_video.items()}),
+                  impostazioni={"controlli": controlli_norm, "multiplo": True,
+                                "video": [etichette[i] for i in estrazioni], "video_hash_competitor": competitor})
+    return {
+        "etichette": etichette,
+        "video_hash": [h for _, _, h in video],
+        "estrazioni": estrazioni,
+        "errori": errori,
+        "richieste_eseguite": len(mancanti),
+        "tempi_video": tempi_video,
+        "tempi": tempi,
+    }
+
+
+def _risultato_multiplo(estrazioni, nostro):
+    """
+    Risultato archiviato del benchmark a N video: le estrazioni (da cui il Report
+    Hub ricalcola il confronto), il verdetto del video dell'utente e la tabella
+    comparativa, dove il competitor ha una caratteristica se la ha la maggioranza.
+    """
+    caratteristiche = {nome: dati.get("caratteristiche") or {} for nome, dati in estrazioni.items()}
+    competitor = [nome for nome in estrazioni if nome != nostro]
+    tabella = [
+        {
+            "caratteristica": c,
+            "tuo_video": bool(caratteristiche[nostro].get(c)),
+            "competitor": 2 * sum(bool(caratteristiche[nome].get(c)) for nome in competitor) >= len(competitor),
+        }
+        for c in prompts.CARATTERISTICHE_BENCHMARK
+    ]
+    return json.dumps({
+        "video_tuo": nostro,
+        "analisi_tuo_video": {chiave: estrazioni[nostro].get(chiave)
+                              for chiave in ("verdetto_complessivo", "motivazione_verdetto")},
+        "tabella_comparativa": tabella,
+        "estrazioni": estrazioni,
+    }, ensure_ascii=False)
@@ -0,0 +1,294 @@
+# approfondimenti.py
+"""
+Domande di approfondimento su un video già analizzato.
+
+Il prefisso comune a tutte le domande (istruzioni di sistema con le linee guida
+culturali, video e analisi già svolta) viene salvato come contesto in cache sul
+servizio (context caching di Gemini): ogni domanda paga solo i token nuovi della
+conversazione e della risposta, e il video non viene rielaborato.
+
+I contesti sono condivisi dalle sessioni che interrogano la stessa analisi. La
+loro scadenza (ADVISOR_CONTEXT_TTL_MIN) viene prolungata quando vengono usati, e
+ne restano attivi al massimo ADVISOR_CONTEXT_MAX: quelli usati meno di recente
+vengono eliminati. Se il contesto non può essere creato (contenuto sotto il
+minimo di token della cache, modello che non la supporta) la domanda viene
+inviata con il prefisso completo.
+"""
+import atexit
+import collections
+import datetime
+import hashlib
+import os
+import threading
+import time
+import backend
+import file_registry
+import governatore
+import linee_guida
+import poller
+import prompts
+import result_cache
+import riduzione
+import strumenti
+import tracciamento
+
+PREFISSO_ANALISI = "Analisi già svolta sul video (JSON):\n"
+STRISCE_LOCK = 64
+
+
+class VideoNonDisponibile(Exception):
+    """Il video analizzato non è più sul servizio e non è stato fornito il file per ricaricarlo."""
+
+
+def e_cache_non_supportata(errore):
+    """
+    True per gli errori con cui il servizio rifiuta il contesto in cache
+    (InvalidArgument / HTTP 400: contenuto sotto il minimo di token, modello
+    che non supporta la cache). Gli altri errori non dipendono dal contenuto.
+    """
+    if type(errore).__name__ in ("InvalidArgument", "FailedPrecondition"):
+        return True
+    try:
+        return int(getattr(errore, "code", 0) or 0) == 400
+    except (TypeError, ValueError):
+        return False
+
+
+class GestoreContesti:
+    """
+    Contesti in cache per chiave (video, mercato e linee guida, controlli, analisi), in ordine
+    di ultimo uso. Una voce senza contesto ricorda che il servizio ha rifiutato
+    la cache per quel contenuto: fino alla sua scadenza le domande usano il
+    prefisso completo. Gli altri errori di `crea` vengono propagati senza
+    lasciare traccia, così la domanda successiva riprova.
+    """
+
+    def __init__(self, api=None, modello=prompts.MODELLO, ttl_s=1800, max_contesti=20):
+        self._api = api
+        self.modello = modello
+        self.ttl_s = ttl_s
+        self.max_contesti = max_contesti
+        self._voci = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Lock a strisce: numero fisso, le chiavi che collidono condividono solo l'attesa della creazione.
+        self._chiave_locks = [threading.Lock() for _ in range(STRISCE_LOCK)]
+        self._contatori = {"creati": 0, "riusati": 0, "senza_cache": 0, "eliminati": 0}
+
+    @property
+    def api(self):
+        return self._api or backend.get_default_backend()
+
+    def ottieni(self, chiave, crea):
+        """
+        Il contesto in cache per `chiave`, o None se non disponibile. Se manca o è
+        scaduto viene creato con `crea(ttl)`; se sta per scadere la sua durata
+        viene prolungata.
+        """
+        self._scarta_scaduti()
+        with self._chiave_locks[hash(chiave) % len(self._chiave_locks)]:
+            with self._lock:
+                voce = self._voci.get(chiave)
+                if voce is not None:
+                    self._voci.move_to_end(chiave)
+            if voce is not None:
+                if voce["contesto"] is None:
+                    self._conta("senza_cache")
+                    return None
+                if self._prolunga(voce):
+                    self._conta("riusati")
+                    return voce["contesto"]
+                self._rimuovi(chiave)
+
+            ttl = datetime.timedelta(seconds=self.ttl_s)
+            try:
+                contesto = crea(ttl)
+            except Exception as e:
+                if not e_cache_non_supportata(e):
+                    raise
+                contesto = None
+            self._conta("creati" if contesto is not None else "senza_cache")
+            with self._lock:
+                self._voci[chiave] = {"contesto": contesto, "scadenza": time.time() + self.ttl_s}
+                eccedenti = []
+                while len(self._voci) > self.max_contesti:
+                    eccedenti.append(self._voci.popitem(last=False)[1])
+            for voce in eccedenti:
+                self._elimina(voce)
+            return contesto
+
+    def _prolunga(self, voce):
+        """Rinnova la scadenza se è passata più di metà della durata; False se il contesto non esiste più."""
+        if voce["scadenza"] - time.time() > self.ttl_s / 2:
+            return True
+        try:
+            voce["contesto"].update(ttl=datetime.timedelta(seconds=self.ttl_s))
+        except Exception:
+            return False
+        voce["scadenza"] = time.time() + self.ttl_s
+        return True
+
+    def _scarta_scaduti(self):
+        # I contesti scaduti sono già stati eliminati dal servizio: basta dimenticarli.
+        ora = time.time()
+        with self._lock:
+            for chiave in [c for c, voce in self._voci.items() if voce["scadenza"] <= ora]:
+                del self._voci[chiave]
+
+    def _rimuovi(self, chiave):
+        with self._lock:
+            voce = self._voci.pop(chiave, None)
+        if voce is not None:
+            self._elimina(voce)
+
+    def _elimina(self, voce):
+        if voce["contesto"] is None:
+            return
+        try:
+            voce["contesto"].delete()
+        except Exception:
+            pass
+        self._conta("eliminati")
+
+    def _conta(self, nome):
+        with self._lock:
+            self._contatori[nome] += 1
+
+    def rilascia_tutti(self):
+        """Elimina tutti i contesti ancora attivi (alla chiusura del processo)."""
+        with self._lock:
+            voci = list(self._voci.values())
+            self._voci.clear()
+        for voce in voci:
+            self._elimina(voce)
+
+    def stats(self):
+        with self._lock:
+            attivi = sum(1 for voce in self._voci.values() if voce["contesto"] is not None)
+            return {"attivi": attivi, "max_contesti": self.max_contesti, **self._contatori}
+
+
+def _file_del_video(video_hash, sorgente):
+    """
+    Il file remoto del video analizzato: quello del registro se ancora valido,
+    altrimenti ricaricato da `sorgente`. Se l'analisi è stata fatta sul proxy
+    ridotto (`video_hash` è l'hash del proxy) viene ricaricato il proxy, con lo
+    stesso hash, così le domande successive lo ritrovano nel registro.
+    """
+    file_remoto = file_registry.get_default_registry().lookup(video_hash)
+    if file_remoto is not None:
+        return poller.get_default_poller().wait(file_remoto)
+    if sorgente is None:
+        raise VideoNonDisponibile("Il video non è più disponibile sul servizio: caricalo di nuovo per fare altre domande.")
+    hash_sorgente = strumenti.calcola_hash_video(sorgente)
+    preset = next((p for p in riduzione.PRESET if p != riduzione.NESSUNA_RIDUZIONE
+                   and riduzione.hash_proxy(hash_sorgente, p) == video_hash), None)
+    if preset is None:
+        file_remoto, _ = strumenti.prepara_video(sorgente, display_name="approfondimento", content_hash=hash_sorgente)
+        return file_remoto
+    video, hash_video, _ = riduzione.get_default_proxy_cache().prepara(sorgente, hash_sorgente, preset)
+    try:
+        file_remoto, _ = strumenti.prepara_video(video, display_name="approfondimento", content_hash=hash_video)
+    finally:
+        if video is not sorgente:
+            video.close()
+    return file_remoto
+
+
+def _conversazione(storia, domanda):
+    contenuti = []
+    for precedente, risposta in storia:
+        contenuti.append({"role": "user", "parts": [precedente]})
+        contenuti.append({"role": "model", "parts": [risposta]})
+    contenuti.append({"role": "user", "parts": [domanda]})
+    return contenuti
+
+
+def _token_usati(response):
+    return getattr(getattr(response, "usage_metadata", None), "total_token_count", None) or None
+
+
+def chiedi(video_hash, risultato, domanda, storia=(), paese=None, controlli="", sorgente=None, gestore=None):
+    """
+    Risponde a `domanda` sul video con hash `video_hash`, già analizzato con
+    esito `risultato` (il testo JSON dell'analisi). `storia` è la conversazione
+    precedente come sequenza di coppie (domanda, risposta). `sorgente` (file-like
+    del video) serve solo se il file remoto non è più disponibile.
+
+    Restituisce il testo della risposta e un dizionario con l'uso del contesto in
+    cache, i token letti dalla cache, i token nuovi e la durata.
+    """
+    gestore = gestore or get_default_gestore_contesti()
+    api = gestore.api
+    inizio = time.perf_counter()
+    controlli_norm = result_cache.normalizza_controlli(controlli)
+    istruzioni = prompts.costruisci_istruzioni_approfondimento(paese, controlli_norm)
+    chiave = (video_hash, result_cache.normalizza_paese(paese), linee_guida.get_default_registro().impronta(paese),
+              controlli_norm, hashlib.sha256(risultato.encode("utf-8")).hexdigest()[:16])
+    prefisso = []
+
+    def _prefisso():
+        if not prefisso:
+            prefisso.extend([_file_del_video(video_hash, sorgente), PREFISSO_ANALISI + risultato])
+        return prefisso
+
+    def _crea(ttl):
+        # Il video si risolve prima della richiesta: VideoNonDisponibile e gli errori di rete non sono
+        # un rifiuto della cache e vengono propagati da gestore.ottieni.
+        parti = _prefisso()
+        return governatore.get_default_governatore().genera(
+            lambda: api.caching.CachedContent.create(
+                model=gestore.modello,
+                system_instruction=istruzioni,
+                contents=[{"role": "user", "parts": parti}],
+                ttl=ttl,
+                display_name=f"advisor:{video_hash[:16]}",
+            ),
+            governatore.stima_token(parti),
+        )
+
+    with tracciamento.span("contesto_approfondimento") as attributi:
+        contesto = gestore.ottieni(chiave, _crea)
+        attributi["da_cache"] = contesto is not None
+
+    contenuti = _conversazione(storia, domanda)
+    if contesto is not None:
+        modello = api.GenerativeModel.from_cached_content(cached_content=contesto)
+    else:
+        modello = api.GenerativeModel(gestore.modello, system_instruction=istruzioni)
+        contenuti[0] = {"role": "user", "parts": _prefisso() + contenuti[0]["parts"]}
+    parti = [parte for contenuto in contenuti for parte in contenuto["parts"]]
+
+    with tracciamento.span("approfondimento", da_contesto=contesto is not None):
+        response = governatore.get_default_governatore().genera(
+            lambda: modello.generate_content(contenuti, request_options={"timeout": 300}),
+            governatore.stima_token(parti), _token_usati,
+        )
+
+    uso = getattr(response, "usage_metadata", None)
+    in_cache = getattr(uso, "cached_content_token_count", 0) or 0
+    info = {
+        "da_contesto": contesto is not None,
+        "token_in_cache": in_cache,
+        "token_nuovi": (getattr(uso, "prompt_token_count", 0) or 0) - in_cache
+                       + (getattr(uso, "candidates_token_count", 0) or 0),
+        "durata_s": round(time.perf_counter() - inizio, 2),
+    }
+    return response.text, info
+
+
+_default_gestore = None
+_default_lock = threading.Lock()
+
+
+def get_default_gestore_contesti():
+    """Restituisce il gestore dei contesti condiviso dal processo, configurato tramite variabili d'ambiente."""
+    global _default_gestore
+    with _default_lock:
+        if _default_gestore is None:
+            _default_gestore = GestoreContesti(
+                modello=os.getenv("ADVISOR_CONTEXT_MODEL", prompts.MODELLO),
+                ttl_s=float(os.getenv("ADVISOR_CONTEXT_TTL_MIN", "30")) * 60,
+                max_contesti=int(os.getenv("ADVISOR_CONTEXT_MAX", "20")),
+            )
+            atexit.register(_default_gestore.rilascia_tutti)
+        return _default_gestore
@@ -0,0 +1,91 @@
+# backend.py
+"""
+Backend del modello usato da tutta l'applicazione: il modulo google.generativeai
+oppure il sostituto locale di fake_gemini (ADVISOR_BACKEND=fake), per sviluppo,
+demo e benchmark senza rete né quota.
+
+Un backend espone la parte dell'interfaccia di google.generativeai usata da
+Ad-Visor: configure, upload_file, get_file, delete_file, list_files,
+GenerativeModel e GenerationConfig.
+
+Il backend è condiviso da tutto il processo (sessioni e rerun compresi): il
+file .env viene letto una sola volta, l'SDK viene importato e configurato
+alla prima richiesta e i modelli sono riusati per nome e configurazione.
+"""
+import collections
+import json
+import os
+import threading
+
+GEMINI = "gemini"
+FAKE = "fake"
+MAX_MODELLI = 64
+
+
+def nome_configurato():
+    return os.getenv("ADVISOR_BACKEND", GEMINI).strip().lower()
+
+
+def locale():
+    """True se il backend non è l'API reale (nessuna chiave richiesta, niente upload resumable via HTTP)."""
+    return nome_configurato() == FAKE
+
+
+_default_backend = None
+_default_lock = threading.Lock()
+_ambiente_caricato = False
+_modelli = collections.OrderedDict()
+_modelli_lock = threading.Lock()
+
+
+def configura():
+    """
+    Carica il file .env (una volta per processo) e verifica che il backend sia
+    utilizzabile: True per il backend locale o se GEMINI_API_KEY è impostata.
+    Non importa l'SDK, che viene caricato alla prima richiesta.
+    """
+    global _ambiente_caricato
+    if not _ambiente_caricato:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _ambiente_caricato = True
+    return locale() or bool(os.getenv("GEMINI_API_KEY"))
+
+
+def get_default_backend():
+    """Restituisce il backend condiviso dal processo, scelto con ADVISOR_BACKEND e configurato al primo uso."""
+    global _default_backend
+    configura()
+    with _default_lock:
+        if _default_backend is None:
+            if locale():
+                import fake_gemini
+                _default_backend = fake_gemini.FakeGemini.da_ambiente()
+            else:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                _default_backend = genai
+        return _default_backend
+
+
+def modello(nome, response_schema=None, **opzioni):
+    """
+    GenerativeModel condiviso per nome, schema della risposta (output JSON) e
+    altre opzioni del costruttore: i modelli non vengono ricreati a ogni
+    richiesta. Ne restano in memoria al massimo MAX_MODELLI.
+    """
+    chiave = json.dumps([nome, response_schema, opzioni], sort_keys=True, default=str)
+    with _modelli_lock:
+        if chiave in _modelli:
+            _modelli.move_to_end(chiave)
+            return _modelli[chiave]
+    api = get_default_backend()
+    if response_schema is not None:
+        opzioni["generation_config"] = api.GenerationConfig(response_mime_type="application/json",
+                                                            response_schema=response_schema)
+    nuovo = api.GenerativeModel(model_name=nome, **opzioni)
+    with _modelli_lock:
+        _modelli[chiave] = nuovo
+        while len(_modelli) > MAX_MODELLI:
+            _modelli.popitem(last=False)
+    return nuovo
@@ -0,0 +1,209 @@
+# batch_cli.py
+"""
+Analisi batch da riga di comando, senza interfaccia Streamlit.
+
+Esempi:
+    python batch_cli.py videos/ -o risultati.jsonl --paese Italia --persuasiva
+    python batch_cli.py campagna.jsonl -o risultati.jsonl --workers 8
+
+Il manifest (.jsonl o .csv) contiene un video per riga con le impostazioni
+per-elemento: video, paese, controlli, analisi_persuasiva, ricerca_notizie,
+analisi_performance. I campi mancanti usano i valori passati da riga di comando.
+I risultati vengono scritti in JSONL man mano che ogni video termina; rilanciando
+lo stesso comando, gli elementi già completati vengono saltati.
+"""
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import riduzione
+
+ESTENSIONI_VIDEO = (".mp4", ".mov", ".avi", ".mkv")
+CAMPI_BOOLEANI = ("analisi_persuasiva", "ricerca_notizie", "analisi_performance")
+
+
+def booleano(valore):
+    if isinstance(valore, bool):
+        return valore
+    return str(valore).strip().lower() in ("1", "true", "si", "sì", "yes", "x")
+
+
+def carica_elementi(sorgente, default):
+    """Restituisce la lista degli elementi da analizzare a partire da una cartella o da un manifest."""
+    if os.path.isdir(sorgente):
+        return [
+            dict(default, video=os.path.join(sorgente, nome))
+            for nome in sorted(os.listdir(sorgente))
+            if nome.lower().endswith(ESTENSIONI_VIDEO)
+        ]
+
+    base = os.path.dirname(os.path.abspath(sorgente))
+    with open(sorgente, "r", encoding="utf-8") as f:
+        if sorgente.lower().endswith(".csv"):
+            righe = list(csv.DictReader(f))
+        else:
+            righe = [json.loads(riga) for riga in f if riga.strip()]
+
+    elementi = []
+    for riga in righe:
+        elemento = dict(default)
+        elemento.update({k: v for k, v in riga.items() if v not in (None, "")})
+        for campo in CAMPI_BOOLEANI:
+            elemento[campo] = booleano(elemento.get(campo, False))
+        elemento["video"] = os.path.join(base, elemento["video"])
+        elementi.append(elemento)
+    return elementi
+
+
+def completati(output):
+    """Chiavi di cache degli elementi già analizzati con successo in un output precedente."""
+    chiavi = set()
+    if not os.path.exists(output):
+        return chiavi
+    with open(output, "r", encoding="utf-8") as f:
+        for riga in f:
+            try:
+                record = json.loads(riga)
+            except ValueError:
+                # Riga troncata da un'interruzione: l'elemento verrà rianalizzato.
+                continue
+            if record.get("stato") == "ok":
+                chiavi.add(record["cache_key"])
+    return chiavi
+
+
+class ScrittoreJsonl:
+    """Scrittura thread-safe di un record per riga, resa persistente subito."""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def scrivi(self, record):
+        riga = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(riga + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def analizza_elemento(elemento, gia_completati, usa_cache, preset=riduzione.NESSUNA_RIDUZIONE):
+    import analisi
+    import linee_guida
+    import strumenti
+
+    linee_guida.get_default_registro().verifica(elemento.get("paese"))
+
+    record = {"video": elemento["video"], "impostazioni": {
+        "paese": elemento.get("paese"),
+        "controlli": elemento.get("controlli", ""),
+        **{campo: elemento.get(campo, False) for campo in CAMPI_BOOLEANI},
+    }}
+    with open(elemento["video"], "rb") as sorgente:
+        content_hash = strumenti.calcola_hash_video(sorgente)
+        # Con un preset di riduzione si analizza il proxy, identificato da un hash derivato.
+        hash_analisi = content_hash if preset == riduzione.NESSUNA_RIDUZIONE else riduzione.hash_proxy(content_hash, preset)
+        cache_key = analisi.chiave_checker(hash_analisi, **record["impostazioni"])
+        record.update(video_hash=content_hash, cache_key=cache_key)
+        if cache_key in gia_completati:
+            return None
+        proxy, hash_analisi, report = riduzione.get_default_proxy_cache().prepara(sorgente, content_hash, preset)
+        if report.get("proxy_non_conveniente"):
+            record["cache_key"] = cache_key = analisi.chiave_checker(hash_analisi, **record["impostazioni"])
+            if cache_key in gia_completati:
+                return None
+        try:
+            esito = analisi.analizza_checker(
+                proxy,
+                display_name=os.path.basename(elemento["video"]),
+                content_hash=hash_analisi,
+                usa_cache=usa_cache,
+                **record["impostazioni"],
+            )
+        finally:
+            if proxy is not sorgente:
+                proxy.close()
+    if preset != riduzione.NESSUNA_RIDUZIONE:
+        record["riduzione"] = report
+    record.update(stato="ok", da_cache=esito["da_cache"], tempi=esito["tempi"])
+    try:
+        record["risultato"] = json.loads(esito["risultato"])
+    except ValueError:
+        record.update(stato="json_non_valido", risultato=esito["risultato"])
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ad-Visor: analisi batch dei video pubblicitari.")
+    parser.add_argument("sorgente", help="Cartella di video oppure manifest .jsonl/.csv")
+    parser.add_argument("-o", "--output", required=True, help="File JSONL dei risultati (riprende se esiste)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Analisi concorrenti (default 4)")
+    parser.add_argument("--paese", default=None, help="Mercato di riferimento predefinito")
+    parser.add_argument("--controlli", default="", help="Controlli personalizzati predefiniti (uno per riga)")
+    parser.add_argument("--persuasiva", action="store_true", help="Abilita l'analisi persuasiva")
+    parser.add_argument("--notizie", action="store_true", help="Abilita la ricerca notizie recenti")
+    parser.add_argument("--performance", action="store_true", help="Abilita l'analisi performance")
+    parser.add_argument("--no-cache", action="store_true", help="Ignora i risultati in cache")
+    parser.add_argument("--riduzione", default=riduzione.preset_configurato(), choices=list(riduzione.PRESET),
+                        help="Preset di riduzione dei video prima dell'upload (default: originale)")
+    args = parser.parse_args(argv)
+
+    import backend
+
+    if not backend.configura():
+        print("Chiave API di Gemini non trovata. Assicurati di averla impostata nel file .env", file=sys.stderr)
+        return 2
+
+    default = {
+        "paese": args.paese,
+        "controlli": args.controlli,
+        "analisi_persuasiva": args.persuasiva,
+        "ricerca_notizie": args.notizie,
+        "analisi_performance": args.performance,
+    }
+    elementi = carica_elementi(args.sorgente, default)
+    gia_completati = completati(args.output)
+    scrittore = ScrittoreJsonl(args.output)
+    conteggi = {"ok": 0, "saltati": 0, "errori": 0}
+    inizio = time.perf_counter()
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="advisor-batch")
+    try:
+        futures = {
+            pool.submit(analizza_elemento, elemento, gia_completati, not args.no_cache, args.riduzione): elemento
+            for elemento in elementi
+        }
+        for future in concurrent.futures.as_completed(futures):
+            elemento = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                record = {"video": elemento["video"], "stato": "errore", "errore": str(e)}
+            if record is None:
+                conteggi["saltati"] += 1
+                continue
+            scrittore.scrivi(record)
+            conteggi["ok" if record["stato"] == "ok" else "errori"] += 1
+            print(f"[{sum(conteggi.values())}/{len(elementi)}] {record['stato']}: {elemento['video']}",
+                  file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Interrotto: rilancia lo stesso comando per riprendere.", file=sys.stderr)
+        return 130
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        scrittore.close()
+
+    print(f"Completato in {time.perf_counter() - inizio:.1f}s: {conteggi['ok']} ok, "
+          f"{conteggi['saltati']} già analizzati, {conteggi['errori']} errori.", file=sys.stderr)
+    return 1 if conteggi["errori"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# benchmark_avvio.py
+"""
+Misura il tempo di avvio a freddo e il costo di ogni rerun delle pagine, con
+il runner di test di Streamlit (streamlit.testing), senza browser né rete.
+
+Per ogni pagina un processo nuovo importa Streamlit, poi esegue la pagina una
+prima volta (avvio a freddo: import dei moduli dell'app e inizializzazione) e
+altre N volte (rerun). Vengono riportati anche i moduli pesanti caricati.
+
+Esempio:
+    python benchmark_avvio.py --rerun 10
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+PAGINE = ["app.py", "pages/1_video_checker.py", "pages/2_competitive_benchmark.py", "pages/3_report_hub.py"]
+MODULI_PESANTI = ["google.generativeai", "pandas", "numpy", "pyarrow"]
+
+_MISURA = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+pagina, rerun, moduli = sys.argv[1], int(sys.argv[2]), sys.argv[3].split(",")
+test = AppTest.from_file(pagina, default_timeout=120)
+inizio = time.perf_counter()
+test.run()
+freddo = time.perf_counter() - inizio
+tempi = []
+for _ in range(rerun):
+    inizio = time.perf_counter()
+    test.run()
+    tempi.append(time.perf_counter() - inizio)
+tempi.sort()
+print(json.dumps({
+    "freddo_s": round(freddo, 3),
+    "rerun_mediana_ms": round(tempi[len(tempi) // 2] * 1000, 1) if tempi else None,
+    "eccezioni": [str(e.value) for e in test.exception],
+    "moduli": [m for m in moduli if m in sys.modules],
+}))
+"""
+
+
+def misura(pagina, rerun, ambiente):
+    uscita = subprocess.run(
+        [sys.executable, "-c", _MISURA, pagina, str(rerun), ",".join(MODULI_PESANTI)],
+        capture_output=True, text=True, env=ambiente, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if uscita.returncode:
+        raise RuntimeError(uscita.stderr.strip().splitlines()[-1] if uscita.stderr.strip() else "errore sconosciuto")
+    return json.loads(uscita.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ad-Visor: tempi di avvio e di rerun delle pagine.")
+    parser.add_argument("--rerun", type=int, default=10,
+                        help="Rerun misurati per pagina (default 10; 0 misura solo l'avvio a freddo)")
+    parser.add_argument("--pagine", nargs="+", default=PAGINE, help="Pagine da misurare")
+    parser.add_argument("--json", help="Salva i risultati anche in questo file JSON")
+    args = parser.parse_args(argv)
+    if args.rerun < 0:
+        parser.error("--rerun non può essere negativo")
+
+    cartella = tempfile.mkdtemp(prefix="advisor_avvio_")
+    # Cartelle usa e getta; una chiave fittizia basta per configurare il client senza richieste.
+    ambiente = dict(os.environ, ADVISOR_CACHE_DIR=cartella, ADVISOR_DB_PATH=os.path.join(cartella, "analisi.sqlite3"),
+                    GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", "chiave-di-prova"))
+    risultati = {}
+    print(f"{'pagina':<36} {'avvio s':>8} {'rerun ms':>9}  moduli pesanti")
+    try:
+        for pagina in args.pagine:
+            r = risultati[pagina] = misura(pagina, args.rerun, ambiente)
+            rerun_ms = "—" if r["rerun_mediana_ms"] is None else f"{r['rerun_mediana_ms']:.1f}"
+            print(f"{pagina:<36} {r['freddo_s']:>8.2f} {rerun_ms:>9}  {', '.join(r['moduli']) or '—'}")
+            for eccezione in r["eccezioni"]:
+                print(f"    eccezione: {eccezione}", file=sys.stderr)
+    finally:
+        shutil.rmtree(cartella, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(risultati, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
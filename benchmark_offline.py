@@ -0,0 +1,141 @@
+# benchmark_offline.py
+"""
+Benchmark offline del Video Checker con il backend locale di fake_gemini:
+misura il costo dell'applicazione (upload a blocchi, attesa del processamento,
+streaming, validazione, cache, archivio) senza rete né quota.
+
+Per ogni numero di sessioni concorrenti indicato, ogni sessione esegue alcune
+analisi su video sintetici diversi; vengono riportati latenza p50/p95, tempo al
+primo risultato, throughput, overhead rispetto alle latenze simulate e memoria
+Python allocata per sessione (tracemalloc).
+
+Esempio:
+    python benchmark_offline.py --sessioni 1 4 16 --analisi 3 --dimensione-mb 20
+"""
+import argparse
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+
+def percentile(valori, p):
+    """Percentile con il metodo nearest-rank."""
+    ordinati = sorted(valori)
+    return ordinati[max(0, math.ceil(p / 100 * len(ordinati)) - 1)] if ordinati else 0.0
+
+
+class VideoSintetico(io.BytesIO):
+    """Contenuto casuale con un nome, come un UploadedFile."""
+
+    def __init__(self, dimensione, nome):
+        super().__init__(os.urandom(dimensione))
+        self.name = nome
+
+
+def esegui_scenario(analisi, governatore, sessioni, analisi_per_sessione, dimensione, opzioni):
+    latenze, primi_risultati, errori = [], [], []
+    lock = threading.Lock()
+
+    def _sessione(indice):
+        with governatore.sessione(f"benchmark-{indice}"):
+            for n in range(analisi_per_sessione):
+                video = VideoSintetico(dimensione, f"sessione{indice}_{n}.mp4")
+                inizio = time.perf_counter()
+                try:
+                    esito = analisi.analizza_checker(video, usa_cache=False, on_evento=lambda evento: None,
+                                                     **opzioni)
+                except Exception as e:
+                    with lock:
+                        errori.append(repr(e))
+                    continue
+                with lock:
+                    latenze.append(time.perf_counter() - inizio)
+                    if "primo_insight_s" in esito["tempi"]:
+                        primi_risultati.append(esito["tempi"]["primo_insight_s"])
+
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    inizio = time.perf_counter()
+    thread = [threading.Thread(target=_sessione, args=(i,)) for i in range(sessioni)]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+    durata = time.perf_counter() - inizio
+    _, picco = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "sessioni": sessioni,
+        "analisi": len(latenze),
+        "errori": len(errori),
+        "p50_s": round(percentile(latenze, 50), 3),
+        "p95_s": round(percentile(latenze, 95), 3),
+        "primo_risultato_p50_s": round(percentile(primi_risultati, 50), 3),
+        "throughput_analisi_min": round(len(latenze) / durata * 60, 1) if durata else 0.0,
+        "memoria_per_sessione_mb": round((picco - base) / sessioni / (1024 * 1024), 2),
+        "esempio_errore": errori[0] if errori else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ad-Visor: benchmark offline con il backend locale.")
+    parser.add_argument("--sessioni", type=int, nargs="+", default=[1, 4, 8], help="Sessioni concorrenti da provare")
+    parser.add_argument("--analisi", type=int, default=3, help="Analisi per sessione (default 3)")
+    parser.add_argument("--dimensione-mb", type=float, default=5, help="Dimensione dei video sintetici (default 5 MB)")
+    parser.add_argument("--sezioni", action="store_true", help="Abilita anche le tre sezioni opzionali")
+    parser.add_argument("--upload-s", type=float, default=0.2, help="Latenza simulata dell'upload")
+    parser.add_argument("--processing-s", type=float, default=1.0, help="Durata simulata del processamento")
+    parser.add_argument("--primo-token-s", type=float, default=0.5, help="Latenza simulata del primo chunk")
+    parser.add_argument("--generazione-s", type=float, default=2.0, help="Durata simulata della generazione")
+    parser.add_argument("--json", help="Salva i risultati anche in questo file JSON")
+    args = parser.parse_args(argv)
+
+    # Configurazione prima di importare l'applicazione: backend locale e cartelle usa e getta.
+    cartella = tempfile.mkdtemp(prefix="advisor_benchmark_")
+    os.environ.update({
+        "ADVISOR_BACKEND": "fake",
+        "ADVISOR_CACHE_DIR": cartella,
+        "ADVISOR_DB_PATH": os.path.join(cartella, "analisi.sqlite3"),
+        "ADVISOR_FAKE_UPLOAD_S": str(args.upload_s),
+        "ADVISOR_FAKE_PROCESSING_S": str(args.processing_s),
+        "ADVISOR_FAKE_FIRST_TOKEN_S": str(args.primo_token_s),
+        "ADVISOR_FAKE_GENERATION_S": str(args.generazione_s),
+    })
+    import analisi
+    import governatore
+
+    opzioni = {"analisi_persuasiva": args.sezioni, "ricerca_notizie": args.sezioni, "analisi_performance": args.sezioni}
+    simulato = args.upload_s + args.processing_s + args.generazione_s
+    dimensione = int(args.dimensione_mb * 1024 * 1024)
+
+    risultati = []
+    print(f"Latenza simulata per analisi: {simulato:.2f}s (upload {args.upload_s}s, processamento "
+          f"{args.processing_s}s, generazione {args.generazione_s}s)")
+    print(f"{'sessioni':>8} {'analisi':>7} {'p50 s':>7} {'p95 s':>7} {'overhead p50 s':>14} "
+          f"{'primo ris. s':>12} {'analisi/min':>11} {'MB/sessione':>11}")
+    for sessioni in args.sessioni:
+        r = esegui_scenario(analisi, governatore, sessioni, args.analisi, dimensione, opzioni)
+        r["overhead_p50_s"] = round(r["p50_s"] - simulato, 3)
+        risultati.append(r)
+        print(f"{r['sessioni']:>8} {r['analisi']:>7} {r['p50_s']:>7.2f} {r['p95_s']:>7.2f} {r['overhead_p50_s']:>14.2f} "
+              f"{r['primo_risultato_p50_s']:>12.2f} {r['throughput_analisi_min']:>11.1f} {r['memoria_per_sessione_mb']:>11.2f}")
+        if r["errori"]:
+            print(f"         {r['errori']} analisi fallite, ad esempio: {r['esempio_errore']}", file=sys.stderr)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametri": vars(args), "risultati": risultati}, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(cartella, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+# colonnare.py
+"""
+Copia colonnare (Parquet) dell'archivio delle analisi, per le statistiche del
+Report Hub su migliaia di report.
+
+Le analisi salvate in SQLite vengono appiattite in quattro tabelle:
+- analisi: una riga per analisi (data, strumento, mercato, verdetto);
+- checklist: una riga per voce della checklist (categoria, status);
+- aida: una riga per analisi e fase del modello AIDA (fase presente o no);
+- caratteristiche: una riga per voce della tabella comparativa dei benchmark.
+
+L'esportazione è incrementale: ogni aggiornamento legge solo le analisi con id
+successivo all'ultimo esportato e le aggiunge come nuova parte Parquet di ogni
+tabella; oltre MAX_PARTI parti una tabella viene compattata in un solo file.
+Le tabelle caricate restano in memoria finché l'archivio non cambia, quindi le
+run del Report Hub non rileggono né il JSON né i file. Le statistiche sono
+calcolate qui con operazioni vettoriali di pandas.
+"""
+import json
+import os
+import re
+import threading
+import pandas as pd
+import store
+
+FASI_AIDA = ("attenzione", "interesse", "desiderio", "azione")
+MAX_PARTI = 20
+COLONNE = {
+    "analisi": {"id": "int64", "creato": "datetime64[ns]", "tipo": "string", "mercato": "string", "verdetto": "string"},
+    "checklist": {"analisi_id": "int64", "categoria": "string", "status": "string"},
+    "aida": {"analisi_id": "int64", "fase": "string", "presente": "bool"},
+    "caratteristiche": {"analisi_id": "int64", "caratteristica": "string", "tuo_video": "bool", "competitor": "bool"},
+}
+# La tabella delle analisi è scritta per ultima: la sua parte conferma l'esportazione di un blocco.
+ORDINE_SCRITTURA = ("checklist", "aida", "caratteristiche", "analisi")
+_NOME_PARTE = re.compile(r"^parte-(\d+)-(\d+)\.parquet$")
+
+
+def _tabella(nome, righe):
+    colonne = COLONNE[nome]
+    return pd.DataFrame(righe, columns=list(colonne)).astype(colonne)
+
+
+def appiattisci(righe):
+    """Righe delle quattro tabelle per le analisi indicate (dizionari con id, creato, tipo, mercato, verdetto, risultato)."""
+    tabelle = {nome: [] for nome in COLONNE}
+    for riga in righe:
+        tabelle["analisi"].append((riga["id"], riga["creato"], riga["tipo"], riga["mercato"], riga["verdetto"]))
+        try:
+            data = json.loads(riga["risultato"])
+        except ValueError:
+            continue
+        if not isinstance(data, dict):
+            continue
+        for item in data.get("checklist_analisi") or []:
+            if isinstance(item, dict):
+                tabelle["checklist"].append((riga["id"], item.get("categoria"), item.get("status")))
+        aida = (data.get("analisi_persuasiva") or {}).get("modello_aida") or {}
+        for fase in FASI_AIDA:
+            if isinstance(aida.get(fase), dict):
+                tabelle["aida"].append((riga["id"], fase, bool(aida[fase].get("presente"))))
+        for voce in data.get("tabella_comparativa") or []:
+            if isinstance(voce, dict) and voce.get("caratteristica"):
+                tabelle["caratteristiche"].append(
+                    (riga["id"], voce["caratteristica"], bool(voce.get("tuo_video")), bool(voce.get("competitor"))))
+    return {nome: _tabella(nome, valori) for nome, valori in tabelle.items()}
+
+
+class EsportatoreColonnare:
+    def __init__(self, cartella, archivio=None, blocco=5000):
+        self.cartella = cartella
+        self._archivio = archivio
+        self.blocco = blocco
+        self._lock = threading.Lock()
+        self._cache = None
+
+    @property
+    def archivio(self):
+        return self._archivio or store.get_default_store()
+
+    def _file_parti(self, nome):
+        """Tutti i file delle parti di una tabella come (primo_id, ultimo_id, path), in ordine."""
+        cartella = os.path.join(self.cartella, nome)
+        if not os.path.isdir(cartella):
+            return []
+        parti = []
+        for file in os.listdir(cartella):
+            corrisponde = _NOME_PARTE.match(file)
+            if corrisponde:
+                parti.append((int(corrisponde[1]), int(corrisponde[2]), os.path.join(cartella, file)))
+        return sorted(parti)
+
+    def _parti(self, nome):
+        """
+        Parti valide di una tabella, in ordine. Una compattazione interrotta lascia
+        le parti originali accanto al file compattato che le contiene: sono escluse.
+        """
+        tutte = self._file_parti(nome)
+        return [(primo, ultimo, path) for primo, ultimo, path in tutte
+                if not any(a <= primo and ultimo <= b and (a, b) != (primo, ultimo) for a, b, _ in tutte)]
+
+    def ultimo_esportato(self):
+        parti = self._parti("analisi")
+        return parti[-1][1] if parti else 0
+
+    def _scrivi(self, nome, df, primo, ultimo):
+        cartella = os.path.join(self.cartella, nome)
+        os.makedirs(cartella, exist_ok=True)
+        path = os.path.join(cartella, f"parte-{primo:010d}-{ultimo:010d}.parquet")
+        tmp_path = path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _compatta(self, nome):
+        parti = self._parti(nome)
+        if len(parti) > MAX_PARTI:
+            unita = pd.concat([pd.read_parquet(path) for _, _, path in parti], ignore_index=True)
+            self._scrivi(nome, unita, parti[0][0], parti[-1][1])
+        # Il file compattato ha un intervallo diverso da quello di ogni parte, che ora contiene:
+        # si eliminano le parti sostituite, anche quelle rimaste da una compattazione interrotta.
+        valide = {path for _, _, path in self._parti(nome)}
+        for _, _, path in self._file_parti(nome):
+            if path not in valide:
+                os.remove(path)
+
+    def aggiorna(self):
+        """Esporta le analisi salvate dopo l'ultima esportazione. Restituisce quante ne sono state aggiunte."""
+        aggiunte = 0
+        with self._lock:
+            ultimo = self.ultimo_esportato()
+            while True:
+                righe = self.archivio.analisi_dopo(ultimo, self.blocco)
+                if not righe:
+                    break
+                primo, ultimo = righe[0]["id"], righe[-1]["id"]
+                tabelle = appiattisci(righe)
+                for nome in ORDINE_SCRITTURA:
+                    # Le parti vuote si scrivono solo per la tabella delle analisi, che registra il blocco.
+                    if len(tabelle[nome]) or nome == "analisi":
+                        self._scrivi(nome, tabelle[nome], primo, ultimo)
+                aggiunte += len(righe)
+            if aggiunte:
+                for nome in ORDINE_SCRITTURA:
+                    self._compatta(nome)
+        return aggiunte
+
+    def tabelle(self):
+        """
+        Le quattro tabelle come DataFrame, aggiornate con le analisi nuove.
+        Restano in memoria finché l'archivio non cambia.
+        """
+        if self.archivio.ultimo_id() != self.ultimo_esportato():
+            self.aggiorna()
+        with self._lock:
+            ultimo = self.ultimo_esportato()
+            if self._cache is None:
+                self._cache = (0, {nome: _tabella(nome, []) for nome in COLONNE})
+            caricato, tabelle = self._cache
+            if caricato == ultimo:
+                return tabelle
+            nuove = {}
+            for nome, df in tabelle.items():
+                # Si leggono solo le parti con analisi non ancora in memoria (una parte compattata le contiene tutte).
+                parti = [pd.read_parquet(path) for _, fine, path in self._parti(nome) if fine > caricato]
+                colonna_id = "id" if nome == "analisi" else "analisi_id"
+                aggiunte = [p[(p[colonna_id] > caricato) & (p[colonna_id] <= ultimo)] for p in parti]
+                nuove[nome] = pd.concat([df] + aggiunte, ignore_index=True).astype(COLONNE[nome]) if aggiunte else df
+            self._cache = (ultimo, nuove)
+            return nuove
+
+
+def filtra(tabelle, mercato=None, dal=None, al=None):
+    """Restringe le tabelle alle analisi del mercato e del periodo indicati (`al` escluso)."""
+    analisi = tabelle["analisi"]
+    maschera = pd.Series(True, index=analisi.index)
+    if mercato:
+        maschera &= analisi["mercato"] == mercato
+    if dal:
+        maschera &= analisi["creato"] >= pd.Timestamp(dal)
+    if al:
+        maschera &= analisi["creato"] < pd.Timestamp(al)
+    analisi = analisi[maschera]
+    return {"analisi": analisi, **{
+        nome: df[df["analisi_id"].isin(analisi["id"])] for nome, df in tabelle.items() if nome != "analisi"
+    }}
+
+
+def distribuzione_verdetti(analisi):
+    """Numero di analisi del checker per mercato (righe) e verdetto (colonne)."""
+    checker = analisi[analisi["tipo"] == "checker"]
+    return pd.crosstab(checker["mercato"].fillna("Nessun mercato"), checker["verdetto"].fillna("N/D"))
+
+
+def categorie_critiche(checklist, analisi, limite=10):
+    """Categorie con più voci CRITICO, con la quota di analisi del checker in cui compaiono."""
+    critiche = checklist[checklist["status"] == "CRITICO"]
+    totale = max(int((analisi["tipo"] == "checker").sum()), 1)
+    risultato = critiche.groupby(critiche["categoria"].fillna("Senza categoria")).agg(
+        voci=("analisi_id", "size"), analisi=("analisi_id", "nunique"))
+    risultato["quota_analisi_%"] = (risultato["analisi"] / totale * 100).round(1)
+    return risultato.sort_values("voci", ascending=False).head(limite)
+
+
+def copertura_aida(aida):
+    """Percentuale delle analisi persuasive in cui ogni fase AIDA è presente."""
+    return (aida.groupby("fase")["presente"].mean() * 100).round(1).reindex(list(FASI_AIDA)).dropna()
+
+
+def vantaggi_caratteristiche(caratteristiche):
+    """
+    Per ogni caratteristica della tabella comparativa, quota dei benchmark in cui
+    il tuo video la ha e il competitor no (vantaggio), il contrario (svantaggio)
+    o sono pari.
+    """
+    tuo, comp = caratteristiche["tuo_video"], caratteristiche["competitor"]
+    esiti = pd.DataFrame({
+        "caratteristica": caratteristiche["caratteristica"],
+        "vantaggio_%": tuo & ~comp,
+        "svantaggio_%": ~tuo & comp,
+        "parita_%": tuo == comp,
+    })
+    risultato = (esiti.groupby("caratteristica").mean() * 100).round(1)
+    risultato.insert(0, "benchmark", esiti.groupby("caratteristica").size())
+    return risultato.sort_values("vantaggio_%", ascending=False)
+
+
+_default_esportatore = None
+_default_lock = threading.Lock()
+
+
+def get_default_esportatore():
+    """Esportatore condiviso dal processo (ADVISOR_COLUMNAR_DIR, default .advisor_cache/colonnare)."""
+    global _default_esportatore
+    with _default_lock:
+        if _default_esportatore is None:
+            _default_esportatore = EsportatoreColonnare(os.getenv(
+                "ADVISOR_COLUMNAR_DIR", os.path.join(os.getenv("ADVISOR_CACHE_DIR", ".advisor_cache"), "colonnare")))
+        return _default_esportatore
@@ -0,0 +1,95 @@
+# confronto.py
+"""
+Confronto locale del benchmark a N video. Il modello estrae una sola volta per
+video le caratteristiche della tabella comparativa, il verdetto e gli spunti
+SWOT; tabella, classifica e SWOT vengono poi calcolati qui con pandas.
+"""
+import numpy as np
+import pandas as pd
+import prompts
+
+PUNTEGGIO_VERDETTO = {"CONSIGLIATO": 2, "CONSIGLIATO_CON_RISERVA": 1, "NON_CONSIGLIATO": 0}
+
+
+def tabella_caratteristiche(estrazioni):
+    """DataFrame booleano con una riga per video e una colonna per caratteristica."""
+    righe = {
+        nome: [bool((dati.get("caratteristiche") or {}).get(c, False)) for c in prompts.CARATTERISTICHE_BENCHMARK]
+        for nome, dati in estrazioni.items()
+    }
+    return pd.DataFrame.from_dict(righe, orient="index", columns=prompts.CARATTERISTICHE_BENCHMARK, dtype=bool)
+
+
+def classifica(estrazioni, tabella=None):
+    """
+    Classifica dei video: prima il verdetto, poi il numero di caratteristiche
+    presenti. La posizione è condivisa in caso di parità.
+    """
+    tabella = tabella_caratteristiche(estrazioni) if tabella is None else tabella
+    verdetti = pd.Series({nome: dati.get("verdetto_complessivo", "N/D") for nome, dati in estrazioni.items()})
+    punteggio_verdetto = verdetti.map(PUNTEGGIO_VERDETTO).fillna(0).astype(int)
+    presenti = tabella.sum(axis=1).astype(int)
+    # Il verdetto pesa più di tutte le caratteristiche insieme.
+    punteggio = punteggio_verdetto * (len(tabella.columns) + 1) + presenti
+    risultato = pd.DataFrame({
+        "Verdetto": verdetti,
+        "Caratteristiche presenti": presenti,
+        "Copertura %": (presenti / max(len(tabella.columns), 1) * 100).round(0).astype(int),
+        "Punteggio": punteggio,
+    })
+    risultato.insert(0, "Posizione", punteggio.rank(ascending=False, method="min").astype(int))
+    return risultato.sort_values(["Posizione", "Caratteristiche presenti"], ascending=[True, False])
+
+
+def swot_locale(estrazioni, nostro, tabella=None):
+    """
+    SWOT del video `nostro` rispetto a tutti gli altri:
+    - punti di forza: caratteristiche presenti che la maggioranza dei competitor non ha,
+      più i punti di forza indicati dal modello;
+    - debolezze: caratteristiche assenti che la maggioranza dei competitor ha,
+      più i punti deboli indicati dal modello;
+    - opportunità: caratteristiche che nessun video ha;
+    - minacce: competitor con punteggio superiore e i loro punti di forza.
+    """
+    tabella = tabella_caratteristiche(estrazioni) if tabella is None else tabella
+    competitor = tabella.drop(index=nostro)
+    nostre = tabella.loc[nostro].to_numpy()
+    quota = competitor.mean(axis=0).to_numpy() if len(competitor) else np.zeros(len(tabella.columns))
+    colonne = np.array(tabella.columns)
+
+    vantaggi = colonne[nostre & (quota < 0.5)]
+    lacune = colonne[~nostre & (quota >= 0.5)]
+    opportunita = colonne[~tabella.to_numpy().any(axis=0)]
+
+    punteggi = classifica(estrazioni, tabella)["Punteggio"]
+    superiori = punteggi[punteggi > punteggi[nostro]].sort_values(ascending=False).index
+
+    dati_nostri = estrazioni[nostro]
+    return {
+        "punti_di_forza": [f"{c} (assente nel {round((1 - q) * 100)}% dei competitor)"
+                           for c, q in zip(vantaggi, quota[nostre & (quota < 0.5)])]
+                          + list(dati_nostri.get("punti_di_forza") or []),
+        "debolezze": [f"{c} (presente nel {round(q * 100)}% dei competitor)"
+                      for c, q in zip(lacune, quota[~nostre & (quota >= 0.5)])]
+                     + list(dati_nostri.get("punti_deboli") or []),
+        "opportunita": [f"{c}: nessun video del confronto la sfrutta" for c in opportunita],
+        "minacce": [
+            f"{nome}: " + ("; ".join((estrazioni[nome].get("punti_di_forza") or [])[:2]) or "punteggio superiore")
+            for nome in superiori
+        ],
+    }
+
+
+def differenze_chiave(tabella, nostro):
+    """Caratteristiche su cui il video `nostro` si discosta dalla maggioranza dei competitor."""
+    competitor = tabella.drop(index=nostro)
+    if competitor.empty:
+        return pd.DataFrame(columns=["Caratteristica", "Tuo video", "Quota competitor %"])
+    quota = competitor.mean(axis=0)
+    nostre = tabella.loc[nostro]
+    diverse = nostre != (quota >= 0.5)
+    return pd.DataFrame({
+        "Caratteristica": tabella.columns[diverse],
+        "Tuo video": nostre[diverse].to_numpy(),
+        "Quota competitor %": (quota[diverse] * 100).round(0).astype(int).to_numpy(),
+    })
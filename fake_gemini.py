@@ -0,0 +1,285 @@
+# fake_gemini.py
+"""
+Sostituto locale dell'API di Gemini, utile per sviluppo e verifiche offline
+senza consumare quota. Espone la stessa interfaccia del modulo
+google.generativeai per le funzioni usate da Ad-Visor (vedi backend).
+
+Le latenze di upload, processamento e generazione sono configurabili; le
+risposte sono JSON di esempio costruiti dallo `response_schema` della
+richiesta, quindi validi per gli schemi dell'applicazione.
+"""
+import datetime
+import itertools
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+
+class NotFound(Exception):
+    """Equivalente locale di google.api_core.exceptions.NotFound."""
+
+
+class InvalidArgument(Exception):
+    """Equivalente locale di google.api_core.exceptions.InvalidArgument (HTTP 400)."""
+    code = 400
+
+
+class FakeFile:
+    def __init__(self, name, display_name, size_bytes, durata_processing, scadenza_secondi):
+        ora = time.time()
+        self.name = name
+        self.display_name = display_name
+        self.size_bytes = size_bytes
+        self.uri = f"fake://{name}"
+        self.create_time = datetime.datetime.fromtimestamp(ora, tz=datetime.timezone.utc)
+        self.expiration_time = datetime.datetime.fromtimestamp(ora + scadenza_secondi, tz=datetime.timezone.utc)
+        self._pronto_alle = ora + durata_processing
+        self._fallito = False
+
+    @property
+    def state(self):
+        if self._fallito:
+            return SimpleNamespace(name="FAILED")
+        if time.time() < self._pronto_alle:
+            return SimpleNamespace(name="PROCESSING")
+        return SimpleNamespace(name="ACTIVE")
+
+
+class FakeFileAPI:
+    """
+    File API in memoria: upload_file, get_file, delete_file e list_files con
+    stato PROCESSING/ACTIVE/FAILED e scadenza, come il servizio reale.
+    """
+
+    def __init__(self, durata_processing=0.0, scadenza_secondi=48 * 3600, latenza_upload=0.0, velocita_upload_mb_s=0.0):
+        self.durata_processing = durata_processing
+        self.scadenza_secondi = scadenza_secondi
+        self.latenza_upload = latenza_upload
+        self.velocita_upload_mb_s = velocita_upload_mb_s
+        self._files = {}
+        self._contatore = itertools.count(1)
+        self._lock = threading.Lock()
+        self.chiamate = {"upload_file": 0, "get_file": 0, "delete_file": 0, "list_files": 0}
+
+    def upload_file(self, path, *, mime_type=None, display_name=None, resumable=True):
+        if hasattr(path, "read"):
+            size = sum(len(b) for b in iter(lambda: path.read(1024 * 1024), b""))
+        else:
+            with open(path, "rb") as f:
+                size = sum(len(b) for b in iter(lambda: f.read(1024 * 1024), b""))
+        durata = self.latenza_upload
+        if self.velocita_upload_mb_s:
+            durata += size / (self.velocita_upload_mb_s * 1024 * 1024)
+        time.sleep(durata)
+        with self._lock:
+            self.chiamate["upload_file"] += 1
+            name = f"files/fake-{next(self._contatore)}"
+            file_remoto = FakeFile(name, display_name or name, size, self.durata_processing, self.scadenza_secondi)
+            self._files[name] = file_remoto
+            return file_remoto
+
+    def get_file(self, name):
+        with self._lock:
+            self.chiamate["get_file"] += 1
+            file_remoto = self._files.get(name)
+        if file_remoto is None or file_remoto.expiration_time.timestamp() <= time.time():
+            raise NotFound(name)
+        return file_remoto
+
+    def delete_file(self, name):
+        with self._lock:
+            self.chiamate["delete_file"] += 1
+            if self._files.pop(name, None) is None:
+                raise NotFound(name)
+
+    def list_files(self):
+        with self._lock:
+            self.chiamate["list_files"] += 1
+            ora = time.time()
+            return [f for f in self._files.values() if f.expiration_time.timestamp() > ora]
+
+    def fail(self, name):
+        """Forza lo stato FAILED su un file (per simulare un errore di elaborazione)."""
+        with self._lock:
+            self._files[name]._fallito = True
+
+
+def esempio_da_schema(schema, elementi_lista=2):
+    """Valore di esempio conforme a uno schema OpenAPI (type, enum, properties, items)."""
+    tipo = schema.get("type")
+    if "enum" in schema:
+        return schema["enum"][0]
+    if tipo == "OBJECT":
+        return {chiave: esempio_da_schema(sotto, elementi_lista) for chiave, sotto in schema.get("properties", {}).items()}
+    if tipo == "ARRAY":
+        return [esempio_da_schema(schema["items"], elementi_lista) for _ in range(elementi_lista)]
+    if tipo == "BOOLEAN":
+        return True
+    if tipo in ("NUMBER", "INTEGER"):
+        return 0
+    return "Risposta di esempio del backend locale."
+
+
+def conta_token(contenuti):
+    """Token approssimati di una richiesta: ~4 caratteri per token di testo, 20000 per un file video."""
+    if isinstance(contenuti, str):
+        return len(contenuti) // 4
+    if isinstance(contenuti, dict):
+        return conta_token(contenuti.get("parts", []))
+    if isinstance(contenuti, (list, tuple)):
+        return sum(conta_token(parte) for parte in contenuti)
+    return 20000
+
+
+class FakeResponse:
+    """Risposta di generate_content: `text`, `usage_metadata` e, in streaming, iterabile a chunk."""
+
+    def __init__(self, testo, token_prompt, chunk=None, intervallo_chunk=0.0, token_in_cache=0):
+        self.text = testo
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=token_prompt + token_in_cache,
+            cached_content_token_count=token_in_cache,
+            candidates_token_count=len(testo) // 4,
+            total_token_count=token_prompt + token_in_cache + len(testo) // 4,
+        )
+        self._chunk = chunk
+        self._intervallo_chunk = intervallo_chunk
+
+    def __iter__(self):
+        for i, frammento in enumerate(self._chunk or [self.text]):
+            if i:
+                time.sleep(self._intervallo_chunk)
+            yield SimpleNamespace(text=frammento)
+
+
+class FakeGenerativeModel:
+    def __init__(self, backend, model_name=None, generation_config=None, system_instruction=None,
+                 cached_content=None, **kwargs):
+        self._backend = backend
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.system_instruction = system_instruction
+        self.cached_content = cached_content
+
+    def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+        backend = self._backend
+        with backend._lock:
+            backend.chiamate["generate_content"] += 1
+        schema = getattr(self.generation_config, "response_schema", None)
+        if backend.risposta_fissa is not None:
+            testo = backend.risposta_fissa
+        elif schema:
+            testo = json.dumps(esempio_da_schema(schema), ensure_ascii=False)
+        else:
+            testo = "Risposta di esempio del backend locale."
+        token_prompt = conta_token(contents) + conta_token(self.system_instruction or "")
+        token_in_cache = self.cached_content.usage_metadata.total_token_count if self.cached_content else 0
+        time.sleep(backend.primo_token_s)
+        if not stream:
+            time.sleep(max(0.0, backend.latenza_generazione - backend.primo_token_s))
+            return FakeResponse(testo, token_prompt, token_in_cache=token_in_cache)
+        chunk = [testo[i:i + backend.dimensione_chunk] for i in range(0, len(testo), backend.dimensione_chunk)] or [""]
+        intervallo = max(0.0, backend.latenza_generazione - backend.primo_token_s) / max(1, len(chunk) - 1)
+        return FakeResponse(testo, token_prompt, chunk, intervallo, token_in_cache)
+
+
+class FakeCachedContent:
+    def __init__(self, api, name, model, system_instruction, contents, ttl, display_name):
+        self._api = api
+        self.name = name
+        self.model = model
+        self.display_name = display_name
+        self.system_instruction = system_instruction
+        self.usage_metadata = SimpleNamespace(total_token_count=conta_token(contents) + conta_token(system_instruction or ""))
+        self.expire_time = datetime.datetime.now(datetime.timezone.utc) + ttl
+
+    def update(self, ttl=None, expire_time=None):
+        self.expire_time = expire_time or datetime.datetime.now(datetime.timezone.utc) + ttl
+
+    def delete(self):
+        with self._api._lock:
+            self._api._contesti.pop(self.name, None)
+
+
+class FakeCachingAPI:
+    """Equivalente di google.generativeai.caching: CachedContent.create / get / list."""
+
+    def __init__(self, backend, token_minimi=1024):
+        self._backend = backend
+        self.token_minimi = token_minimi
+        self._contesti = {}
+        self._lock = threading.Lock()
+        self._contatore = itertools.count(1)
+        self.CachedContent = self
+
+    def create(self, model=None, *, system_instruction=None, contents=None, ttl=None, display_name=None, **kwargs):
+        contesto = FakeCachedContent(self, f"cachedContents/fake-{next(self._contatore)}", model,
+                                     system_instruction, contents or [], ttl or datetime.timedelta(hours=1), display_name)
+        if contesto.usage_metadata.total_token_count < self.token_minimi:
+            raise InvalidArgument(f"Contesto troppo piccolo per la cache ({contesto.usage_metadata.total_token_count} token)")
+        with self._lock:
+            self._contesti[contesto.name] = contesto
+        return contesto
+
+    def get(self, name):
+        with self._lock:
+            contesto = self._contesti.get(name)
+        if contesto is None or contesto.expire_time <= datetime.datetime.now(datetime.timezone.utc):
+            raise NotFound(name)
+        return contesto
+
+    def list(self):
+        with self._lock:
+            return list(self._contesti.values())
+
+
+class FabbricaModelli:
+    """Sostituto della classe GenerativeModel: costruttore e from_cached_content."""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __call__(self, model_name=None, generation_config=None, **kwargs):
+        return FakeGenerativeModel(self._backend, model_name, generation_config, **kwargs)
+
+    def from_cached_content(self, cached_content, generation_config=None, **kwargs):
+        return FakeGenerativeModel(self._backend, cached_content.model, generation_config,
+                                   cached_content=cached_content, **kwargs)
+
+
+class FakeGemini(FakeFileAPI):
+    """
+    Backend locale completo: File API in memoria più GenerativeModel con
+    latenze configurabili. Con `risposta_fissa` tutte le richieste restituiscono
+    quel testo invece dell'esempio costruito dallo schema.
+    """
+
+    GenerationConfig = SimpleNamespace
+
+    def __init__(self, latenza_upload=0.0, velocita_upload_mb_s=0.0, durata_processing=0.0,
+                 primo_token_s=0.0, latenza_generazione=0.0, dimensione_chunk=64, risposta_fissa=None, **kwargs):
+        super().__init__(durata_processing=durata_processing, latenza_upload=latenza_upload,
+                         velocita_upload_mb_s=velocita_upload_mb_s, **kwargs)
+        self.primo_token_s = primo_token_s
+        self.latenza_generazione = latenza_generazione
+        self.dimensione_chunk = dimensione_chunk
+        self.risposta_fissa = risposta_fissa
+        self.chiamate["generate_content"] = 0
+        self.GenerativeModel = FabbricaModelli(self)
+        self.caching = FakeCachingAPI(self)
+
+    @classmethod
+    def da_ambiente(cls):
+        """Backend configurato con le variabili ADVISOR_FAKE_* (secondi; banda in MB/s)."""
+        return cls(
+            latenza_upload=float(os.getenv("ADVISOR_FAKE_UPLOAD_S", "0.2")),
+            velocita_upload_mb_s=float(os.getenv("ADVISOR_FAKE_UPLOAD_MBPS", "0")),
+            durata_processing=float(os.getenv("ADVISOR_FAKE_PROCESSING_S", "1.0")),
+            primo_token_s=float(os.getenv("ADVISOR_FAKE_FIRST_TOKEN_S", "0.5")),
+            latenza_generazione=float(os.getenv("ADVISOR_FAKE_GENERATION_S", "2.0")),
+        )
+
+    def configure(self, **kwargs):
+        pass
@@ -0,0 +1,243 @@
+# file_registry.py
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: il registro è condiviso solo tra i thread del processo.
+    fcntl = None
+
+# I file caricati sull'API di Gemini scadono dopo 48 ore.
+SCADENZA_DEFAULT = 48 * 3600
+# Prefisso dei display name dei file caricati da Ad-Visor (usato per riconoscere gli orfani).
+PREFISSO_REMOTO = "advisor:"
+# Display name usati dalle versioni precedenti, che eliminavano il file a fine analisi.
+NOMI_LEGACY = {"video_checker_file", "Il Tuo Video", "Video Competitor"}
+# Numero di lock a strisce con cui vengono serializzati gli upload dello stesso contenuto.
+STRISCE_LOCK = 64
+
+
+def _timestamp(valore, default):
+    """Converte un datetime (o None) restituito dall'API in timestamp UNIX."""
+    if valore is None:
+        return default
+    try:
+        return valore.timestamp()
+    except (AttributeError, OSError, OverflowError, ValueError):
+        return default
+
+
+class FileRegistry:
+    """
+    Registro persistente dei file remoti indicizzato per hash del contenuto.
+    Un file ACTIVE viene riusato fino alla sua scadenza remota (meno un margine),
+    previa verifica con get_file; gli upload scaduti o orfani vengono eliminati
+    in modo pigro durante le normali richieste.
+
+    Il file JSON è condiviso con gli altri processi sulla stessa cartella di
+    cache (CLI batch, servizio HTTP): ogni modifica lo rilegge e lo riscrive
+    sotto un lock tra processi, e la raccolta degli orfani considera anche i
+    file registrati dagli altri.
+    """
+
+    def __init__(self, path, file_api, margine_secondi=600, intervallo_gc=900, grazia_orfani=3600):
+        self.path = path
+        self.file_api = file_api
+        self.margine_secondi = margine_secondi
+        self.intervallo_gc = intervallo_gc
+        self.grazia_orfani = grazia_orfani
+        self._lock = threading.Lock()
+        self._hash_locks = [threading.Lock() for _ in range(STRISCE_LOCK)]
+        self._ultimo_gc = 0.0
+        self._riusi = 0
+        self._upload = 0
+        self._firma = None
+        self._voci = {}
+        self._rileggi_locked()
+
+    # --- Persistenza ---
+
+    def _firma_file(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                voci = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return voci if isinstance(voci, dict) else {}
+
+    @contextlib.contextmanager
+    def _bloccato(self):
+        """
+        Lock del registro tra thread e processi. All'ingresso le voci vengono
+        rilette dal disco se un altro processo ha modificato il file.
+        """
+        with self._lock:
+            if fcntl is None:
+                self._rileggi_locked()
+                yield
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._rileggi_locked()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _rileggi_locked(self):
+        firma = self._firma_file()
+        if firma != self._firma:
+            self._voci = self._load()
+            self._firma = firma
+
+    def _save_locked(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._voci, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self._firma = self._firma_file()
+
+    # --- API pubblica ---
+
+    def acquire(self, content_hash, upload):
+        """
+        Restituisce il file remoto associato all'hash. Se non esiste una copia
+        valida, chiama upload() (che deve restituire il file appena caricato)
+        e registra il risultato. Upload concorrenti dello stesso contenuto
+        vengono serializzati, così il file viene caricato una sola volta.
+        """
+        self.collect_garbage()
+        with self._hash_locks[hash(content_hash) % len(self._hash_locks)]:
+            file_remoto = self.lookup(content_hash)
+            if file_remoto is not None:
+                return file_remoto
+            file_remoto = upload()
+            self.register(content_hash, file_remoto)
+            with self._lock:
+                self._upload += 1
+            return file_remoto
+
+    def lookup(self, content_hash):
+        """Restituisce il file remoto registrato se ancora valido, altrimenti None."""
+        with self._lock:
+            # Il file viene sostituito in modo atomico: la sola lettura non richiede il lock tra processi.
+            self._rileggi_locked()
+            voce = self._voci.get(content_hash)
+        if voce is None:
+            return None
+        if voce["scadenza"] - self.margine_secondi <= time.time():
+            self.invalidate(content_hash)
+            return None
+        try:
+            file_remoto = self.file_api.get_file(voce["name"])
+        except Exception:
+            # Il file non esiste più sul server (o non è accessibile): si ricarica.
+            self.invalidate(content_hash, elimina_remoto=False)
+            return None
+        if file_remoto.state.name not in ("ACTIVE", "PROCESSING"):
+            self.invalidate(content_hash)
+            return None
+        with self._lock:
+            self._riusi += 1
+        return file_remoto
+
+    def register(self, content_hash, file_remoto):
+        with self._bloccato():
+            self._voci[content_hash] = {
+                "name": file_remoto.name,
+                "display_name": getattr(file_remoto, "display_name", ""),
+                "caricato": time.time(),
+                "scadenza": _timestamp(getattr(file_remoto, "expiration_time", None), time.time() + SCADENZA_DEFAULT),
+            }
+            self._save_locked()
+
+    def invalidate(self, content_hash, elimina_remoto=True):
+        """Rimuove la voce dal registro ed eventualmente elimina il file remoto."""
+        with self._bloccato():
+            voce = self._voci.pop(content_hash, None)
+            if voce is not None:
+                self._save_locked()
+        if voce is not None and elimina_remoto:
+            self._delete_quietly(voce["name"])
+
+    def collect_garbage(self, forza=False):
+        """
+        Elimina le voci scadute e i file remoti orfani: caricati da Ad-Visor
+        ma assenti dal registro (es. sessioni interrotte a metà upload) e più
+        vecchi del periodo di grazia. Eseguita al massimo ogni intervallo_gc secondi.
+        """
+        ora = time.time()
+        with self._lock:
+            if not forza and ora - self._ultimo_gc < self.intervallo_gc:
+                return 0
+            self._ultimo_gc = ora
+        with self._bloccato():
+            scadute = [h for h, v in self._voci.items() if v["scadenza"] <= ora]
+            for content_hash in scadute:
+                del self._voci[content_hash]
+            if scadute:
+                self._save_locked()
+
+        eliminati = len(scadute)
+        try:
+            remoti = list(self.file_api.list_files())
+        except Exception:
+            return eliminati
+        # Riletto dopo l'elenco remoto: include i file registrati nel frattempo da altri processi.
+        with self._bloccato():
+            registrati = {v["name"] for v in self._voci.values()}
+        for file_remoto in remoti:
+            if file_remoto.name in registrati:
+                continue
+            display_name = getattr(file_remoto, "display_name", "") or ""
+            if not (display_name.startswith(PREFISSO_REMOTO) or display_name in NOMI_LEGACY):
+                continue
+            creato = _timestamp(getattr(file_remoto, "create_time", None), ora)
+            if ora - creato < self.grazia_orfani:
+                continue
+            if self._delete_quietly(file_remoto.name):
+                eliminati += 1
+        return eliminati
+
+    def stats(self):
+        with self._lock:
+            self._rileggi_locked()
+            return {"file_attivi": len(self._voci), "riusi": self._riusi, "upload": self._upload}
+
+    def _delete_quietly(self, name):
+        try:
+            self.file_api.delete_file(name)
+            return True
+        except Exception:
+            return False
+
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+
+def get_default_registry():
+    """Restituisce il registro condiviso dal processo, appoggiato al backend configurato (vedi backend)."""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            import backend
+            # Il backend locale ha un registro separato: i suoi nomi remoti non esistono sull'API reale.
+            nome = "remote_files.json" if not backend.locale() else f"remote_files_{backend.nome_configurato()}.json"
+            _default_registry = FileRegistry(
+                path=os.path.join(os.getenv("ADVISOR_CACHE_DIR", ".advisor_cache"), nome),
+                file_api=backend.get_default_backend(),
+            )
+        return _default_registry
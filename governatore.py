@@ -0,0 +1,255 @@
+# governatore.py
+"""
+Coordinamento delle chiamate a Gemini di tutto il processo: ogni richiesta di
+generazione e ogni upload passa da un unico governatore, che rispetta i limiti
+di quota invece di scoprirli con gli errori 429.
+
+- Limiti a token bucket per richieste al minuto (ADVISOR_RPM), token al minuto
+  (ADVISOR_TPM) e banda di upload (ADVISOR_UPLOAD_MBPS, MB/s); 0 = nessun limite.
+  I token di una richiesta sono stimati in anticipo e rettificati con quelli
+  effettivi indicati nella risposta.
+- Coda equa tra sessioni: le richieste in attesa sono servite a turno, una per
+  sessione, così un'analisi con molte sezioni o molti mercati non monopolizza la
+  quota a scapito degli altri utenti.
+- Sugli errori di rate limit la richiesta viene ripetuta con backoff esponenziale
+  e jitter, e la coda viene messa in pausa per tutti.
+
+La sessione di una richiesta è quella del contesto corrente (vedi `sessione` e
+`propaga` per i thread secondari).
+"""
+import collections
+import contextlib
+import contextvars
+import os
+import random
+import threading
+import time
+import tracciamento
+
+SESSIONE_PREDEFINITA = "predefinita"
+GENERAZIONE = "generazione"
+UPLOAD = "upload"
+# Stima dei token di un video quando la durata non è nota (circa un minuto di video).
+TOKEN_VIDEO_DEFAULT = 20000
+# Token per secondo di video (fotogramma campionato a 1 fps più audio).
+TOKEN_PER_SECONDO = 300
+
+sessione_corrente = contextvars.ContextVar("sessione_corrente", default=SESSIONE_PREDEFINITA)
+
+
+@contextlib.contextmanager
+def sessione(id_sessione):
+    """Attribuisce alla sessione indicata le richieste fatte all'interno del contesto."""
+    token = sessione_corrente.set(id_sessione or SESSIONE_PREDEFINITA)
+    try:
+        yield
+    finally:
+        sessione_corrente.reset(token)
+
+
+def propaga(funzione):
+    """
+    Lega `funzione` al contesto corrente (sessione compresa), da usare quando la
+    si sottomette a un ThreadPoolExecutor: i thread del pool non lo ereditano.
+    """
+    contesto = contextvars.copy_context()
+    return lambda *args, **kwargs: contesto.run(funzione, *args, **kwargs)
+
+
+def e_rate_limit(errore):
+    """True per gli errori di quota: ResourceExhausted dell'SDK o HTTP 429."""
+    if type(errore).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    try:
+        return int(getattr(errore, "code", 0) or 0) == 429
+    except (TypeError, ValueError):
+        return False
+
+
+def _retry_after(errore):
+    headers = getattr(errore, "headers", None)
+    try:
+        return float(headers.get("Retry-After")) if headers is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Bucket che si ricarica di `ricarica` unità al secondo fino a `capacita`; il livello può andare in debito."""
+
+    def __init__(self, capacita, ricarica):
+        self.capacita = capacita
+        self.ricarica = ricarica
+        self.livello = capacita
+        self._ultimo = time.monotonic()
+
+    def _aggiorna(self, ora):
+        self.livello = min(self.capacita, self.livello + (ora - self._ultimo) * self.ricarica)
+        self._ultimo = ora
+
+    def attesa(self, quantita, ora):
+        """Secondi da attendere prima che `quantita` sia disponibile (le richieste oltre la capacità attendono il pieno)."""
+        self._aggiorna(ora)
+        necessari = min(quantita, self.capacita)
+        return 0.0 if self.livello >= necessari else (necessari - self.livello) / self.ricarica
+
+    def preleva(self, quantita):
+        self.livello -= quantita
+
+    def rettifica(self, differenza):
+        self.livello = min(self.capacita, self.livello - differenza)
+
+
+class Governatore:
+    def __init__(self, rpm=0, tpm=0, upload_bytes_s=0, tentativi=5, attesa_base=1.0, attesa_max=60.0,
+                 campioni_attesa=500):
+        self.tentativi = tentativi
+        self.attesa_base = attesa_base
+        self.attesa_max = attesa_max
+        self._bucket = {
+            "richieste": TokenBucket(rpm, rpm / 60) if rpm else None,
+            "token": TokenBucket(tpm, tpm / 60) if tpm else None,
+            "byte": TokenBucket(upload_bytes_s, upload_bytes_s) if upload_bytes_s else None,
+        }
+        self._cond = threading.Condition()
+        # Per risorsa: sessione -> code dei ticket in attesa, nell'ordine in cui le sessioni vengono servite.
+        self._code = {GENERAZIONE: collections.OrderedDict(), UPLOAD: collections.OrderedDict()}
+        self._pausa_fino = {GENERAZIONE: 0.0, UPLOAD: 0.0}
+        self._attese = {GENERAZIONE: collections.deque(maxlen=campioni_attesa),
+                        UPLOAD: collections.deque(maxlen=campioni_attesa)}
+        self._contatori = {"richieste": 0, "upload": 0, "rate_limit": 0, "ripetute": 0,
+                           "token_usati": 0, "byte_caricati": 0}
+
+    def _turno(self, risorsa):
+        """Il ticket servito per primo: il più vecchio della sessione che ha atteso il proprio turno più a lungo."""
+        code = self._code[risorsa]
+        return code[next(iter(code))][0] if code else None
+
+    def _acquisisci(self, risorsa, **quantita):
+        """Attende il proprio turno e la disponibilità nei bucket, poi preleva `quantita` (richieste, token, byte)."""
+        sessione_richiesta = sessione_corrente.get()
+        ticket = object()
+        inizio = time.monotonic()
+        with tracciamento.span("attesa_quota", risorsa=risorsa), self._cond:
+            code = self._code[risorsa]
+            code.setdefault(sessione_richiesta, collections.deque()).append(ticket)
+            try:
+                while True:
+                    attesa = None
+                    if self._turno(risorsa) is ticket:
+                        ora = time.monotonic()
+                        attesa = max([self._pausa_fino[risorsa] - ora] + [
+                            self._bucket[nome].attesa(valore, ora)
+                            for nome, valore in quantita.items() if valore and self._bucket[nome]
+                        ])
+                        if attesa <= 0:
+                            for nome, valore in quantita.items():
+                                if valore and self._bucket[nome]:
+                                    self._bucket[nome].preleva(valore)
+                            break
+                    self._cond.wait(attesa)
+            finally:
+                coda = code[sessione_richiesta]
+                coda.remove(ticket)
+                # La sessione appena servita passa in fondo al giro.
+                if coda:
+                    code.move_to_end(sessione_richiesta)
+                else:
+                    del code[sessione_richiesta]
+                self._cond.notify_all()
+            self._attese[risorsa].append(time.monotonic() - inizio)
+
+    def _dopo_rate_limit(self, risorsa, errore, tentativo):
+        """Backoff esponenziale con jitter completo; la pausa vale per tutta la coda della risorsa."""
+        ritardo = _retry_after(errore) or random.uniform(0, min(self.attesa_max, self.attesa_base * 2 ** tentativo))
+        with self._cond:
+            self._contatori["ripetute"] += 1
+            self._pausa_fino[risorsa] = max(self._pausa_fino[risorsa], time.monotonic() + ritardo)
+            self._cond.notify_all()
+
+    def _esegui(self, risorsa, funzione, **quantita):
+        for tentativo in range(self.tentativi + 1):
+            self._acquisisci(risorsa, **quantita)
+            try:
+                return funzione()
+            except Exception as e:
+                if not e_rate_limit(e):
+                    raise
+                with self._cond:
+                    self._contatori["rate_limit"] += 1
+                if tentativo == self.tentativi:
+                    raise
+                self._dopo_rate_limit(risorsa, e, tentativo)
+
+    def genera(self, funzione, token_stimati=0, token_effettivi=None):
+        """
+        Esegue una richiesta di generazione `funzione()` entro i limiti di richieste
+        e token. `token_effettivi(risultato)`, se indicata, restituisce i token
+        realmente usati, con cui viene rettificata la stima.
+        """
+        risultato = self._esegui(GENERAZIONE, funzione, richieste=1, token=token_stimati)
+        effettivi = token_effettivi(risultato) if token_effettivi else None
+        with self._cond:
+            self._contatori["richieste"] += 1
+            self._contatori["token_usati"] += effettivi if effettivi is not None else token_stimati
+            if effettivi is not None and self._bucket["token"]:
+                self._bucket["token"].rettifica(effettivi - token_stimati)
+        return risultato
+
+    def carica(self, funzione, byte=0):
+        """Esegue un upload `funzione()` dopo aver riservato `byte` di banda."""
+        risultato = self._esegui(UPLOAD, funzione, byte=byte)
+        with self._cond:
+            self._contatori["upload"] += 1
+            self._contatori["byte_caricati"] += byte
+        return risultato
+
+    def consuma_banda(self, byte):
+        """Riserva `byte` di banda di upload (per i blocchi dell'upload resumable)."""
+        self._acquisisci(UPLOAD, byte=byte)
+        with self._cond:
+            self._contatori["byte_caricati"] += byte
+
+    def stats(self):
+        with self._cond:
+            ora = time.monotonic()
+            risultato = dict(self._contatori)
+            for risorsa in (GENERAZIONE, UPLOAD):
+                attese = sorted(self._attese[risorsa])
+                risultato[f"in_coda_{risorsa}"] = sum(len(c) for c in self._code[risorsa].values())
+                risultato[f"sessioni_in_attesa_{risorsa}"] = len(self._code[risorsa])
+                risultato[f"attesa_media_{risorsa}_s"] = round(sum(attese) / len(attese), 2) if attese else 0.0
+                risultato[f"attesa_p95_{risorsa}_s"] = round(attese[int(0.95 * (len(attese) - 1))], 2) if attese else 0.0
+                risultato[f"pausa_{risorsa}_s"] = round(max(0.0, self._pausa_fino[risorsa] - ora), 1)
+            return risultato
+
+
+def stima_token(parti):
+    """Stima dei token di una richiesta: ~4 caratteri per token di testo, ~300 token per secondo di video."""
+    totale = 0
+    for parte in parti:
+        if isinstance(parte, str):
+            totale += len(parte) // 4
+            continue
+        durata = getattr(getattr(parte, "video_metadata", None), "video_duration", None)
+        secondi = getattr(durata, "seconds", None) if durata is not None else None
+        totale += int(secondi) * TOKEN_PER_SECONDO if secondi else TOKEN_VIDEO_DEFAULT
+    return totale
+
+
+_default_governatore = None
+_default_lock = threading.Lock()
+
+
+def get_default_governatore():
+    """Restituisce il governatore condiviso dal processo, configurato tramite variabili d'ambiente."""
+    global _default_governatore
+    with _default_lock:
+        if _default_governatore is None:
+            _default_governatore = Governatore(
+                rpm=float(os.getenv("ADVISOR_RPM", "0")),
+                tpm=float(os.getenv("ADVISOR_TPM", "0")),
+                upload_bytes_s=float(os.getenv("ADVISOR_UPLOAD_MBPS", "0")) * 1024 * 1024,
+                tentativi=int(os.getenv("ADVISOR_RATE_LIMIT_RETRIES", "5")),
+            )
+        return _default_governatore
@@ -0,0 +1,169 @@
+# impronte.py
+"""
+Impronte percettive dei video per riconoscere le nuove versioni di uno spot
+già analizzato (nuovo end card, CTA diversa, ricodifica).
+
+Per ogni secondo di video si calcolano un hash percettivo del fotogramma
+(dHash a 64 bit su un'immagine 9x8 in scala di grigi) e un hash dell'audio
+(16 bit: variazioni di energia tra bande di frequenza adiacenti, come nelle
+impronte acustiche classiche). Due video sono simili se la maggior parte dei
+secondi dell'uno trova un secondo quasi identico nell'altro; i secondi senza
+corrispondenza indicano le parti modificate.
+
+L'indice è nell'archivio SQLite (vedi store): ogni hash di fotogramma è diviso
+in 4 bande da 16 bit e i video che condividono più bande con quello nuovo sono
+i candidati, confrontati poi esattamente con NumPy.
+"""
+import os
+import subprocess
+import numpy as np
+import segmenti
+import store
+import upload_stream
+
+# Distanza di Hamming massima perché due secondi siano considerati uguali.
+SOGLIA_FRAME = 10
+SOGLIA_AUDIO = 2
+PESO_AUDIO = 0.25
+BANDE_MINIME_COMUNI = 3
+MAX_CANDIDATI = 20
+# Hash di fotogrammi uniformi (nero, bianco): compaiono in troppi video per essere indicativi.
+HASH_NON_INFORMATIVI = (0, 0xFFFFFFFFFFFFFFFF)
+
+
+def soglia_configurata():
+    """Similarità minima per considerare due video quasi duplicati (ADVISOR_NEAR_DUP_THRESHOLD)."""
+    return float(os.getenv("ADVISOR_NEAR_DUP_THRESHOLD", "0.8"))
+
+
+def _hash_fotogrammi(path):
+    grezzo = subprocess.run(
+        [segmenti.trova_eseguibile("ffmpeg"), "-v", "error", "-i", path, "-an",
+         "-vf", "fps=1,scale=9:8:flags=area,format=gray", "-f", "rawvideo", "-"],
+        capture_output=True, check=True,
+    ).stdout
+    pixel = np.frombuffer(grezzo, dtype=np.uint8)
+    pixel = pixel[:len(pixel) // 72 * 72].reshape(-1, 8, 9).astype(np.int16)
+    bit = pixel[:, :, 1:] > pixel[:, :, :-1]
+    return np.packbits(bit.reshape(len(bit), 64), axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def _hash_audio(path, frequenza=8000):
+    try:
+        grezzo = subprocess.run(
+            [segmenti.trova_eseguibile("ffmpeg"), "-v", "error", "-i", path, "-vn",
+             "-ac", "1", "-ar", str(frequenza), "-f", "s16le", "-"],
+            capture_output=True, check=True,
+        ).stdout
+    except subprocess.CalledProcessError:
+        # Video senza traccia audio.
+        return np.zeros(0, dtype=np.uint16)
+    campioni = np.frombuffer(grezzo, dtype="<i2")
+    secondi = len(campioni) // frequenza
+    if secondi == 0:
+        return np.zeros(0, dtype=np.uint16)
+    finestre = campioni[:secondi * frequenza].reshape(secondi, frequenza).astype(np.float32)
+    spettro = np.abs(np.fft.rfft(finestre * np.hanning(frequenza), axis=1)) ** 2
+    # 17 bande logaritmiche tra 300 e 2000 Hz (con 1 s di campioni, un bin = 1 Hz).
+    bordi = np.logspace(np.log10(300), np.log10(2000), 18).astype(int)
+    energia = np.stack([spettro[:, a:b].sum(axis=1) for a, b in zip(bordi[:-1], bordi[1:])], axis=1)
+    differenze = energia[:, :-1] - energia[:, 1:]
+    differenze[1:] -= differenze[:-1].copy()
+    return np.packbits(differenze > 0, axis=1).view(">u2").ravel().astype(np.uint16)
+
+
+def calcola(path):
+    """Impronta di un file video: {"frame": uint64 per secondo, "audio": uint16 per secondo}."""
+    return {"frame": _hash_fotogrammi(path), "audio": _hash_audio(path)}
+
+
+def calcola_da_file(sorgente):
+    """Impronta di un file-like (es. UploadedFile), copiato in un file temporaneo per ffmpeg."""
+    nome = getattr(sorgente, "name", "video.mp4")
+    with upload_stream.file_temporaneo(sorgente, os.path.splitext(nome)[1]) as path:
+        return calcola(path)
+
+
+def bande(impronta):
+    """Chiavi dell'indice: (banda << 16) | valore per ogni banda da 16 bit di ogni fotogramma."""
+    chiavi = set()
+    for h in impronta["frame"].tolist():
+        if h in HASH_NON_INFORMATIVI:
+            continue
+        for banda in range(4):
+            chiavi.add((banda << 16) | ((h >> (16 * banda)) & 0xFFFF))
+    return sorted(chiavi)
+
+
+def _distanze(a, b):
+    """Matrice delle distanze di Hamming tra due array di hash dello stesso tipo."""
+    xor = a[:, None] ^ b[None, :]
+    byte = xor.view(np.uint8).reshape(len(a), len(b), a.dtype.itemsize)
+    return np.unpackbits(byte, axis=2).sum(axis=2)
+
+
+def _coperture(a, b, soglia):
+    """Per ogni secondo di `a`, True se esiste un secondo di `b` quasi identico (e viceversa)."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros(len(a), dtype=bool), np.zeros(len(b), dtype=bool)
+    distanze = _distanze(a, b)
+    return distanze.min(axis=1) <= soglia, distanze.min(axis=0) <= soglia
+
+
+def _intervalli(secondi, durata, margine=1):
+    """Raggruppa i secondi indicati in intervalli [inizio, fine], allargati di `margine` secondi."""
+    intervalli = []
+    for s in secondi:
+        da, a = max(0, s - margine), min(durata, s + 1 + margine)
+        if intervalli and da <= intervalli[-1][1]:
+            intervalli[-1][1] = a
+        else:
+            intervalli.append([da, a])
+    return intervalli
+
+
+def confronta(nuova, precedente):
+    """
+    Similarità tra due impronte (0-1) e intervalli del video nuovo senza
+    corrispondenza nel precedente, cioè le parti modificate.
+    """
+    nuovi, vecchi = _coperture(nuova["frame"], precedente["frame"], SOGLIA_FRAME)
+    similarita_video = (nuovi.mean() + vecchi.mean()) / 2 if len(nuovi) and len(vecchi) else 0.0
+    similarita = similarita_video
+    similarita_audio = None
+    if len(nuova["audio"]) and len(precedente["audio"]):
+        audio_nuovo, audio_vecchio = _coperture(nuova["audio"], precedente["audio"], SOGLIA_AUDIO)
+        similarita_audio = (audio_nuovo.mean() + audio_vecchio.mean()) / 2
+        similarita = (1 - PESO_AUDIO) * similarita_video + PESO_AUDIO * similarita_audio
+    return {
+        "similarita": round(float(similarita), 3),
+        "similarita_video": round(float(similarita_video), 3),
+        "similarita_audio": None if similarita_audio is None else round(float(similarita_audio), 3),
+        "intervalli_cambiati": _intervalli(np.flatnonzero(~nuovi).tolist(), len(nuovi)),
+        "durata_s": len(nuovi),
+    }
+
+
+def registra(video_hash, impronta, archivio=None):
+    """Aggiunge l'impronta di un video analizzato all'indice di similarità."""
+    (archivio or store.get_default_store()).salva_impronta(
+        video_hash, impronta["frame"].tobytes(), impronta["audio"].tobytes(), bande(impronta))
+
+
+def cerca_simili(impronta, soglia=None, escludi=None, archivio=None):
+    """
+    Video già indicizzati simili all'impronta, dal più simile. Ogni elemento
+    contiene video_hash, similarità e intervalli cambiati (vedi confronta).
+    """
+    archivio = archivio or store.get_default_store()
+    soglia = soglia_configurata() if soglia is None else soglia
+    risultati = []
+    for video_hash in archivio.candidati_simili(bande(impronta), BANDE_MINIME_COMUNI, MAX_CANDIDATI):
+        if video_hash == escludi:
+            continue
+        frame, audio = archivio.impronta(video_hash)
+        precedente = {"frame": np.frombuffer(frame, dtype=np.uint64), "audio": np.frombuffer(audio, dtype=np.uint16)}
+        confronto = confronta(impronta, precedente)
+        if confronto["similarita"] >= soglia:
+            risultati.append(dict(confronto, video_hash=video_hash))
+    return sorted(risultati, key=lambda r: r["similarita"], reverse=True)
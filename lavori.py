@@ -0,0 +1,178 @@
+# lavori.py
+"""
+Esecuzione delle analisi in background, fuori dalla run dello script Streamlit.
+
+Ogni analisi diventa un lavoro con un identificativo: la pagina lo salva in
+session_state e nei parametri dell'URL, quindi un'interazione con i widget o
+il refresh del browser non interrompono il lavoro e la pagina si ricollega
+al suo stato (avanzamento, messaggi, eventi dello streaming, risultato).
+
+I lavori girano in un pool di thread condiviso dal processo, con un numero
+massimo di lavori contemporanei (ADVISOR_MAX_JOBS); gli altri restano in coda.
+I lavori conclusi vengono dimenticati dopo ADVISOR_JOB_RETENTION_MIN minuti.
+"""
+import concurrent.futures
+import contextlib
+import governatore
+import itertools
+import os
+import shutil
+import streaming_json
+import tempfile
+import threading
+import time
+import tracciamento
+import uuid
+
+IN_CODA = "in_coda"
+IN_CORSO = "in_corso"
+COMPLETATO = "completato"
+ERRORE = "errore"
+
+
+class Lavoro:
+    """Stato di un lavoro, aggiornato dal thread che lo esegue e letto dalle pagine."""
+
+    def __init__(self, tipo, descrizione, parametri=None, sessione=None):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.sessione = sessione
+        self.descrizione = descrizione
+        self.parametri = parametri or {}
+        self.stato = IN_CODA
+        self.messaggi = []
+        self.eventi = []
+        self.esito = None
+        self.errore = None
+        self.creato = time.time()
+        self.avviato = None
+        self.terminato = None
+        self.traccia = None
+
+    @property
+    def concluso(self):
+        return self.stato in (COMPLETATO, ERRORE)
+
+    def log(self, messaggio):
+        """Da passare come `log` alle funzioni di analisi."""
+        self.messaggi.append(str(messaggio))
+
+    def on_evento(self, evento):
+        """Da passare come `on_evento`: gli eventi dello streaming vengono riprodotti dalla pagina."""
+        tipo, _, valore = evento
+        if tipo == streaming_json.RIPRISTINO:
+            # Nuovo tentativo della richiesta: la pagina riproduce solo gli eventi ancora validi.
+            self.eventi = [e for e in self.eventi if e[1] not in valore]
+            return
+        self.eventi.append(evento)
+
+    def durata(self):
+        if self.avviato is None:
+            return 0.0
+        return (self.terminato or time.time()) - self.avviato
+
+
+class GestoreLavori:
+    def __init__(self, max_concorrenti=4, conservazione_s=3600):
+        self.max_concorrenti = max_concorrenti
+        self.conservazione_s = conservazione_s
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_concorrenti,
+                                                           thread_name_prefix="advisor-lavoro")
+        self._lavori = {}
+        self._lock = threading.Lock()
+
+    def avvia(self, tipo, descrizione, funzione, *args, parametri=None, file_temporanei=(), sessione=None, **kwargs):
+        """
+        Mette in coda `funzione(lavoro, *args, **kwargs)` e restituisce l'id del
+        lavoro. Il valore restituito dalla funzione diventa `lavoro.esito`. I
+        `file_temporanei` (file o cartelle) vengono eliminati alla fine del lavoro. Le richieste
+        del lavoro sono attribuite a `sessione` nella coda equa del governatore.
+        """
+        lavoro = Lavoro(tipo, descrizione, parametri, sessione)
+        with self._lock:
+            self._pulisci()
+            self._lavori[lavoro.id] = lavoro
+        self._pool.submit(self._esegui, lavoro, funzione, args, kwargs, list(file_temporanei))
+        return lavoro.id
+
+    def _esegui(self, lavoro, funzione, args, kwargs, file_temporanei):
+        lavoro.avviato = time.time()
+        lavoro.stato = IN_CORSO
+        try:
+            with governatore.sessione(lavoro.sessione), \
+                    tracciamento.traccia(f"lavoro {lavoro.tipo}", lavoro=lavoro.id) as traccia:
+                lavoro.traccia = traccia
+                lavoro.esito = funzione(lavoro, *args, **kwargs)
+            lavoro.stato = COMPLETATO
+        except Exception as e:
+            lavoro.errore = e
+            lavoro.stato = ERRORE
+        finally:
+            lavoro.terminato = time.time()
+            for path in file_temporanei:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+
+    def ottieni(self, id_lavoro):
+        """Il lavoro con l'id indicato, o None se sconosciuto o già dimenticato."""
+        with self._lock:
+            return self._lavori.get(id_lavoro)
+
+    def posizione_in_coda(self, id_lavoro):
+        """Quanti lavori in coda precedono quello indicato (0 se è il prossimo o è già avviato)."""
+        with self._lock:
+            lavoro = self._lavori.get(id_lavoro)
+            if lavoro is None or lavoro.stato != IN_CODA:
+                return 0
+            # I lavori sono registrati nell'ordine di invio, lo stesso in cui il pool li esegue.
+            precedenti = itertools.takewhile(lambda l: l is not lavoro, self._lavori.values())
+            return sum(1 for l in precedenti if l.stato == IN_CODA)
+
+    def _pulisci(self):
+        limite = time.time() - self.conservazione_s
+        for id_lavoro in [i for i, l in self._lavori.items() if l.concluso and l.terminato < limite]:
+            del self._lavori[id_lavoro]
+
+    def stats(self):
+        with self._lock:
+            stati = [l.stato for l in self._lavori.values()]
+        return {
+            "in_coda": stati.count(IN_CODA),
+            "in_corso": stati.count(IN_CORSO),
+            "completati": stati.count(COMPLETATO),
+            "errori": stati.count(ERRORE),
+            "max_concorrenti": self.max_concorrenti,
+        }
+
+
+def copia_upload(uploaded_file):
+    """
+    Copia un file caricato in un file temporaneo che appartiene al lavoro: il
+    buffer dell'uploader può cambiare o sparire alla run successiva.
+    """
+    fd, path = tempfile.mkstemp(prefix="advisor_lavoro_", suffix=os.path.splitext(uploaded_file.name)[1])
+    with tracciamento.span("scrittura_file_locale", origine="upload_pagina"):
+        uploaded_file.seek(0)
+        with os.fdopen(fd, "wb") as destinazione:
+            shutil.copyfileobj(uploaded_file, destinazione, 1024 * 1024)
+        uploaded_file.seek(0)
+    return path
+
+
+_default_gestore = None
+_default_lock = threading.Lock()
+
+
+def get_default_gestore():
+    """Restituisce il gestore dei lavori condiviso dal processo, configurato tramite variabili d'ambiente."""
+    global _default_gestore
+    with _default_lock:
+        if _default_gestore is None:
+            _default_gestore = GestoreLavori(
+                max_concorrenti=int(os.getenv("ADVISOR_MAX_JOBS", "4")),
+                conservazione_s=float(os.getenv("ADVISOR_JOB_RETENTION_MIN", "60")) * 60,
+            )
+        return _default_gestore
@@ -0,0 +1,183 @@
+# linee_guida.py
+"""
+Registro delle linee guida culturali per mercato (cartella cultural_guidelines/).
+
+I file JSON vengono letti e validati una volta; per ogni mercato il registro
+prepara il frammento di prompt compatto e un'impronta del contenuto, usata
+nelle chiavi della cache dei risultati. Costruire un prompt è quindi una
+ricerca in un dizionario, anche con decine di mercati.
+
+Il registro si ricarica da solo quando un file viene aggiunto, modificato o
+rimosso: al massimo ogni ADVISOR_GUIDELINES_CHECK_S secondi confronta data di
+modifica e dimensione dei file e rilegge solo quelli cambiati. I file non
+validi vengono esclusi e segnalati in `errori()`, senza bloccare gli altri.
+
+Formato di un file:
+    {"nome_paese": "Italia", "linee_guida": {"simboli_sensibili": "...", ...}}
+I valori delle linee guida sono testi o liste di testi.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+NESSUN_PAESE = "Nessuna selezione specifica"
+
+
+class MercatoSconosciuto(ValueError):
+    """Il mercato richiesto non ha linee guida nel registro."""
+
+
+def _valida(data):
+    """Controlla la struttura di un file e restituisce (nome_paese, linee_guida normalizzate)."""
+    if not isinstance(data, dict):
+        raise ValueError("il file deve contenere un oggetto JSON")
+    nome = data.get("nome_paese")
+    if not isinstance(nome, str) or not nome.strip():
+        raise ValueError("'nome_paese' mancante o vuoto")
+    linee_guida = data.get("linee_guida")
+    if not isinstance(linee_guida, dict) or not linee_guida:
+        raise ValueError("'linee_guida' deve essere un oggetto non vuoto")
+    normalizzate = {}
+    for voce, valore in linee_guida.items():
+        if isinstance(valore, list) and all(isinstance(v, str) for v in valore):
+            valore = "; ".join(" ".join(v.split()) for v in valore if v.strip())
+        elif isinstance(valore, str):
+            valore = " ".join(valore.split())
+        else:
+            raise ValueError(f"la voce '{voce}' deve essere un testo o una lista di testi")
+        if valore:
+            normalizzate[voce] = valore
+    if not normalizzate:
+        raise ValueError("'linee_guida' non contiene testi")
+    return nome.strip(), normalizzate
+
+
+def compila(nome, linee_guida):
+    """Frammento di prompt di un mercato: una riga per voce, senza la struttura JSON."""
+    righe = [f"[{nome}]"]
+    for voce, testo in linee_guida.items():
+        righe.append(f"- {voce.replace('_', ' ').capitalize()}: {testo}")
+    return "\n".join(righe)
+
+
+def _impronta(linee_guida):
+    serializzato = json.dumps(linee_guida, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serializzato.encode("utf-8")).hexdigest()[:16]
+
+
+class RegistroLineeGuida:
+    def __init__(self, cartella="cultural_guidelines", intervallo_controllo_s=2.0):
+        self.cartella = cartella
+        self.intervallo_controllo_s = intervallo_controllo_s
+        self._lock = threading.Lock()
+        # File -> (data di modifica e dimensione, voce compilata o None, errore o None)
+        self._file = {}
+        self._mercati = {}
+        self._ultimo_controllo = None
+        self._ricaricamenti = 0
+
+    def _firme(self):
+        firme = {}
+        try:
+            voci = os.scandir(self.cartella)
+        except FileNotFoundError:
+            return firme
+        with voci:
+            for voce in voci:
+                if voce.name.endswith(".json") and voce.is_file():
+                    stat = voce.stat()
+                    firme[voce.name] = (stat.st_mtime_ns, stat.st_size)
+        return firme
+
+    def _carica_file(self, nome_file):
+        try:
+            with open(os.path.join(self.cartella, nome_file), "r", encoding="utf-8") as f:
+                nome, linee_guida = _valida(json.load(f))
+        except (OSError, ValueError) as e:
+            return None, str(e)
+        return {"nome": nome, "file": nome_file, "frammento": compila(nome, linee_guida),
+                "impronta": _impronta(linee_guida)}, None
+
+    def _aggiorna(self):
+        """Rilegge i file cambiati dall'ultimo controllo (al massimo ogni intervallo_controllo_s)."""
+        ora = time.monotonic()
+        with self._lock:
+            if self._ultimo_controllo is not None and ora - self._ultimo_controllo < self.intervallo_controllo_s:
+                return
+            self._ultimo_controllo = ora
+            firme = self._firme()
+            if firme == {nome: firma for nome, (firma, _, _) in self._file.items()}:
+                return
+            file = {}
+            for nome_file in sorted(firme):
+                precedente = self._file.get(nome_file)
+                if precedente is not None and precedente[0] == firme[nome_file]:
+                    file[nome_file] = precedente
+                else:
+                    file[nome_file] = (firme[nome_file], *self._carica_file(nome_file))
+            mercati = {}
+            for nome_file, (firma, voce, errore) in file.items():
+                if voce is None:
+                    continue
+                chiave = voce["nome"].casefold()
+                if chiave in mercati:
+                    file[nome_file] = (firma, None, f"mercato '{voce['nome']}' già definito in {mercati[chiave]['file']}")
+                    continue
+                mercati[chiave] = voce
+            # Le letture concorrenti vedono la versione precedente o la nuova, mai uno stato intermedio.
+            self._file, self._mercati = file, mercati
+            self._ricaricamenti += 1
+
+    def _voce(self, paese):
+        if not paese or paese == NESSUN_PAESE:
+            return None
+        self._aggiorna()
+        return self._mercati.get(paese.casefold())
+
+    def mercati(self):
+        """Nomi dei mercati disponibili, nell'ordine dei file."""
+        self._aggiorna()
+        return [voce["nome"] for voce in self._mercati.values()]
+
+    def frammento(self, paese):
+        """Frammento di prompt con le linee guida del mercato, o None se non ce ne sono."""
+        voce = self._voce(paese)
+        return voce["frammento"] if voce else None
+
+    def impronta(self, paese):
+        """Impronta delle linee guida del mercato (cambia quando il file cambia), o None."""
+        voce = self._voce(paese)
+        return voce["impronta"] if voce else None
+
+    def verifica(self, paese):
+        """Solleva MercatoSconosciuto se è indicato un mercato senza linee guida."""
+        if paese and paese != NESSUN_PAESE and self._voce(paese) is None:
+            raise MercatoSconosciuto(f"Mercato sconosciuto: {paese} (disponibili: {', '.join(self.mercati())})")
+
+    def errori(self):
+        """File esclusi perché non validi, con il motivo."""
+        self._aggiorna()
+        return {nome_file: errore for nome_file, (_, _, errore) in self._file.items() if errore}
+
+    def stats(self):
+        self._aggiorna()
+        return {"mercati": len(self._mercati), "file_non_validi": len(self.errori()),
+                "ricaricamenti": self._ricaricamenti}
+
+
+_default_registro = None
+_default_lock = threading.Lock()
+
+
+def get_default_registro():
+    """Registro condiviso dal processo (ADVISOR_GUIDELINES_DIR, default cultural_guidelines)."""
+    global _default_registro
+    with _default_lock:
+        if _default_registro is None:
+            _default_registro = RegistroLineeGuida(
+                os.getenv("ADVISOR_GUIDELINES_DIR", "cultural_guidelines"),
+                intervallo_controllo_s=float(os.getenv("ADVISOR_GUIDELINES_CHECK_S", "2")),
+            )
+        return _default_registro
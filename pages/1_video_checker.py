@@ -1,11 +1,26 @@
 # pages/1_Video_Checker.py
+import io
+import subprocess
+import time
 import streamlit as st
 import utils
-import google.generativeai as genai
+import analisi
+import approfondimenti
+import lavori
+import poller
+import result_cache
+import riduzione
+import segmenti
+import store
+import tracciamento
+import upload_stream
+
+TIPI_LAVORO = ("checker", "multi", "segmentata", "modifiche")
 
 # Configura API e titolo pagina
 st.set_page_config(page_title="Video Checker", page_icon="🔍")
 utils.configure_gemini()
+pagina = utils.inizia_pagina("video_checker")
 
 st.header("🔍 Video Checker")
 st.write("Carica un video per analizzare aspetti culturali, DE&I e potenziali problematiche di comunicazione.")
@@ -14,120 +29,323 @@ video_caricato = st.file_uploader("Scegli un file video", type=["mp4", "mov", "a
 st.markdown("---")
 
 with st.expander("Impostazioni di Analisi Avanzata (Opzionale)"):
-    paesi = ["Nessuna selezione specifica", "Italia", "Giappone", "Cina", "Stati Uniti", "Arabia Saudita"]
+    mercati = utils.elenca_mercati()
+    utils.mostra_errori_linee_guida()
+    paesi = ["Nessuna selezione specifica"] + mercati
     paese_sel = st.selectbox("Seleziona un mercato di riferimento:", paesi)
+    mercati_multi = st.multiselect("Oppure analizza più mercati in parallelo:", mercati)
+    st.caption("Il video viene caricato una sola volta; le sezioni opzionali sono calcolate una volta e condivise tra i mercati.")
     controlli_pers = st.text_area("Aggiungi controlli personalizzati (uno per riga):", placeholder="Esempio: Non deve contenere loghi di competitor.")
     analisi_persuasiva_on = st.checkbox("Abilita Analisi dell'Efficacia Persuasiva")
     ricerca_notizie_on = st.checkbox("Abilita Ricerca Notizie Recenti")
     st.caption("Cerca notizie recenti che potrebbero impattare il prodotto/servizio presentato nel video.")
     analisi_performance_on = st.checkbox("Abilita Analisi Performance Video")
     st.caption("Analizza elementi tecnici e di engagement per predire le performance del video.")
+    forza_analisi = st.checkbox("Ignora i risultati in cache e ripeti l'analisi")
+    preset_riduzione = st.selectbox("Riduzione del video prima dell'upload:", list(riduzione.PRESET),
+                                    index=list(riduzione.PRESET).index(riduzione.preset_configurato()))
+    st.caption("Ricodifica il video in un proxy più leggero (risoluzione e frame rate ridotti) per velocizzare upload e processamento (richiede ffmpeg).")
+    streaming_on = st.checkbox("Mostra i risultati man mano che arrivano", value=True)
+    segmentata_on = st.checkbox("Analisi segmentata per video lunghi")
+    durata_segmento = st.slider("Durata dei segmenti (secondi):", 10, 120,
+                                int(segmenti.durata_segmento_configurata()), step=5, disabled=not segmentata_on)
+    st.caption("Divide il video in finestre analizzate in parallelo e indica in quali istanti compare ogni rilievo (richiede ffmpeg).")
 
 st.markdown("---")
 
+def _calcola_impronta(video):
+    """Hash e impronta percettiva di un video (None se ffmpeg non è disponibile o il video non è leggibile)."""
+    # numpy si carica solo quando serve un'impronta.
+    import impronte
+    hash_upload = utils.calcola_hash_video(video)
+    try:
+        impronta = impronte.calcola_da_file(video)
+    except (segmenti.FfmpegNonDisponibile, subprocess.CalledProcessError):
+        impronta = None
+    return hash_upload, impronta
+
+def _esegui_impronta(lavoro, contenuto, nome):
+    """Corpo del lavoro in background avviato al caricamento del video."""
+    video = io.BytesIO(contenuto)
+    video.name = nome
+    return _calcola_impronta(video)
+
+def _hash_e_impronta():
+    """
+    Hash e impronta percettiva del video caricato, calcolati in background una
+    sola volta per upload. Restituisce (hash, impronta), o None finché il
+    calcolo è in corso.
+    """
+    chiave = f"impronta_{video_caricato.file_id}"
+    if chiave in st.session_state:
+        return st.session_state[chiave]
+    gestore = lavori.get_default_gestore()
+    lavoro = gestore.ottieni(st.session_state.get(f"lavoro_{chiave}", ""))
+    if lavoro is None:
+        # getvalue() non copia il buffer dell'uploader: il lavoro legge gli stessi byte.
+        id_lavoro = gestore.avvia("impronta", "Ricerca di versioni già analizzate", _esegui_impronta,
+                                  video_caricato.getvalue(), video_caricato.name,
+                                  sessione=st.session_state.get("id_sessione"))
+        st.session_state[f"lavoro_{chiave}"] = id_lavoro
+        return None
+    if not lavoro.concluso:
+        return None
+    st.session_state[chiave] = lavoro.esito if lavoro.stato == lavori.COMPLETATO else (None, None)
+    return st.session_state[chiave]
+
+@st.fragment(run_every=1)
+def _attendi_impronta(id_lavoro):
+    """Riesegue la pagina quando hash e impronta del video caricato sono pronti."""
+    lavoro = lavori.get_default_gestore().ottieni(id_lavoro)
+    if lavoro is None or lavoro.concluso:
+        st.rerun()
+    st.caption("🔎 Ricerca di versioni già analizzate...")
+
+def _indicizza_impronta(hash_upload, impronta):
+    """Rende il video analizzato riconoscibile nelle versioni successive."""
+    if impronta is not None and len(impronta["frame"]):
+        import impronte
+        impronte.registra(hash_upload, impronta)
+
+def _esegui_analisi(lavoro, path, nome, hash_upload, impronta, opzioni):
+    """Corpo del lavoro in background: riduzione, analisi e indicizzazione dell'impronta."""
+    with upload_stream.FileConNome(path, nome) as video:
+        if hash_upload is None:
+            # Analisi avviata prima che il calcolo dell'impronta fosse concluso.
+            hash_upload, impronta = _calcola_impronta(video)
+        sorgente, content_hash, report = riduzione.get_default_proxy_cache().prepara(
+            video, hash_upload, opzioni["preset"])
+        try:
+            comuni = dict(
+                content_hash=content_hash,
+                controlli=opzioni["controlli"],
+                analisi_persuasiva=opzioni["analisi_persuasiva"],
+                ricerca_notizie=opzioni["ricerca_notizie"],
+                analisi_performance=opzioni["analisi_performance"],
+                usa_cache=opzioni["usa_cache"],
+                log=lavoro.log,
+            )
+            if lavoro.tipo == "multi":
+                esito = analisi.analizza_multi_mercato(sorgente, opzioni["mercati"], **comuni)
+            elif lavoro.tipo == "segmentata":
+                esito = analisi.analizza_segmentato(sorgente, paese=opzioni["paese"],
+                                                    durata_segmento=opzioni["durata_segmento"], **comuni)
+            else:
+                esito = analisi.analizza_checker(sorgente, paese=opzioni["paese"],
+                                                 on_evento=lavoro.on_evento if opzioni["streaming"] else None,
+                                                 **comuni)
+        finally:
+            if sorgente is not video:
+                sorgente.close()
+    # Le analisi servite dalla cache non dicono nulla sulla latenza di upload e processamento.
+    if not esito.get("da_cache") and esito.get("richieste_eseguite", 1):
+        riduzione.get_default_proxy_cache().registra(report, esito["tempi"])
+    _indicizza_impronta(hash_upload, impronta)
+    esito["riduzione"] = report
+    return esito
+
+def _esegui_modifiche(lavoro, path, nome, hash_upload, impronta, id_precedente, intervalli, opzioni):
+    with upload_stream.FileConNome(path, nome) as video:
+        esito = analisi.analizza_modifiche(
+            video,
+            store.get_default_store().dettaglio(id_precedente)["risultato"],
+            intervalli,
+            paese=opzioni["paese"],
+            controlli=opzioni["controlli"],
+            content_hash=hash_upload,
+            usa_cache=opzioni["usa_cache"],
+            log=lavoro.log,
+        )
+    _indicizza_impronta(hash_upload, impronta)
+    return esito
+
+def _opzioni():
+    return {
+        "paese": paese_sel,
+        "mercati": list(mercati_multi),
+        "controlli": controlli_pers,
+        "analisi_persuasiva": analisi_persuasiva_on,
+        "ricerca_notizie": ricerca_notizie_on,
+        "analisi_performance": analisi_performance_on,
+        "usa_cache": not forza_analisi,
+        "preset": preset_riduzione,
+        "streaming": streaming_on,
+        "durata_segmento": durata_segmento,
+    }
+
+def _avvia(tipo, descrizione, funzione, *args):
+    """Copia il video caricato per il lavoro e lo avvia in background."""
+    path = lavori.copia_upload(video_caricato)
+    hash_upload, impronta = _hash_e_impronta() or (None, None)
+    utils.avvia_lavoro(tipo, descrizione, funzione, path, video_caricato.name, hash_upload, impronta, *args,
+                       parametri=dict(_opzioni(), video_nome=video_caricato.name), file_temporanei=[path])
+    st.rerun()
+
+def _mostra_versioni_precedenti(versioni):
+    versione = versioni[0]
+    riga = versione["analisi"][0]
+    cambiate = ", ".join(f"{segmenti.formatta_tempo(da)}–{segmenti.formatta_tempo(a)}"
+                         for da, a in versione["intervalli_cambiati"]) or "nessuna"
+    st.info(
+        f"♻️ Questo video è quasi identico a **{riga['video_nome'] or riga['video_hash'][:12]}**, "
+        f"analizzato il {riga['creato']} (mercato: {riga['mercato'] or '—'}, similarità "
+        f"{versione['similarita']:.0%}). Parti cambiate: {cambiate}."
+    )
+    stesso_mercato = riga["mercato"] == result_cache.normalizza_paese(paese_sel)
+    col1, col2 = st.columns(2)
+    if col1.button("Mostra l'analisi precedente"):
+        with tracciamento.span("rendering", tipo="precedente"):
+            utils.visualizza_risultati_checker(store.get_default_store().dettaglio(riga["id"])["risultato"])
+    rianalizza = col2.button("Rianalizza solo le parti modificate",
+                             disabled=not versione["intervalli_cambiati"] or not stesso_mercato,
+                             help=None if stesso_mercato else "L'analisi precedente riguarda un altro mercato.")
+    if rianalizza:
+        _avvia("modifiche", "Rianalisi delle parti modificate", _esegui_modifiche,
+               riga["id"], versione["intervalli_cambiati"], _opzioni())
+
+def _mostra_riduzione(report):
+    if report["preset"] == riduzione.NESSUNA_RIDUZIONE:
+        return
+    if report.get("proxy_non_conveniente"):
+        st.caption(f"📉 Il proxy '{report['preset']}' non è più leggero dell'originale: caricato il video originale.")
+        return
+    risparmio = report["bytes_originale"] - report["bytes_caricati"]
+    st.caption(
+        f"📉 Proxy '{report['preset']}': {report['bytes_caricati'] / (1024 * 1024):.1f} MB caricati invece di "
+        f"{report['bytes_originale'] / (1024 * 1024):.1f} MB (-{risparmio / (1024 * 1024):.1f} MB) · "
+        f"riduzione in {report['riduzione_s']:.1f}s{' (proxy in cache)' if report['proxy_da_cache'] else ''}"
+    )
+
+def _mostra_esito(lavoro):
+    """Risultato di un lavoro concluso, mostrato subito a ogni rerun finché la pagina resta collegata."""
+    if lavoro.stato == lavori.ERRORE:
+        if isinstance(lavoro.errore, poller.ElaborazioneFallita):
+            st.error(f"Elaborazione del video '{lavoro.parametri.get('video_nome', 'caricato')}' fallita: {lavoro.errore}")
+        else:
+            st.error(f"Si è verificato un errore: {lavoro.errore}")
+        return
+    esito = lavoro.esito
+    if lavoro.tipo == "multi":
+        st.success(
+            f"Analisi completata in {esito['tempi']['totale_s']:.1f}s "
+            f"({esito['richieste_eseguite']} richieste al modello, le altre dalla cache)"
+        )
+        _mostra_riduzione(esito["riduzione"])
+        for chiave, errore in esito["errori"].items():
+            st.warning(f"'{chiave}' non disponibile: {errore}")
+        utils.visualizza_matrice_mercati(esito["risultati"], esito["errori"])
+        return
+    if lavoro.tipo == "modifiche":
+        st.success(f"Analisi aggiornata in {esito['tempi']['totale_s']:.1f}s "
+                   f"({esito['segmenti_analizzati']} parti rianalizzate)")
+    elif lavoro.tipo == "segmentata":
+        st.success(
+            f"Analisi completata in {esito['tempi']['totale_s']:.1f}s "
+            f"({esito['segmenti_analizzati']} segmenti analizzati su {esito['segmenti']}, gli altri dalla cache)"
+        )
+    elif esito["da_cache"]:
+        st.success("Analisi completata! (risultato recuperato dalla cache)")
+    elif esito["sezioni_da_cache"]:
+        st.success(f"Analisi completata! (sezioni riutilizzate dalla cache: {', '.join(esito['sezioni_da_cache'])})")
+    else:
+        st.success("Analisi completata!")
+    if "riduzione" in esito:
+        _mostra_riduzione(esito["riduzione"])
+    for sezione, errore in esito["errori_sezioni"].items():
+        st.warning(f"Sezione '{sezione}' non disponibile: {errore}")
+    if esito.get("sezioni_riparate"):
+        st.info(f"🩹 Richieste di nuovo solo le parti non valide: {', '.join(esito['sezioni_riparate'])}")
+    if lavoro.tipo == "checker" and not utils.is_valid_json(esito["risultato"]):
+        st.error("Errore nella visualizzazione dei risultati: risposta JSON non valida")
+        st.code(esito["risultato"])
+    else:
+        utils.visualizza_risultati_checker(esito["risultato"])
+    if "primo_insight_s" in esito["tempi"]:
+        st.caption(
+            f"⏱️ Primo risultato dopo {esito['tempi']['primo_insight_s']:.1f}s · "
+            f"analisi completa in {esito['tempi']['totale_s']:.1f}s"
+        )
+    if utils.is_valid_json(esito["risultato"]):
+        _mostra_approfondimenti(lavoro)
+
+def _mostra_approfondimenti(lavoro):
+    """Chat di domande sull'analisi: il video e l'analisi restano nel contesto in cache del modello."""
+    st.markdown("---")
+    st.subheader("💬 Domande sull'analisi")
+    chiave = f"approfondimenti_{lavoro.id}"
+    conversazione = st.session_state.setdefault(chiave, [])
+    for voce in conversazione:
+        with st.chat_message("user"):
+            st.markdown(voce["domanda"])
+        with st.chat_message("assistant"):
+            st.markdown(voce["risposta"])
+            info = voce["info"]
+            origine = (f"{info['token_in_cache']} token dal contesto in cache"
+                       if info["da_contesto"] else "senza contesto in cache")
+            st.caption(f"⏱️ {info['durata_s']:.1f}s · {info['token_nuovi']} token nuovi · {origine}")
+    domanda = st.chat_input("Chiedi un dettaglio, ad esempio: cosa succede al secondo 0:12?", key=f"domanda_{lavoro.id}")
+    if domanda:
+        with st.chat_message("user"):
+            st.markdown(domanda)
+        try:
+            with st.spinner("Ad-Visor sta rispondendo..."):
+                risposta, info = approfondimenti.chiedi(
+                    lavoro.esito["video_hash"],
+                    lavoro.esito["risultato"],
+                    domanda,
+                    storia=[(voce["domanda"], voce["risposta"]) for voce in conversazione],
+                    paese=lavoro.parametri.get("paese"),
+                    controlli=lavoro.parametri.get("controlli", ""),
+                    sorgente=video_caricato,
+                )
+        except approfondimenti.VideoNonDisponibile as e:
+            st.warning(str(e))
+            return
+        except Exception as e:
+            st.error(f"Si è verificato un errore: {e}")
+            return
+        conversazione.append({"domanda": domanda, "risposta": risposta, "info": info})
+        st.rerun()
+
 if video_caricato:
     st.video(video_caricato, width=300)
+    hash_e_impronta = _hash_e_impronta()
+    if hash_e_impronta is None:
+        _attendi_impronta(st.session_state[f"lavoro_impronta_{video_caricato.file_id}"])
+    elif hash_e_impronta[1] is not None and len(hash_e_impronta[1]["frame"]):
+        hash_upload, impronta = hash_e_impronta
+        versioni = analisi.versioni_precedenti(impronta, hash_upload, paese_sel)
+        if versioni:
+            _mostra_versioni_precedenti(versioni)
     if st.button("Analizza il Video"):
-        with st.spinner("Analisi in corso..."):
-            file_video_gemini = None
-            try:
-                file_video_gemini = utils.upload_and_process_video(video_caricato, "video_checker_file")
-                
-                if file_video_gemini:
-                    # --- COSTRUZIONE DINAMICA DEL PROMPT ---
-                    json_structure_extra = ""
-                    istruzioni_extra = ""
-                    
-                    if analisi_persuasiva_on:
-                        istruzioni_extra += """
-4.  **Analisi dell'Efficacia Persuasiva:** Agisci come un esperto di neuromarketing. Valuta l'efficacia del video nel persuadere lo spettatore e inserisci i risultati nella chiave 'analisi_persuasiva'."""
-                        json_structure_extra += ''',
-                      "analisi_persuasiva": {
-                        "modello_aida": {
-                          "attenzione": {"presente": true/false, "motivazione": "..."},
-                          "interesse": {"presente": true/false, "motivazione": "..."},
-                          "desiderio": {"presente": true/false, "motivazione": "..."},
-                          "azione": {"presente": true/false, "motivazione": "..."}
-                        }
-                      }'''
-                    
-                    if ricerca_notizie_on:
-                        istruzioni_extra += """
-5.  **Ricerca Notizie Recenti:** Identifica il prodotto/servizio/brand nel video e cerca mentalmente notizie recenti (ultimi 6 mesi) che potrebbero impattare la sua reputazione. Per ogni notizia, valuta se è POSITIVA (da sfruttare), NEGATIVA (da evitare/mitigare) o NEUTRA. Fornisci raccomandazioni strategiche specifiche su come procedere con il lancio del video considerando il contesto mediatico attuale."""
-                        json_structure_extra += ''',
-                      "notizie_recenti": {
-                        "prodotto_identificato": "...",
-                        "notizie_rilevanti": [
-                          {"titolo": "...", "impatto": "POSITIVO|NEUTRO|NEGATIVO", "descrizione": "...", "rilevanza": "ALTA|MEDIA|BASSA"}
-                        ],
-                        "raccomandazioni_strategiche": {
-                          "timing_lancio": "PROCEDI|ATTENDI|MODIFICA_PRIMA",
-                          "modifiche_consigliate": ["..."],
-                          "opportunita_da_sfruttare": ["..."],
-                          "rischi_da_mitigare": ["..."],
-                          "strategia_comunicazione": "..."
-                        }
-                      }'''
-                    
-                    if analisi_performance_on:
-                        istruzioni_extra += """
-6.  **Analisi Performance Video:** Agisci come un esperto di video marketing e social media analytics. Analizza elementi tecnici, di engagement e virali del video per predire le sue performance sui social media e fornire insight strategici."""
-                        json_structure_extra += ''',
-                      "analisi_performance": {
-                        "previsione_engagement": {"livello": "ALTO|MEDIO|BASSO", "motivazione": "..."},
-                        "potenziale_virale": {"probabilita": "ALTA|MEDIA|BASSA", "fattori_chiave": ["..."]},
-                        "metriche_previste": {
-                          "view_rate": "...",
-                          "completion_rate": "...",
-                          "share_potential": "..."
-                        },
-                        "ottimizzazioni_consigliate": {
-                          "per_facebook": ["..."],
-                          "per_instagram": ["..."],
-                          "per_tiktok": ["..."],
-                          "per_youtube": ["..."]
-                        },
-                        "insight_strategici": ["..."]
-                      }'''
-
-                    prompt_template = f"""
-                    Sei "Ad-Visor", un consulente esperto di marketing e comunicazione globale.
-                    La tua risposta DEVE essere unicamente un blocco di codice JSON valido.
-
-                    La struttura JSON deve essere:
-                    {{
-                      "verdetto_complessivo": "CONSIGLIATO|CONSIGLIATO_CON_RISERVA|NON_CONSIGLIATO",
-                      "motivazione_verdetto": "...",
-                      "checklist_analisi": [
-                        {{"categoria": "...", "punto_analizzato": "...", "status": "OK|ATTENZIONE|CRITICO", "motivazione": "..."}}
-                      ]{json_structure_extra}
-                    }}
-
-                    ISTRUZIONI PER L'ANALISI:
-                    1.  **Analisi Generale:** Valuta aspetti culturali, DE&I e rischi generali.
-                    2.  **Analisi Specifica per Paese:** Se richiesta, applica le linee guida culturali fornite.
-                    3.  **Controlli Personalizzati:** Se richiesti, verificali in modo esplicito.
-                    {istruzioni_extra}
-
-                    ---
-                    INFO PER L'ANALISI:
-                    - Paese di Riferimento: {paese_sel}
-                    - Linee Guida Specifiche: {utils.carica_vincoli_culturali(paese_sel) or "Nessuna"}
-                    - Controlli Personalizzati: {controlli_pers or "Nessuno"}
-                    ---
-                    Analizza il video e fornisci l'output JSON.
-                    """
-
-                    model = genai.GenerativeModel(model_name="gemini-flash-latest")
-                    response = model.generate_content([prompt_template, file_video_gemini], request_options={'timeout': 600})
-                    
-                    clean_response_text = response.text.strip().replace("```json", "").replace("```", "")
-
-                    st.success("Analisi completata!")
-                    utils.visualizza_risultati_checker(clean_response_text)
-                    
-            except Exception as e:
-                st.error(f"Si è verificato un errore: {e}")
-            finally:
-                if file_video_gemini:
-                    genai.delete_file(file_video_gemini.name)
\ No newline at end of file
+        if mercati_multi:
+            _avvia("multi", f"Analisi su {len(mercati_multi)} mercati", _esegui_analisi, _opzioni())
+        elif segmentata_on:
+            _avvia("segmentata", "Analisi segmentata", _esegui_analisi, _opzioni())
+        else:
+            _avvia("checker", "Analisi", _esegui_analisi, _opzioni())
+
+# Il lavoro sopravvive ai rerun e al refresh: la pagina si ricollega tramite l'id salvato.
+lavoro = utils.lavoro_corrente(TIPI_LAVORO)
+if lavoro is not None and not lavoro.concluso:
+    utils.mostra_avanzamento_lavoro(lavoro.id, streaming=lavoro.tipo == "checker" and lavoro.parametri.get("streaming"))
+elif lavoro is not None:
+    st.caption(f"Analisi avviata alle {time.strftime('%H:%M:%S', time.localtime(lavoro.creato))} "
+               f"e completata in {lavoro.durata():.1f}s.")
+    if st.button("Chiudi i risultati"):
+        utils.chiudi_lavoro(lavoro)
+        st.rerun()
+    with tracciamento.span("rendering", tipo=lavoro.tipo):
+        _mostra_esito(lavoro)
+
+utils.mostra_statistiche_cache()
+statistiche_riduzione = riduzione.get_default_proxy_cache().stats()
+if statistiche_riduzione:
+    with st.sidebar.expander("📉 Riduzione video per preset"):
+        st.dataframe(statistiche_riduzione, hide_index=True)
+statistiche_contesti = approfondimenti.get_default_gestore_contesti().stats()
+st.sidebar.caption(
+    f"💬 Contesti in cache: {statistiche_contesti['attivi']}/{statistiche_contesti['max_contesti']} attivi · "
+    f"{statistiche_contesti['riusati']} riusi · {statistiche_contesti['senza_cache']} domande senza cache"
+)
+utils.chiudi_pagina(pagina, lavoro)
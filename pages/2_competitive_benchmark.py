@@ -1,99 +1,136 @@
 # pages/2_Competitive_Benchmark.py
+import time
 import streamlit as st
 import utils
-import google.generativeai as genai
+import analisi
+import lavori
+import poller
+import tracciamento
+import upload_stream
+
+TIPI_LAVORO = ("benchmark", "benchmark_multiplo")
 
 # Configura API e titolo pagina
 st.set_page_config(page_title="Competitive Benchmark", page_icon="📊")
 utils.configure_gemini()
+pagina = utils.inizia_pagina("competitive_benchmark")
 
 st.header("📊 Competitive Benchmark")
-st.write("Confronta il tuo video con quello di un competitor per ottenere un'analisi strategica e una SWOT.")
+st.write("Confronta il tuo video con quello di uno o più competitor per ottenere un'analisi strategica e una SWOT.")
 
 col1, col2 = st.columns(2)
 video_tuo = col1.file_uploader("Carica il tuo video", key="your_video", type=["mp4", "mov"])
-video_competitor = col2.file_uploader("Carica video del competitor", key="competitor_video", type=["mp4", "mov"])
+video_competitor = col2.file_uploader("Carica i video dei competitor", key="competitor_video", type=["mp4", "mov"],
+                                     accept_multiple_files=True)
 
 st.markdown("---")
 with st.expander("Impostazioni di Analisi (applicate a entrambi)"):
-    paesi = ["Nessuna selezione specifica", "Italia", "Giappone", "Cina", "Stati Uniti", "Arabia Saudita"]
+    mercati = utils.elenca_mercati()
+    utils.mostra_errori_linee_guida()
+    paesi = ["Nessuna selezione specifica"] + mercati
     paese_sel = st.selectbox("Seleziona un mercato di riferimento:", paesi)
     controlli_pers = st.text_area("Aggiungi controlli personalizzati (uno per riga):")
+    forza_analisi = st.checkbox("Ignora i risultati in cache e ripeti l'analisi")
 
 st.markdown("---")
 
-if video_tuo and video_competitor:
-    if st.button("Avvia Analisi Comparativa"):
-        with st.spinner("Analisi comparativa in corso... Potrebbe richiedere più tempo del normale."):
-            file_tuo, file_comp = None, None
-            try:
-                file_tuo = utils.upload_and_process_video(video_tuo, "Il Tuo Video")
-                file_comp = utils.upload_and_process_video(video_competitor, "Video Competitor")
+def _opzioni():
+    return {"paese": paese_sel, "controlli": controlli_pers, "usa_cache": not forza_analisi}
+
+def _esegui_multiplo(lavoro, video, opzioni):
+    """Corpo del lavoro in background: `video` è una lista di tuple (path, nome)."""
+    file_video = [upload_stream.FileConNome(path, nome) for path, nome in video]
+    try:
+        return analisi.analizza_benchmark_multiplo(
+            [(f, nome, None) for f, (_, nome) in zip(file_video, video)],
+            paese=opzioni["paese"],
+            controlli=opzioni["controlli"],
+            usa_cache=opzioni["usa_cache"],
+        )
+    finally:
+        for f in file_video:
+            f.close()
+
+def _esegui_benchmark(lavoro, video, opzioni):
+    (path_tuo, nome_tuo), (path_comp, nome_comp) = video
+    with upload_stream.FileConNome(path_tuo, nome_tuo) as tuo, upload_stream.FileConNome(path_comp, nome_comp) as comp:
+        return analisi.analizza_benchmark(
+            tuo,
+            comp,
+            paese=opzioni["paese"],
+            controlli=opzioni["controlli"],
+            usa_cache=opzioni["usa_cache"],
+        )
 
-                if file_tuo and file_comp:
-                    prompt_completo = f"""
-                    Sei Ad-Visor, un Senior Marketing Strategist. Hai due video da analizzare: "Il Tuo Video" e "Video del Competitor".
-                    La tua risposta DEVE essere unicamente un blocco JSON valido.
+def _avvia(tipo, descrizione, funzione, caricati, nomi):
+    """Copia i video caricati per il lavoro e lo avvia in background."""
+    paths = [lavori.copia_upload(f) for f in caricati]
+    utils.avvia_lavoro(tipo, descrizione, funzione, list(zip(paths, nomi)), _opzioni(),
+                       parametri={"nomi": nomi}, file_temporanei=paths)
+    st.rerun()
 
-                    STRUTTURA JSON RICHIESTA:
-                    {{
-                        "analisi_tuo_video": {{"verdetto_complessivo": "...", "motivazione_verdetto": "..."}},
-                        "analisi_video_competitor": {{"verdetto_complessivo": "...", "motivazione_verdetto": "..."}},
-                        "tabella_comparativa": [
-                            {{"caratteristica": "Logo/Brand visibile e riconoscibile", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Call-to-Action chiara e specifica", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Hook iniziale coinvolgente (primi 3 sec)", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Storytelling/Narrativa strutturata", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Testimonial/Persone reali", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Dimostrazione prodotto/servizio", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Sottotitoli/Testo sovrapposto", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Musica/Audio di qualità", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Qualità video professionale", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Elementi di scarsità/urgenza", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Benefici chiari del prodotto", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Riprova sociale (recensioni/numeri)", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Finale memorabile/impattante", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Adatto al target demografico", "tuo_video": true/false, "competitor": true/false}},
-                            {{"caratteristica": "Ottimizzato per mobile/social", "tuo_video": true/false, "competitor": true/false}}
-                        ],
-                        "controlli_personalizzati": [
-                            {{"controllo": "...", "tuo_video": "OK|ATTENZIONE|CRITICO", "competitor": "OK|ATTENZIONE|CRITICO", "motivazione_tuo": "...", "motivazione_competitor": "..."}}
-                        ],
-                        "analisi_comparativa": {{
-                            "punti_di_forza_tuo": ["Punto di forza 1", "..."],
-                            "aree_di_miglioramento_tuo": ["Debolezza 1", "..."],
-                            "opportunita_mercato": ["Opportunità 1", "..."],
-                            "minacce_competitor": ["Minaccia 1", "..."],
-                            "raccomandazione_strategica": "Consiglio finale..."
-                        }}
-                    }}
-                    
-                    ISTRUZIONI PER L'ANALISI:
-                    1. **Analisi Generale:** Valuta aspetti culturali, DE&I e rischi generali per entrambi i video.
-                    2. **Analisi Specifica per Paese:** Se richiesta, applica le linee guida culturali fornite.
-                    3. **Controlli Personalizzati:** Se specificati, verificali esplicitamente per entrambi i video e includili nella valutazione.
-                    4. **Confronto Strategico:** Identifica vantaggi competitivi e aree di miglioramento.
-                    
-                    INFO PER L'ANALISI:
-                    - Mercato Target: {paese_sel}
-                    - Linee Guida Culturali: {utils.carica_vincoli_culturali(paese_sel) or "Nessuna"}
-                    - Controlli Personalizzati: {controlli_pers or "Nessuno"}
+def _mostra_esito(lavoro):
+    """Risultato di un lavoro concluso, mostrato subito a ogni rerun finché la pagina resta collegata."""
+    if lavoro.stato == lavori.ERRORE:
+        if isinstance(lavoro.errore, poller.ElaborazioneFallita):
+            st.error(f"Elaborazione del video fallita: {lavoro.errore}")
+        else:
+            st.error(f"Si è verificato un errore durante l'analisi: {lavoro.errore}")
+        return
+    esito = lavoro.esito
+    if lavoro.tipo == "benchmark_multiplo":
+        # I risultati sono per posizione del video: le etichette servono solo a mostrarli.
+        etichette = esito["etichette"]
+        if 0 not in esito["estrazioni"]:
+            st.error(f"Analisi del tuo video non riuscita: {esito['errori'].get(0, 'errore sconosciuto')}")
+            return
+        st.success(
+            f"Analisi comparativa completata in {esito['tempi']['totale_s']:.1f}s! "
+            f"Richieste al modello: {esito['richieste_eseguite']} su {len(etichette)} video."
+        )
+        utils.visualizza_benchmark_multiplo({etichette[i]: dati for i, dati in esito["estrazioni"].items()},
+                                            etichette[0], {etichette[i]: e for i, e in esito["errori"].items()})
+        return
+    if esito["da_cache"]:
+        st.success("Analisi comparativa completata! (risultato recuperato dalla cache)")
+    else:
+        tempi_tuo, tempi_comp = esito["tempi_video"]
+        st.dataframe(esito["tempi_video"], hide_index=True)
+        st.caption(
+            f"Preparazione dei video in {esito['tempi']['preparazione_s']:.1f}s "
+            f"(somma dei singoli video: {tempi_tuo['totale_s'] + tempi_comp['totale_s']:.1f}s)"
+        )
+        st.success("Analisi comparativa completata!")
+    if esito["sezioni_riparate"]:
+        st.info(f"🩹 Richieste di nuovo solo le parti non valide: {', '.join(esito['sezioni_riparate'])}")
+    for sezione, errori in esito["errori_sezioni"].items():
+        st.warning(f"Sezione '{sezione}' non valida: {'; '.join(errori[:2])}")
+    utils.visualizza_risultati_benchmark(esito["risultato"])
+
+if video_tuo and len(video_competitor) > 1:
+    st.caption("Con più competitor ogni video viene analizzato una sola volta e il confronto è calcolato localmente.")
+    if st.button("Avvia Analisi Comparativa"):
+        _avvia("benchmark_multiplo", f"Analisi di {len(video_competitor) + 1} video", _esegui_multiplo,
+               [video_tuo] + video_competitor, ["Il Tuo Video"] + [v.name for v in video_competitor])
+
+elif video_tuo and video_competitor:
+    video_competitor = video_competitor[0]
+    if st.button("Avvia Analisi Comparativa"):
+        _avvia("benchmark", "Analisi comparativa", _esegui_benchmark,
+               [video_tuo, video_competitor], [video_tuo.name, video_competitor.name])
 
-                    Analizza entrambi i video considerando tutti i parametri sopra e fornisci il report comparativo JSON.
-                    """
-                    
-                    model = genai.GenerativeModel(model_name="gemini-flash-latest")
-                    response = model.generate_content(
-                        [prompt_completo, "Il Tuo Video:", file_tuo, "Video del Competitor:", file_comp], 
-                        request_options={'timeout': 900}
-                    )
-                    
-                    clean_response_text = response.text.strip().replace("```json", "").replace("```", "")
-                    st.success("Analisi comparativa completata!")
-                    utils.visualizza_risultati_benchmark(clean_response_text)
+# Il lavoro sopravvive ai rerun e al refresh: la pagina si ricollega tramite l'id salvato.
+lavoro = utils.lavoro_corrente(TIPI_LAVORO)
+if lavoro is not None and not lavoro.concluso:
+    utils.mostra_avanzamento_lavoro(lavoro.id)
+elif lavoro is not None:
+    st.caption(f"Analisi avviata alle {time.strftime('%H:%M:%S', time.localtime(lavoro.creato))} "
+               f"e completata in {lavoro.durata():.1f}s.")
+    if st.button("Chiudi i risultati"):
+        utils.chiudi_lavoro(lavoro)
+        st.rerun()
+    with tracciamento.span("rendering", tipo=lavoro.tipo):
+        _mostra_esito(lavoro)
 
-            except Exception as e:
-                st.error(f"Si è verificato un errore durante l'analisi: {e}")
-            finally:
-                if file_tuo: genai.delete_file(file_tuo.name)
-                if file_comp: genai.delete_file(file_comp.name)
\ No newline at end of file
+utils.mostra_statistiche_cache()
+utils.chiudi_pagina(pagina, lavoro)
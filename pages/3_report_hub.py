@@ -1,8 +1,176 @@
-# pages/3_Report_Hub_(Disabilitato).py
+# pages/3_Report_Hub.py
+import datetime
 import streamlit as st
+import store
+import utils
 
 st.set_page_config(page_title="Report Hub", page_icon="📊")
 
 st.header("📊 Report Hub")
-st.warning("Questa funzionalità non è ancora attiva.")
-st.info("Qui potrai visualizzare e gestire i report delle analisi precedenti.")
\ No newline at end of file
+st.write("Consulta le analisi eseguite con Video Checker e Competitive Benchmark.")
+
+archivio = store.get_default_store()
+RISULTATI_PER_PAGINA = 25
+
+tab_archivio, tab_ricerca, tab_statistiche = st.tabs(["🗂️ Archivio", "🔎 Ricerca", "📈 Statistiche"])
+
+with tab_archivio:
+    with st.expander("Filtri", expanded=True):
+        col1, col2, col3 = st.columns(3)
+        tipo = col1.selectbox("Strumento", ["Tutti", "checker", "benchmark"])
+        mercato = col2.selectbox("Mercato", ["Tutti"] + archivio.valori_distinti("mercato"))
+        verdetto = col3.selectbox("Verdetto", ["Tutti", "CONSIGLIATO", "CONSIGLIATO_CON_RISERVA", "NON_CONSIGLIATO"])
+        col4, col5 = st.columns(2)
+        dal = col4.date_input("Dal", value=None)
+        al = col5.date_input("Al", value=None)
+
+    filtri = {
+        "tipo": None if tipo == "Tutti" else tipo,
+        "mercato": None if mercato == "Tutti" else mercato,
+        "verdetto": None if verdetto == "Tutti" else verdetto,
+        "dal": dal.isoformat() if dal else None,
+        "al": (al + datetime.timedelta(days=1)).isoformat() if al else None,
+    }
+
+    # Cursori delle pagine visitate: cambiando i filtri si riparte dalla prima pagina.
+    if st.session_state.get("report_hub_filtri") != filtri:
+        st.session_state["report_hub_filtri"] = filtri
+        st.session_state["report_hub_cursori"] = [None]
+    cursori = st.session_state["report_hub_cursori"]
+
+    totale = archivio.conta(filtri)
+    righe, prossimo = archivio.pagina(filtri, limite=RISULTATI_PER_PAGINA, cursore=cursori[-1])
+
+    if not totale:
+        st.info("Nessuna analisi trovata. Le analisi eseguite vengono salvate automaticamente qui.")
+    else:
+        st.caption(f"{totale} analisi · pagina {len(cursori)} di {-(-totale // RISULTATI_PER_PAGINA)}")
+        st.dataframe(
+            [
+                {
+                    "ID": r["id"],
+                    "Data (UTC)": r["creato"],
+                    "Strumento": r["tipo"],
+                    "Video": r["video_nome"] or r["video_hash"][:12],
+                    "Mercato": r["mercato"] or "—",
+                    "Verdetto": r["verdetto"] or "N/D",
+                }
+                for r in righe
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )
+
+        nav1, nav2 = st.columns(2)
+        if nav1.button("⬅️ Pagina precedente", disabled=len(cursori) == 1):
+            cursori.pop()
+            st.rerun()
+        if nav2.button("Pagina successiva ➡️", disabled=prossimo is None):
+            cursori.append(prossimo)
+            st.rerun()
+
+        st.markdown("---")
+        selezionato = st.selectbox(
+            "Apri un report:",
+            [r["id"] for r in righe],
+            format_func=lambda i: next(f"#{r['id']} · {r['creato']} · {r['video_nome'] or r['video_hash'][:12]}"
+                                       for r in righe if r["id"] == i),
+        )
+        if selezionato is not None:
+            dettaglio = archivio.dettaglio(selezionato)
+            if dettaglio["tipo"] == "benchmark":
+                utils.visualizza_risultati_benchmark(dettaglio["risultato"])
+            else:
+                utils.visualizza_risultati_checker(dettaglio["risultato"])
+            with st.expander("Impostazioni e tempi"):
+                st.json({"impostazioni": dettaglio["impostazioni"], "tempi": dettaglio["tempi"]})
+
+with tab_ricerca:
+    testo_ricerca = st.text_input("Cerca nelle motivazioni, nelle voci della checklist e nelle notizie:",
+                                  placeholder="Esempio: simboli religiosi")
+    col1, col2, col3, col4, col5 = st.columns(5)
+    ricerca_dal = col4.date_input("Dal", value=None, key="ricerca_dal")
+    ricerca_al = col5.date_input("Al", value=None, key="ricerca_al")
+    filtri_ricerca = {
+        "dal": ricerca_dal.isoformat() if ricerca_dal else None,
+        "al": (ricerca_al + datetime.timedelta(days=1)).isoformat() if ricerca_al else None,
+    }
+    if testo_ricerca:
+        # Le faccette mostrano il numero di risultati per valore, dati gli altri filtri.
+        for colonna, etichetta, col in (("mercato", "Mercato", col1), ("status", "Status", col2),
+                                        ("categoria", "Categoria", col3)):
+            conteggi = archivio.facette(testo_ricerca, colonna, filtri_ricerca)
+            scelta = col.selectbox(etichetta, [None] + list(conteggi),
+                                   format_func=lambda v, c=conteggi: "Tutti" if v is None else f"{v} ({c[v]})",
+                                   key=f"faccetta_{colonna}")
+            filtri_ricerca[colonna] = scelta
+
+        risultati_ricerca = archivio.cerca(testo_ricerca, filtri_ricerca, limite=50)
+        if not risultati_ricerca:
+            st.info("Nessun risultato.")
+        for r in risultati_ricerca:
+            st.markdown(
+                f"**#{r['analisi_id']}** · {r['creato']} · {r['mercato'] or '—'} · "
+                f"{r['categoria'] or ''} · `{r['status'] or ''}`  \n{r['estratto']}"
+            )
+
+with tab_statistiche:
+    # pandas e pyarrow si caricano solo quando le statistiche vengono richieste.
+    if st.toggle("Calcola le statistiche", key="statistiche_attive"):
+        import colonnare
+
+        # Tabelle colonnari in memoria: a ogni run si aggiungono solo le analisi nuove.
+        esportatore = colonnare.get_default_esportatore()
+        tabelle = esportatore.tabelle()
+        col1, col2, col3 = st.columns(3)
+        mercati = sorted(tabelle["analisi"]["mercato"].dropna().unique())
+        stat_mercato = col1.selectbox("Mercato", ["Tutti"] + list(mercati), key="statistiche_mercato")
+        stat_dal = col2.date_input("Dal", value=None, key="statistiche_dal")
+        stat_al = col3.date_input("Al", value=None, key="statistiche_al")
+        dati = colonnare.filtra(
+            tabelle,
+            mercato=None if stat_mercato == "Tutti" else stat_mercato,
+            dal=stat_dal,
+            al=stat_al + datetime.timedelta(days=1) if stat_al else None,
+        )
+        analisi_filtrate = dati["analisi"]
+        if analisi_filtrate.empty:
+            st.info("Nessuna analisi nel periodo selezionato.")
+        else:
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Analisi", len(analisi_filtrate))
+            m2.metric("Video Checker", int((analisi_filtrate["tipo"] == "checker").sum()))
+            m3.metric("Benchmark", int((analisi_filtrate["tipo"] == "benchmark").sum()))
+
+            st.subheader("Verdetti per mercato")
+            verdetti = colonnare.distribuzione_verdetti(analisi_filtrate)
+            if verdetti.empty:
+                st.caption("Nessuna analisi del Video Checker.")
+            else:
+                st.bar_chart(verdetti)
+                st.dataframe(verdetti, use_container_width=True)
+
+            st.subheader("Categorie più spesso CRITICHE")
+            critiche = colonnare.categorie_critiche(dati["checklist"], analisi_filtrate)
+            if critiche.empty:
+                st.caption("Nessuna voce CRITICO.")
+            else:
+                st.bar_chart(critiche["voci"])
+                st.dataframe(critiche, use_container_width=True)
+
+            st.subheader("Copertura delle fasi AIDA")
+            aida = colonnare.copertura_aida(dati["aida"])
+            if aida.empty:
+                st.caption("Nessuna analisi con l'Analisi dell'Efficacia Persuasiva.")
+            else:
+                st.caption(f"Percentuale delle {dati['aida']['analisi_id'].nunique()} analisi persuasive in cui la fase è presente.")
+                st.bar_chart(aida)
+
+            st.subheader("Caratteristiche in cui il tuo video batte il competitor")
+            vantaggi = colonnare.vantaggi_caratteristiche(dati["caratteristiche"])
+            if vantaggi.empty:
+                st.caption("Nessun Competitive Benchmark.")
+            else:
+                st.bar_chart(vantaggi[["vantaggio_%", "svantaggio_%"]])
+                st.dataframe(vantaggi, use_container_width=True)
+        st.caption(f"Dati colonnari (Parquet) in `{esportatore.cartella}`, aggiornati a ogni nuova analisi.")
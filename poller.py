@@ -0,0 +1,171 @@
+# poller.py
+"""
+Servizio condiviso che attende la fine del PROCESSING dei file remoti.
+Un solo thread in background controlla tutti gli upload in attesa, con
+intervalli adattivi (controlli rapidi all'inizio, poi sempre più distanziati)
+e una scadenza massima; le sessioni attendono tramite future o asyncio.
+"""
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+
+# Anticipo con cui un controllo quasi dovuto viene unito a quello in corso,
+# così i file caricati insieme finiscono nella stessa list_files.
+ANTICIPO_S = 0.1
+
+
+class ElaborazioneFallita(Exception):
+    """Il file remoto è terminato in stato FAILED."""
+
+
+class _Attesa:
+    def __init__(self, file_remoto, scadenza, intervallo):
+        self.file_remoto = file_remoto
+        self.scadenza = scadenza
+        self.intervallo = intervallo
+        self.prossimo_controllo = time.monotonic() + intervallo
+        self.futures = []
+
+
+class ProcessingPoller:
+    def __init__(self, file_api, intervallo_iniziale=0.5, fattore=1.6, intervallo_max=5.0,
+                 timeout=600, soglia_batch=4):
+        self.file_api = file_api
+        self.intervallo_iniziale = intervallo_iniziale
+        self.fattore = fattore
+        self.intervallo_max = intervallo_max
+        self.timeout = timeout
+        self.soglia_batch = soglia_batch
+        self._attese = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._controlli = 0
+
+    def watch(self, file_remoto, timeout=None):
+        """
+        Restituisce un Future risolto con il file ACTIVE, oppure con
+        ElaborazioneFallita / TimeoutError. Più richieste sullo stesso file
+        condividono lo stesso controllo.
+        """
+        future = concurrent.futures.Future()
+        stato = file_remoto.state.name
+        if stato == "ACTIVE":
+            future.set_result(file_remoto)
+            return future
+        if stato == "FAILED":
+            future.set_exception(ElaborazioneFallita(file_remoto.name))
+            return future
+
+        scadenza = time.monotonic() + (timeout or self.timeout)
+        with self._cond:
+            attesa = self._attese.get(file_remoto.name)
+            if attesa is None:
+                attesa = _Attesa(file_remoto, scadenza, self.intervallo_iniziale)
+                self._attese[file_remoto.name] = attesa
+            else:
+                attesa.scadenza = max(attesa.scadenza, scadenza)
+            attesa.futures.append(future)
+            self._ensure_thread()
+            self._cond.notify()
+        return future
+
+    def wait(self, file_remoto, timeout=None):
+        """Attende in modo bloccante (senza polling nel thread chiamante)."""
+        return self.watch(file_remoto, timeout).result()
+
+    async def wait_async(self, file_remoto, timeout=None):
+        return await asyncio.wrap_future(self.watch(file_remoto, timeout))
+
+    def stats(self):
+        with self._cond:
+            return {"in_attesa": len(self._attese), "controlli": self._controlli}
+
+    # --- Thread di background ---
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="advisor-poller", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._attese:
+                    self._cond.wait()
+                ora = time.monotonic()
+                prossimo = min(a.prossimo_controllo for a in self._attese.values())
+                if prossimo > ora:
+                    self._cond.wait(prossimo - ora)
+                    continue
+                dovuti = [a for a in self._attese.values() if a.prossimo_controllo <= ora + ANTICIPO_S]
+            self._controlla(dovuti)
+
+    def _stati_aggiornati(self, dovuti):
+        """Legge lo stato dei file dovuti: con molti file in attesa usa una sola list_files."""
+        if len(dovuti) >= self.soglia_batch:
+            nomi = {a.file_remoto.name for a in dovuti}
+            try:
+                aggiornati = {f.name: f for f in self.file_api.list_files() if f.name in nomi}
+                self._controlli += 1
+                return aggiornati
+            except Exception:
+                pass
+        aggiornati = {}
+        for attesa in dovuti:
+            try:
+                aggiornati[attesa.file_remoto.name] = self.file_api.get_file(attesa.file_remoto.name)
+            except Exception as e:
+                aggiornati[attesa.file_remoto.name] = e
+            self._controlli += 1
+        return aggiornati
+
+    def _controlla(self, dovuti):
+        aggiornati = self._stati_aggiornati(dovuti)
+        ora = time.monotonic()
+        completati = []
+        with self._cond:
+            for attesa in dovuti:
+                nome = attesa.file_remoto.name
+                esito = aggiornati.get(nome)
+                if isinstance(esito, Exception):
+                    completati.append((attesa, None, esito))
+                elif esito is not None and esito.state.name == "ACTIVE":
+                    completati.append((attesa, esito, None))
+                elif esito is not None and esito.state.name == "FAILED":
+                    completati.append((attesa, None, ElaborazioneFallita(nome)))
+                elif ora >= attesa.scadenza:
+                    completati.append((attesa, None, TimeoutError(f"Elaborazione di {nome} oltre il tempo massimo")))
+                else:
+                    if esito is not None:
+                        attesa.file_remoto = esito
+                    attesa.intervallo = min(self.intervallo_max, attesa.intervallo * self.fattore)
+                    attesa.prossimo_controllo = ora + attesa.intervallo
+            for attesa, _, _ in completati:
+                self._attese.pop(attesa.file_remoto.name, None)
+        for attesa, risultato, errore in completati:
+            for future in attesa.futures:
+                if future.done():
+                    continue
+                if errore is not None:
+                    future.set_exception(errore)
+                else:
+                    future.set_result(risultato)
+
+
+_default_poller = None
+_default_lock = threading.Lock()
+
+
+def get_default_poller():
+    """Poller condiviso da tutte le sessioni del processo."""
+    global _default_poller
+    with _default_lock:
+        if _default_poller is None:
+            import backend
+            _default_poller = ProcessingPoller(
+                backend.get_default_backend(),
+                timeout=float(os.getenv("ADVISOR_PROCESSING_TIMEOUT", "600")),
+            )
+        return _default_poller
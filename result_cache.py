@@ -0,0 +1,191 @@
+# result_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Incrementare quando cambiano i prompt: invalida i risultati salvati in precedenza.
+PROMPT_VERSION = 2
+
+
+def normalizza_controlli(controlli_pers):
+    """Normalizza i controlli personalizzati: una riga per controllo, senza spazi superflui né righe vuote."""
+    if not controlli_pers:
+        return ""
+    righe = [" ".join(riga.split()) for riga in controlli_pers.splitlines()]
+    return "\n".join(riga for riga in righe if riga)
+
+
+def normalizza_paese(paese):
+    """Restituisce None quando non è selezionato alcun mercato specifico."""
+    if not paese or paese == "Nessuna selezione specifica":
+        return None
+    return paese
+
+
+def make_key(tipo, video_hashes, **parametri):
+    """
+    Calcola la chiave della cache a partire dagli hash dei video (in ordine)
+    e dai parametri normalizzati del prompt.
+    """
+    payload = {
+        "tipo": tipo,
+        "versione_prompt": PROMPT_VERSION,
+        "video": list(video_hashes),
+        "parametri": parametri,
+    }
+    serializzato = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serializzato.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache persistente su disco dei risultati di analisi, indirizzata per contenuto.
+    Ogni voce è un file JSON. Una voce scade `ttl_seconds` dopo la creazione
+    (i risultati invecchiano, es. le notizie recenti): le voci scadute vengono
+    scartate alla lettura e all'eviction; oltre la dimensione massima vengono
+    rimosse le meno usate di recente (data di modifica del file, aggiornata a
+    ogni lettura). La cartella è condivisa con gli altri processi (CLI batch,
+    servizio HTTP): l'indice viene riallineato al disco a ogni scrittura, a
+    ogni miss e, per le statistiche, al massimo ogni `intervallo_scansione` secondi.
+    """
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, ttl_seconds=7 * 24 * 3600, intervallo_scansione=30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.intervallo_scansione = intervallo_scansione
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        # Indice in memoria: chiave -> (dimensione, ultimo accesso, creazione o None se non ancora letta)
+        self._index = {}
+        self._ultima_scansione = 0.0
+        self._scansiona_locked()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _scansiona_locked(self):
+        """Ricostruisce l'indice dai file presenti, comprese le voci scritte da altri processi."""
+        indice = {}
+        for nome in os.listdir(self.directory):
+            if nome.endswith(".json"):
+                try:
+                    st_file = os.stat(os.path.join(self.directory, nome))
+                except OSError:
+                    continue
+                key = nome[:-5]
+                creato = self._index[key][2] if key in self._index else None
+                indice[key] = (st_file.st_size, st_file.st_mtime, creato)
+        self._index = indice
+        self._ultima_scansione = time.time()
+
+    def _remove(self, key):
+        self._index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _scaduta(self, creato, ora):
+        return creato is not None and ora - creato > self.ttl_seconds
+
+    def get(self, key):
+        """Restituisce il risultato salvato oppure None (miss, voce scaduta o illeggibile)."""
+        with self._lock:
+            if key not in self._index:
+                # Può essere stata scritta da un altro processo dopo l'ultima scansione.
+                try:
+                    st_file = os.stat(self._path(key))
+                except OSError:
+                    self._misses += 1
+                    return None
+                self._index[key] = (st_file.st_size, st_file.st_mtime, None)
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    voce = json.load(f)
+            except (OSError, ValueError):
+                self._remove(key)
+                self._misses += 1
+                return None
+            ora = time.time()
+            creato = voce.get("creato", 0)
+            if self._scaduta(creato, ora):
+                self._remove(key)
+                self._evictions += 1
+                self._misses += 1
+                return None
+            try:
+                os.utime(self._path(key), (ora, ora))
+            except OSError:
+                pass
+            self._index[key] = (self._index[key][0], ora, creato)
+            self._hits += 1
+            return voce.get("valore")
+
+    def put(self, key, valore, meta=None):
+        """Salva un risultato (stringa) ed esegue l'eviction se si supera la dimensione massima."""
+        creato = time.time()
+        voce = {"creato": creato, "meta": meta or {}, "valore": valore}
+        dati = json.dumps(voce, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(dati)
+            os.replace(tmp_path, self._path(key))
+            ora = time.time()
+            os.utime(self._path(key), (ora, ora))
+            self._scansiona_locked()
+            self._index[key] = (len(dati), ora, creato)
+            self._evict_locked()
+
+    def _evict_locked(self):
+        ora = time.time()
+        totale = sum(size for size, _, _ in self._index.values())
+        for key, (size, _, creato) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if not self._scaduta(creato, ora) and totale <= self.max_bytes:
+                continue
+            self._remove(key)
+            self._evictions += 1
+            totale -= size
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+
+    def stats(self):
+        """Statistiche di utilizzo della cache (hit/miss del processo corrente e occupazione su disco)."""
+        with self._lock:
+            if time.time() - self._ultima_scansione >= self.intervallo_scansione:
+                self._scansiona_locked()
+            richieste = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / richieste if richieste else 0.0,
+                "evictions": self._evictions,
+                "voci": len(self._index),
+                "bytes": sum(size for size, _, _ in self._index.values()),
+            }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Restituisce la cache condivisa dal processo, configurata tramite variabili d'ambiente."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache(
+                directory=os.path.join(os.getenv("ADVISOR_CACHE_DIR", ".advisor_cache"), "results"),
+                max_bytes=int(float(os.getenv("ADVISOR_CACHE_MAX_MB", "200")) * 1024 * 1024),
+                ttl_seconds=int(float(os.getenv("ADVISOR_CACHE_TTL_HOURS", "168")) * 3600),
+            )
+        return _default_cache
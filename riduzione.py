@@ -0,0 +1,200 @@
+# riduzione.py
+"""
+Riduzione dei video prima dell'upload: i master (4K, ProRes, centinaia di MB)
+vengono ricodificati in un proxy compatto con risoluzione e frame rate ridotti,
+secondo un preset. Gemini campiona comunque il video a circa 1 fotogramma al
+secondo, quindi un proxy a 720p/15fps conserva quasi tutta l'informazione utile
+riducendo drasticamente i tempi di upload e di processamento remoto.
+
+I proxy sono salvati su disco per hash del sorgente e preset, e vengono
+riutilizzati finché non superano il limite di spazio (eliminazione dei meno
+recenti). Le statistiche per preset (byte risparmiati, tempi di codifica e
+latenza complessiva) permettono di confrontare qualità e velocità.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+import tracciamento
+import segmenti
+import upload_stream
+
+NESSUNA_RIDUZIONE = "originale"
+
+# altezza: risoluzione verticale massima; fps: frame rate del proxy;
+# crf: qualità x264 (più alto = più compatto); audio: bitrate AAC mono, None per rimuoverlo.
+PRESET = {
+    NESSUNA_RIDUZIONE: None,
+    "qualita": {"altezza": 1080, "fps": 24, "crf": 23, "audio": "128k"},
+    "bilanciato": {"altezza": 720, "fps": 15, "crf": 28, "audio": "96k"},
+    "rapido": {"altezza": 480, "fps": 10, "crf": 32, "audio": "64k"},
+    "senza_audio": {"altezza": 720, "fps": 15, "crf": 28, "audio": None},
+}
+
+
+def preset_configurato():
+    """Preset predefinito, da ADVISOR_PROXY_PRESET (default: nessuna riduzione)."""
+    preset = os.getenv("ADVISOR_PROXY_PRESET", NESSUNA_RIDUZIONE)
+    return preset if preset in PRESET else NESSUNA_RIDUZIONE
+
+
+def hash_proxy(source_hash, preset):
+    """Hash che identifica il proxy: i risultati di un proxy non si confondono con quelli del master."""
+    parametri = json.dumps(PRESET[preset], sort_keys=True)
+    return hashlib.sha256(f"{source_hash}:proxy:{preset}:{parametri}".encode("utf-8")).hexdigest()
+
+
+def comando_ffmpeg(ingresso, uscita, parametri):
+    comando = [
+        segmenti.trova_eseguibile("ffmpeg"), "-v", "error", "-y", "-i", ingresso,
+        "-vf", f"scale=-2:'min({parametri['altezza']},ih)',fps={parametri['fps']}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(parametri["crf"]), "-pix_fmt", "yuv420p",
+    ]
+    if parametri["audio"]:
+        comando += ["-c:a", "aac", "-b:a", parametri["audio"], "-ac", "1"]
+    else:
+        comando += ["-an"]
+    return comando + ["-movflags", "+faststart", uscita]
+
+
+class ProxyCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lock_per_chiave = {}
+        self._in_uso = {}
+        self._stats = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, chiave):
+        return os.path.join(self.directory, f"{chiave}.mp4")
+
+    def _lock_chiave(self, chiave):
+        with self._lock:
+            return self._lock_per_chiave.setdefault(chiave, threading.Lock())
+
+    def prepara(self, sorgente, source_hash, preset):
+        """
+        Restituisce (file-like da caricare, hash da usare per registro e cache, report).
+        Con il preset "originale", o se il proxy non risulta più piccolo del
+        sorgente, restituisce il sorgente stesso.
+        """
+        dimensione_originale = upload_stream.dimensione(sorgente)
+        report = {"preset": preset, "bytes_originale": dimensione_originale, "bytes_caricati": dimensione_originale,
+                  "riduzione_s": 0.0, "proxy_da_cache": False}
+        if PRESET.get(preset) is None:
+            return sorgente, source_hash, report
+
+        inizio = time.perf_counter()
+        chiave = hash_proxy(source_hash, preset)
+        path = self._path(chiave)
+        nome_proxy = os.path.splitext(os.path.basename(getattr(sorgente, "name", "video")))[0] + ".mp4"
+        with self._lock:
+            self._in_uso[chiave] = self._in_uso.get(chiave, 0) + 1
+        try:
+            with tracciamento.span("riduzione", preset=preset) as attributi, self._lock_chiave(chiave):
+                if os.path.exists(path):
+                    os.utime(path)
+                    report["proxy_da_cache"] = attributi["da_cache"] = True
+                else:
+                    nome = getattr(sorgente, "name", "video.mp4")
+                    temporaneo = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+                    try:
+                        with upload_stream.file_temporaneo(sorgente, os.path.splitext(nome)[1]) as ingresso:
+                            subprocess.run(comando_ffmpeg(ingresso, temporaneo, PRESET[preset]),
+                                           capture_output=True, check=True)
+                        os.replace(temporaneo, path)
+                    finally:
+                        if os.path.exists(temporaneo):
+                            os.remove(temporaneo)
+                # Il proxy si apre mentre è escluso dall'eviction: dopo, rimuoverlo non tocca il file aperto.
+                proxy = upload_stream.FileConNome(path, nome_proxy)
+        finally:
+            with self._lock:
+                self._in_uso[chiave] -= 1
+                if not self._in_uso[chiave]:
+                    del self._in_uso[chiave]
+        self._evict()
+        report["riduzione_s"] = round(time.perf_counter() - inizio, 2)
+
+        dimensione_proxy = os.fstat(proxy.fileno()).st_size
+        if dimensione_proxy >= dimensione_originale:
+            proxy.close()
+            report["proxy_non_conveniente"] = True
+            return sorgente, source_hash, report
+        report["bytes_caricati"] = dimensione_proxy
+        return proxy, chiave, report
+
+    def _evict(self):
+        voci = []
+        for nome in os.listdir(self.directory):
+            if nome.endswith(".mp4") and ".tmp." not in nome:
+                try:
+                    stat = os.stat(os.path.join(self.directory, nome))
+                except FileNotFoundError:
+                    continue
+                voci.append((stat.st_mtime, stat.st_size, nome))
+        totale = sum(size for _, size, _ in voci)
+        for _, size, nome in sorted(voci):
+            if totale <= self.max_bytes:
+                break
+            with self._lock:
+                # I proxy che un'altra analisi sta preparando o aprendo restano.
+                if nome[:-len(".mp4")] in self._in_uso:
+                    continue
+                try:
+                    os.remove(os.path.join(self.directory, nome))
+                except FileNotFoundError:
+                    pass
+            totale -= size
+
+    def registra(self, report, tempi):
+        """Aggiunge alle statistiche per preset l'esito di un'analisi con i tempi restituiti da `analisi`."""
+        with self._lock:
+            s = self._stats.setdefault(report["preset"], {
+                "analisi": 0, "bytes_originale": 0, "bytes_caricati": 0,
+                "riduzione_s": 0.0, "upload_processamento_s": 0.0, "totale_s": 0.0,
+            })
+            s["analisi"] += 1
+            s["bytes_originale"] += report["bytes_originale"]
+            s["bytes_caricati"] += report["bytes_caricati"]
+            s["riduzione_s"] += report["riduzione_s"]
+            s["upload_processamento_s"] += tempi.get("upload_s", 0) + tempi.get("processamento_s", 0)
+            s["totale_s"] += report["riduzione_s"] + tempi.get("totale_s", 0)
+
+    def stats(self):
+        """Medie per preset, per confrontare i byte risparmiati con la latenza complessiva."""
+        with self._lock:
+            righe = []
+            for preset, s in self._stats.items():
+                n = s["analisi"]
+                righe.append({
+                    "preset": preset,
+                    "analisi": n,
+                    "mb_caricati_medi": round(s["bytes_caricati"] / n / (1024 * 1024), 1),
+                    "risparmio_percento": round(100 * (1 - s["bytes_caricati"] / s["bytes_originale"]), 1)
+                    if s["bytes_originale"] else 0.0,
+                    "riduzione_s_media": round(s["riduzione_s"] / n, 2),
+                    "upload_processamento_s_medio": round(s["upload_processamento_s"] / n, 2),
+                    "totale_s_medio": round(s["totale_s"] / n, 2),
+                })
+            return righe
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_proxy_cache():
+    """Restituisce la cache dei proxy condivisa dal processo, configurata tramite variabili d'ambiente."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ProxyCache(
+                directory=os.path.join(os.getenv("ADVISOR_CACHE_DIR", ".advisor_cache"), "proxy"),
+                max_bytes=int(float(os.getenv("ADVISOR_PROXY_MAX_MB", "2048")) * 1024 * 1024),
+            )
+        return _default_cache
@@ -0,0 +1,205 @@
+# schemi.py
+"""
+Schemi delle risposte JSON del modello, usati in due modi:
+- come `response_schema` della richiesta, così il modello produce JSON già
+  conforme (niente delimitatori markdown, enum rispettati);
+- per validare la risposta e individuare le sezioni difettose, in modo che
+  venga richiesta di nuovo solo la parte rotta e non l'intera analisi.
+
+Gli schemi seguono il sottoinsieme OpenAPI accettato da Gemini (type, enum,
+properties, required, items).
+"""
+import threading
+import prompts
+
+STRINGA = {"type": "STRING"}
+BOOLEANO = {"type": "BOOLEAN"}
+NUMERO = {"type": "NUMBER"}
+LISTA_STRINGHE = {"type": "ARRAY", "items": STRINGA}
+
+
+def _enum(*valori):
+    return {"type": "STRING", "enum": list(valori)}
+
+
+def _oggetto(proprieta, obbligatorie=None):
+    return {
+        "type": "OBJECT",
+        "properties": proprieta,
+        "required": list(proprieta) if obbligatorie is None else obbligatorie,
+    }
+
+
+def _lista(elemento):
+    return {"type": "ARRAY", "items": elemento}
+
+
+VERDETTO = _enum("CONSIGLIATO", "CONSIGLIATO_CON_RISERVA", "NON_CONSIGLIATO")
+STATUS = _enum("OK", "ATTENZIONE", "CRITICO")
+
+VOCE_CHECKLIST = _oggetto({
+    "categoria": STRINGA,
+    "punto_analizzato": STRINGA,
+    "status": STATUS,
+    "motivazione": STRINGA,
+})
+
+BASE = _oggetto({
+    "verdetto_complessivo": VERDETTO,
+    "motivazione_verdetto": STRINGA,
+    "checklist_analisi": _lista(VOCE_CHECKLIST),
+})
+
+SEGMENTO = _oggetto({
+    "verdetto_complessivo": VERDETTO,
+    "motivazione_verdetto": STRINGA,
+    "checklist_analisi": _lista(_oggetto(dict(VOCE_CHECKLIST["properties"], inizio_s=NUMERO, fine_s=NUMERO))),
+})
+
+_FASE_AIDA = _oggetto({"presente": BOOLEANO, "motivazione": STRINGA})
+_PER_PIATTAFORMA = _oggetto({p: LISTA_STRINGHE for p in ("per_facebook", "per_instagram", "per_tiktok", "per_youtube")})
+
+SEZIONI = {
+    "analisi_persuasiva": _oggetto({
+        "modello_aida": _oggetto({fase: _FASE_AIDA for fase in ("attenzione", "interesse", "desiderio", "azione")}),
+    }),
+    "notizie_recenti": _oggetto({
+        "prodotto_identificato": STRINGA,
+        "notizie_rilevanti": _lista(_oggetto({
+            "titolo": STRINGA,
+            "impatto": _enum("POSITIVO", "NEUTRO", "NEGATIVO"),
+            "descrizione": STRINGA,
+            "rilevanza": _enum("ALTA", "MEDIA", "BASSA"),
+        })),
+        "raccomandazioni_strategiche": _oggetto({
+            "timing_lancio": _enum("PROCEDI", "ATTENDI", "MODIFICA_PRIMA"),
+            "modifiche_consigliate": LISTA_STRINGHE,
+            "opportunita_da_sfruttare": LISTA_STRINGHE,
+            "rischi_da_mitigare": LISTA_STRINGHE,
+            "strategia_comunicazione": STRINGA,
+        }),
+    }),
+    "analisi_performance": _oggetto({
+        "previsione_engagement": _oggetto({"livello": _enum("ALTO", "MEDIO", "BASSO"), "motivazione": STRINGA}),
+        "potenziale_virale": _oggetto({"probabilita": _enum("ALTA", "MEDIA", "BASSA"), "fattori_chiave": LISTA_STRINGHE}),
+        "metriche_previste": _oggetto({"view_rate": STRINGA, "completion_rate": STRINGA, "share_potential": STRINGA}),
+        "ottimizzazioni_consigliate": _PER_PIATTAFORMA,
+        "insight_strategici": LISTA_STRINGHE,
+    }),
+}
+
+_ANALISI_VIDEO = _oggetto({"verdetto_complessivo": VERDETTO, "motivazione_verdetto": STRINGA})
+
+BENCHMARK = _oggetto({
+    "analisi_tuo_video": _ANALISI_VIDEO,
+    "analisi_video_competitor": _ANALISI_VIDEO,
+    "tabella_comparativa": _lista(_oggetto({
+        "caratteristica": _enum(*prompts.CARATTERISTICHE_BENCHMARK),
+        "tuo_video": BOOLEANO,
+        "competitor": BOOLEANO,
+    })),
+    "controlli_personalizzati": _lista(_oggetto({
+        "controllo": STRINGA,
+        "tuo_video": STATUS,
+        "competitor": STATUS,
+        "motivazione_tuo": STRINGA,
+        "motivazione_competitor": STRINGA,
+    })),
+    "analisi_comparativa": _oggetto({
+        "punti_di_forza_tuo": LISTA_STRINGHE,
+        "aree_di_miglioramento_tuo": LISTA_STRINGHE,
+        "opportunita_mercato": LISTA_STRINGHE,
+        "minacce_competitor": LISTA_STRINGHE,
+        "raccomandazione_strategica": STRINGA,
+    }),
+}, obbligatorie=["analisi_tuo_video", "analisi_video_competitor", "tabella_comparativa", "analisi_comparativa"])
+
+ESTRAZIONE_BENCHMARK = _oggetto({
+    "verdetto_complessivo": VERDETTO,
+    "motivazione_verdetto": STRINGA,
+    "caratteristiche": _oggetto({c: BOOLEANO for c in prompts.CARATTERISTICHE_BENCHMARK}),
+    "punti_di_forza": LISTA_STRINGHE,
+    "punti_deboli": LISTA_STRINGHE,
+    "controlli_personalizzati": _lista(_oggetto({"controllo": STRINGA, "status": STATUS, "motivazione": STRINGA})),
+}, obbligatorie=["verdetto_complessivo", "motivazione_verdetto", "caratteristiche"])
+
+
+def schema_sezione(sezione):
+    """Schema della risposta di una richiesta del Video Checker (base o sezione opzionale)."""
+    if sezione in SEZIONI:
+        return _oggetto({sezione: SEZIONI[sezione]})
+    return BASE
+
+
+def sottoschema(schema, chiavi):
+    """Schema ridotto alle sole chiavi di primo livello indicate (per le richieste di riparazione)."""
+    return _oggetto({chiave: schema["properties"][chiave] for chiave in chiavi})
+
+
+_TIPI = {
+    "STRING": str,
+    "BOOLEAN": bool,
+    "NUMBER": (int, float),
+    "INTEGER": int,
+    "ARRAY": list,
+    "OBJECT": dict,
+}
+
+
+def valida(valore, schema, percorso="$"):
+    """Restituisce la lista degli errori (percorso: problema); vuota se il valore è conforme."""
+    tipo = _TIPI[schema["type"]]
+    if not isinstance(valore, tipo) or (schema["type"] in ("NUMBER", "INTEGER") and isinstance(valore, bool)):
+        return [f"{percorso}: atteso {schema['type']}, trovato {type(valore).__name__}"]
+    errori = []
+    if "enum" in schema and valore not in schema["enum"]:
+        errori.append(f"{percorso}: valore {valore!r} non ammesso")
+    if schema["type"] == "OBJECT":
+        for chiave in schema.get("required", []):
+            if chiave not in valore:
+                errori.append(f"{percorso}.{chiave}: mancante")
+        for chiave, sotto in schema.get("properties", {}).items():
+            if chiave in valore:
+                errori += valida(valore[chiave], sotto, f"{percorso}.{chiave}")
+    elif schema["type"] == "ARRAY":
+        for i, elemento in enumerate(valore):
+            errori += valida(elemento, schema["items"], f"{percorso}[{i}]")
+    return errori
+
+
+def sezioni_non_valide(dati, schema):
+    """
+    Individua le sezioni (chiavi di primo livello) difettose di una risposta:
+    restituisce {chiave: [errori]}. Un valore che non è un oggetto invalida tutto.
+    """
+    if not isinstance(dati, dict):
+        return {chiave: ["risposta non decodificabile"] for chiave in schema.get("required", [])}
+    difettose = {}
+    for chiave in schema.get("required", []):
+        if chiave not in dati:
+            difettose[chiave] = [f"$.{chiave}: mancante"]
+    for chiave, sotto in schema["properties"].items():
+        if chiave in dati:
+            errori = valida(dati[chiave], sotto, f"$.{chiave}")
+            if errori:
+                difettose[chiave] = errori
+    return difettose
+
+
+class StatisticheRiparazioni:
+    """Contatori delle riparazioni: quante analisi complete sono state salvate ripetendo solo una parte."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valori = {"risposte_valide": 0, "sezioni_riparate": 0, "rerun_evitati": 0, "riparazioni_fallite": 0}
+
+    def registra(self, chiave, quantita=1):
+        with self._lock:
+            self._valori[chiave] += quantita
+
+    def stats(self):
+        with self._lock:
+            return dict(self._valori)
+
+
+statistiche = StatisticheRiparazioni()
@@ -0,0 +1,177 @@
+# segmenti.py
+"""
+Suddivisione dei video lunghi in finestre temporali per l'analisi segmentata,
+e fusione delle voci della checklist dei singoli segmenti.
+
+I segmenti sono tagliati con ffmpeg senza ricodifica (-c copy) e in modalità
+bitexact: a parità di contenuto un segmento produce sempre gli stessi byte, quindi
+lo stesso hash e la stessa voce di cache. Rimontando una scena senza cambiare la
+durata complessiva, solo le finestre che la contengono vengono rianalizzate.
+"""
+import csv
+import difflib
+import os
+import shutil
+import subprocess
+import tracciamento
+
+DURATA_SEGMENTO_DEFAULT = 30
+# Soglia di somiglianza tra i punti analizzati oltre la quale due voci sono la stessa.
+SOGLIA_DUPLICATO = 0.9
+GRAVITA_STATUS = {"OK": 0, "ATTENZIONE": 1, "CRITICO": 2}
+GRAVITA_VERDETTO = {"CONSIGLIATO": 0, "CONSIGLIATO_CON_RISERVA": 1, "NON_CONSIGLIATO": 2}
+
+
+class FfmpegNonDisponibile(RuntimeError):
+    pass
+
+
+def durata_segmento_configurata():
+    return float(os.getenv("ADVISOR_SEGMENT_SECONDS", DURATA_SEGMENTO_DEFAULT))
+
+
+def formatta_tempo(secondi):
+    secondi = int(round(secondi))
+    return f"{secondi // 60:02d}:{secondi % 60:02d}"
+
+
+def trova_eseguibile(nome):
+    percorso = shutil.which(nome)
+    if percorso is None:
+        raise FfmpegNonDisponibile(f"'{nome}' non trovato: installa ffmpeg per usare l'analisi segmentata.")
+    return percorso
+
+
+def dividi(path, cartella, durata_segmento=None):
+    """
+    Divide il video in segmenti di circa `durata_segmento` secondi. I tagli cadono
+    sui keyframe, quindi gli intervalli effettivi sono letti dalla lista prodotta
+    da ffmpeg. Restituisce una lista di tuple (path_segmento, inizio_s, fine_s).
+    """
+    durata_segmento = durata_segmento or durata_segmento_configurata()
+    estensione = os.path.splitext(path)[1] or ".mp4"
+    lista = os.path.join(cartella, "segmenti.csv")
+    with tracciamento.span("divisione_segmenti", durata_segmento=durata_segmento):
+        subprocess.run(
+            [trova_eseguibile("ffmpeg"), "-v", "error", "-y", "-i", path,
+             "-map", "0", "-c", "copy", "-map_metadata", "-1", "-fflags", "+bitexact",
+             "-f", "segment", "-segment_time", str(durata_segmento), "-reset_timestamps", "1",
+             "-segment_list", lista, "-segment_list_type", "csv",
+             os.path.join(cartella, f"segmento_%03d{estensione}")],
+            capture_output=True, check=True,
+        )
+    with open(lista, newline="", encoding="utf-8") as f:
+        return [(os.path.join(cartella, nome), float(inizio), float(fine)) for nome, inizio, fine in csv.reader(f)]
+
+
+def taglia(path, cartella, inizio, fine):
+    """Estrae senza ricodifica la parte [inizio, fine] del video (il taglio parte dal keyframe precedente)."""
+    estensione = os.path.splitext(path)[1] or ".mp4"
+    uscita = os.path.join(cartella, f"parte_{int(inizio):05d}_{int(fine):05d}{estensione}")
+    subprocess.run(
+        [trova_eseguibile("ffmpeg"), "-v", "error", "-y", "-ss", str(inizio), "-to", str(fine), "-i", path,
+         "-map", "0", "-c", "copy", "-map_metadata", "-1", "-fflags", "+bitexact",
+         "-avoid_negative_ts", "make_zero", uscita],
+        capture_output=True, check=True,
+    )
+    return uscita
+
+
+def _stesso_punto(a, b):
+    if (a.get("categoria") or "").strip().lower() != (b.get("categoria") or "").strip().lower():
+        return False
+    punto_a = (a.get("punto_analizzato") or "").strip().lower()
+    punto_b = (b.get("punto_analizzato") or "").strip().lower()
+    return punto_a == punto_b or difflib.SequenceMatcher(None, punto_a, punto_b).ratio() >= SOGLIA_DUPLICATO
+
+
+def _intervallo_assoluto(item, inizio, fine):
+    """Intervallo della voce nel video completo; senza indicazioni del modello è l'intero segmento."""
+    try:
+        da = inizio + float(item.get("inizio_s", 0))
+        a = inizio + float(item.get("fine_s", fine - inizio))
+    except (TypeError, ValueError):
+        da, a = inizio, fine
+    return [round(max(inizio, min(da, fine)), 1), round(max(inizio, min(max(a, da), fine)), 1)]
+
+
+def _dentro(intervallo, finestre):
+    return any(da <= intervallo[0] and intervallo[1] <= a for da, a in finestre)
+
+
+def _aggiungi_intervallo(intervalli, nuovo):
+    """Aggiunge un intervallo e unisce quelli sovrapposti o contigui, in ordine temporale."""
+    uniti = []
+    for da, a in sorted([list(t) for t in intervalli] + [list(nuovo)]):
+        if uniti and da <= uniti[-1][1]:
+            uniti[-1][1] = max(uniti[-1][1], a)
+        else:
+            uniti.append([da, a])
+    return uniti
+
+
+def _voci_base(base, finestre):
+    """
+    Voci dell'analisi precedente ancora valide dopo la rianalisi delle
+    `finestre`: gli istanti che cadono in una finestra rianalizzata vengono
+    tolti e le voci senza altri istanti scartate. Le voci senza istanti (analisi
+    non segmentata) restano finché non vengono ritrovate nelle finestre.
+    """
+    voci = []
+    for item in base.get("checklist_analisi", []):
+        if not isinstance(item, dict):
+            continue
+        if not item.get("timestamp"):
+            voci.append(dict(item))
+            continue
+        fuori = [list(t) for t in item["timestamp"] if not _dentro(t, finestre)]
+        if fuori:
+            voci.append(dict(item, timestamp=fuori))
+    return voci
+
+
+def unisci_segmenti(risultati, base=None):
+    """
+    Fonde le analisi di base dei segmenti. `risultati` è una lista di tuple
+    (inizio_s, fine_s, dati) in ordine temporale. Le voci equivalenti di segmenti
+    diversi diventano una sola voce con lo status più grave e la lista degli
+    intervalli in cui compare ("timestamp"); il verdetto è il più severo.
+    Con `base` (un'analisi completa precedente) i segmenti sono le sole parti
+    modificate: le voci della base in quelle parti vengono sostituite da quanto
+    trovato di nuovo, e il verdetto della base conta solo se restano sue
+    segnalazioni fuori dalle parti rianalizzate.
+    """
+    voci = _voci_base(base, [(inizio, fine) for inizio, fine, _ in risultati]) if base else []
+    da_base = {id(v) for v in voci}
+    ritrovate = set()
+    for inizio, fine, dati in risultati:
+        for item in dati.get("checklist_analisi", []):
+            intervallo = _intervallo_assoluto(item, inizio, fine)
+            item = {k: v for k, v in item.items() if k not in ("inizio_s", "fine_s")}
+            esistente = next((v for v in voci if _stesso_punto(v, item)), None)
+            if esistente is None:
+                voci.append(dict(item, timestamp=[intervallo]))
+                continue
+            if id(esistente) in da_base and id(esistente) not in ritrovate:
+                # Voce della versione precedente ritrovata nelle parti nuove: vale la nuova valutazione.
+                ritrovate.add(id(esistente))
+                esistente.update(status=item.get("status"), motivazione=item.get("motivazione"))
+            elif GRAVITA_STATUS.get(item.get("status"), 0) > GRAVITA_STATUS.get(esistente.get("status"), 0):
+                esistente.update(status=item.get("status"), motivazione=item.get("motivazione"))
+            esistente["timestamp"] = _aggiungi_intervallo(esistente.get("timestamp") or [], intervallo)
+
+    rimaste = [v for v in voci if id(v) in da_base and id(v) not in ritrovate and v.get("status") != "OK"]
+    verdetti = [(None, None, base)] if base and rimaste else []
+    verdetti += risultati
+    peggiore = max((dati.get("verdetto_complessivo") for _, _, dati in verdetti),
+                   key=lambda v: GRAVITA_VERDETTO.get(v, -1), default="N/D")
+    motivazioni = [
+        (f"[{formatta_tempo(inizio)}–{formatta_tempo(fine)}] " if inizio is not None else "")
+        + dati.get("motivazione_verdetto", "")
+        for inizio, fine, dati in verdetti if dati.get("verdetto_complessivo") == peggiore
+    ]
+    return {
+        "verdetto_complessivo": peggiore,
+        "motivazione_verdetto": " ".join(motivazioni),
+        "checklist_analisi": voci,
+    }
@@ -0,0 +1,324 @@
+# servizio_http.py
+"""
+Servizio HTTP asincrono (aiohttp) per usare Ad-Visor da altri sistemi, ad
+esempio il DAM o la pipeline di trafficking, senza passare dal browser.
+
+Ogni analisi è un lavoro in background (vedi lavori): l'invio salva i video su
+disco a blocchi e risponde subito con l'id del lavoro; stato e risultato si
+leggono con due GET. L'event loop non esegue mai le analisi, quindi lo stesso
+processo tiene centinaia di lavori in coda o in corso, entro i limiti di
+concorrenza dei lavori (ADVISOR_MAX_JOBS) e di quota del governatore.
+
+Endpoint:
+    POST /v1/checker                  multipart: `video` e le impostazioni del Video Checker
+    POST /v1/benchmark                multipart: due o più `video`, il primo è il tuo
+    GET  /v1/lavori/{id}              stato, posizione in coda e messaggi del lavoro
+    GET  /v1/lavori/{id}/risultato    esito (202 finché il lavoro non è concluso)
+    GET  /v1/stato                    statistiche di lavori, governatore e cache
+    GET  /metrics                     tempi per fase in formato Prometheus
+
+Il risultato del checker ha la forma dei record della CLI batch; quello del
+benchmark è l'esito di analisi, con il JSON del modello già decodificato.
+
+Esempio:
+    ADVISOR_BACKEND=fake python servizio_http.py --porta 8080
+    curl -F video=@spot.mp4 -F paese=Italia http://localhost:8080/v1/checker
+"""
+import argparse
+import asyncio
+import datetime
+import hmac
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from aiohttp import web
+import analisi
+import batch_cli
+import governatore
+import lavori
+import linee_guida
+import poller
+import result_cache
+import riduzione
+import tracciamento
+import upload_stream
+
+BLOCCO_BYTE = 1024 * 1024
+TIPO_CHECKER = "http_checker"
+TIPO_BENCHMARK = "http_benchmark"
+
+
+def _json(dati, status=200, **kwargs):
+    # I risultati del confronto contengono interi e booleani numpy.
+    testo = json.dumps(dati, ensure_ascii=False, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+    return web.json_response(text=testo, status=status, **kwargs)
+
+
+def _nome_sicuro(nome):
+    nome = re.sub(r"[^\w.\- ]", "_", os.path.basename(nome or "")).strip() or "video"
+    return nome[:120]
+
+
+def _esegui_checker(lavoro, path, nome, impostazioni, usa_cache, preset):
+    """Corpo del lavoro: la stessa analisi di un elemento della CLI batch."""
+    lavoro.log(f"Analisi di '{nome}'...")
+    record = batch_cli.analizza_elemento(dict(impostazioni, video=path), set(), usa_cache, preset)
+    record["video"] = nome
+    return record
+
+
+def _esegui_benchmark(lavoro, video, paese, controlli, usa_cache):
+    """Corpo del lavoro: benchmark a due video o a N video (`video` è una lista di tuple (path, nome))."""
+    import confronto
+
+    lavoro.log(f"Analisi comparativa di {len(video)} video...")
+    file_video = [upload_stream.FileConNome(path, nome) for path, nome in video]
+    try:
+        if len(file_video) == 2:
+            esito = analisi.analizza_benchmark(file_video[0], file_video[1], paese=paese, controlli=controlli,
+                                               usa_cache=usa_cache)
+            try:
+                esito["risultato"] = json.loads(esito["risultato"])
+            except ValueError:
+                esito["stato"] = "json_non_valido"
+            return esito
+        esito = analisi.analizza_benchmark_multiplo(
+            [(f, nome, None) for f, (_, nome) in zip(file_video, video)],
+            paese=paese, controlli=controlli, usa_cache=usa_cache,
+        )
+    finally:
+        for f in file_video:
+            f.close()
+    if 0 in esito["estrazioni"]:
+        # Il confronto mostra i video con le etichette univoche, non con la posizione.
+        etichette = esito["etichette"]
+        estrazioni = {etichette[i]: dati for i, dati in esito["estrazioni"].items()}
+        tabella = confronto.tabella_caratteristiche(estrazioni)
+        esito["confronto"] = {
+            "classifica": confronto.classifica(estrazioni, tabella)
+                          .rename_axis("video").reset_index().to_dict(orient="records"),
+            "swot": confronto.swot_locale(estrazioni, etichette[0], tabella),
+        }
+    return esito
+
+
+class Servizio:
+    def __init__(self, gestore=None, token=None, max_upload_mb=2048, max_in_coda=500):
+        self.gestore = gestore or lavori.get_default_gestore()
+        self.token = token
+        self.max_upload_byte = int(max_upload_mb * 1024 * 1024)
+        self.max_in_coda = max_in_coda
+
+    def app(self):
+        app = web.Application(middlewares=[self._autorizzazione])
+        app.add_routes([
+            web.post("/v1/checker", self.invia_checker),
+            web.post("/v1/benchmark", self.invia_benchmark),
+            web.get("/v1/lavori/{id}", self.stato_lavoro),
+            web.get("/v1/lavori/{id}/risultato", self.risultato_lavoro),
+            web.get("/v1/stato", self.stato),
+            web.get("/metrics", self.metriche),
+        ])
+        return app
+
+    @web.middleware
+    async def _autorizzazione(self, request, handler):
+        if self.token:
+            atteso = f"Bearer {self.token}"
+            if not hmac.compare_digest(request.headers.get("Authorization", ""), atteso):
+                return _json({"errore": "token mancante o non valido"}, status=401)
+        return await handler(request)
+
+    # --- Invio ---
+
+    async def _ricevi(self, request):
+        """
+        Legge un invio multipart: i file vengono scritti su disco a blocchi, in
+        una cartella del lavoro, con il loro nome originale; i campi di testo
+        finiscono in un dizionario. Restituisce (cartella, campi, video).
+        """
+        if not request.content_type.startswith("multipart/"):
+            raise web.HTTPUnsupportedMediaType(text="Invia i video come multipart/form-data")
+        cartella = tempfile.mkdtemp(prefix="advisor_http_")
+        campi, video, totale = {}, [], 0
+        try:
+            reader = await request.multipart()
+            while (parte := await reader.next()) is not None:
+                if not parte.filename:
+                    campi[parte.name] = await parte.text()
+                    continue
+                # Una sottocartella per file: due video possono avere lo stesso nome.
+                path = os.path.join(cartella, str(len(video)), _nome_sicuro(parte.filename))
+                os.makedirs(os.path.dirname(path))
+                with tracciamento.span("scrittura_file_locale", origine="http"), open(path, "wb") as f:
+                    while blocco := await parte.read_chunk(BLOCCO_BYTE):
+                        totale += len(blocco)
+                        if totale > self.max_upload_byte:
+                            raise web.HTTPRequestEntityTooLarge(max_size=self.max_upload_byte, actual_size=totale)
+                        await asyncio.to_thread(f.write, blocco)
+                video.append((path, parte.filename))
+        except BaseException:
+            shutil.rmtree(cartella, ignore_errors=True)
+            raise
+        return cartella, campi, video
+
+    def _verifica_capacita(self):
+        if self.gestore.stats()["in_coda"] >= self.max_in_coda:
+            raise web.HTTPServiceUnavailable(text="Troppi lavori in coda, riprova più tardi", headers={"Retry-After": "30"})
+
+    def _avvia(self, request, tipo, descrizione, funzione, *args, cartella, parametri):
+        # Le richieste dello stesso cliente condividono un turno nella coda equa del governatore.
+        sessione = request.headers.get("X-Advisor-Client") or f"http:{request.remote}"
+        id_lavoro = self.gestore.avvia(tipo, descrizione, funzione, *args, parametri=parametri,
+                                       file_temporanei=[cartella], sessione=sessione)
+        stato_url = f"/v1/lavori/{id_lavoro}"
+        return _json(
+            {
+                "id": id_lavoro,
+                "stato": lavori.IN_CODA,
+                "posizione_in_coda": self.gestore.posizione_in_coda(id_lavoro),
+                "stato_url": stato_url,
+                "risultato_url": f"{stato_url}/risultato",
+            },
+            status=202,
+            headers={"Location": stato_url},
+        )
+
+    @staticmethod
+    def _impostazioni_comuni(campi):
+        preset = campi.get("riduzione", riduzione.preset_configurato())
+        if preset not in riduzione.PRESET:
+            raise web.HTTPBadRequest(text=f"Preset di riduzione sconosciuto: {preset} (ammessi: {', '.join(riduzione.PRESET)})")
+        try:
+            linee_guida.get_default_registro().verifica(campi.get("paese"))
+        except linee_guida.MercatoSconosciuto as e:
+            raise web.HTTPBadRequest(text=str(e))
+        return {
+            "paese": result_cache.normalizza_paese(campi.get("paese")),
+            "controlli": result_cache.normalizza_controlli(campi.get("controlli", "")),
+            "usa_cache": batch_cli.booleano(campi.get("usa_cache", True)),
+            "preset": preset,
+        }
+
+    async def invia_checker(self, request):
+        self._verifica_capacita()
+        cartella, campi, video = await self._ricevi(request)
+        try:
+            if len(video) != 1:
+                raise web.HTTPBadRequest(text="Il checker richiede esattamente un file nel campo 'video'")
+            comuni = self._impostazioni_comuni(campi)
+        except web.HTTPException:
+            shutil.rmtree(cartella, ignore_errors=True)
+            raise
+        impostazioni = {
+            "paese": comuni["paese"],
+            "controlli": comuni["controlli"],
+            **{campo: batch_cli.booleano(campi.get(campo, False)) for campo in batch_cli.CAMPI_BOOLEANI},
+        }
+        (path, nome), = video
+        return self._avvia(request, TIPO_CHECKER, f"Analisi di {nome}", _esegui_checker,
+                           path, nome, impostazioni, comuni["usa_cache"], comuni["preset"],
+                           cartella=cartella, parametri=dict(impostazioni, video=nome, riduzione=comuni["preset"]))
+
+    async def invia_benchmark(self, request):
+        self._verifica_capacita()
+        cartella, campi, video = await self._ricevi(request)
+        try:
+            if len(video) < 2:
+                raise web.HTTPBadRequest(text="Il benchmark richiede almeno due file nel campo 'video' (il primo è il tuo)")
+            comuni = self._impostazioni_comuni(campi)
+        except web.HTTPException:
+            shutil.rmtree(cartella, ignore_errors=True)
+            raise
+        nomi = [nome for _, nome in video]
+        if len(set(nomi)) != len(nomi):
+            # Il benchmark a N video identifica i video per nome.
+            video = [(path, f"{nome} ({i})") for i, (path, nome) in enumerate(video, 1)]
+        return self._avvia(request, TIPO_BENCHMARK, f"Benchmark di {len(video)} video", _esegui_benchmark,
+                           video, comuni["paese"], comuni["controlli"], comuni["usa_cache"],
+                           cartella=cartella, parametri={"video": [nome for _, nome in video], "paese": comuni["paese"]})
+
+    # --- Stato e risultati ---
+
+    def _lavoro(self, request):
+        lavoro = self.gestore.ottieni(request.match_info["id"])
+        if lavoro is None or lavoro.tipo not in (TIPO_CHECKER, TIPO_BENCHMARK):
+            raise web.HTTPNotFound(text="Lavoro sconosciuto o scaduto")
+        return lavoro
+
+    def _descrivi(self, lavoro):
+        def _ora(istante):
+            return datetime.datetime.fromtimestamp(istante, datetime.timezone.utc).isoformat() if istante else None
+
+        descrizione = {
+            "id": lavoro.id,
+            "tipo": lavoro.tipo.removeprefix("http_"),
+            "stato": lavoro.stato,
+            "descrizione": lavoro.descrizione,
+            "parametri": lavoro.parametri,
+            "posizione_in_coda": self.gestore.posizione_in_coda(lavoro.id),
+            "creato": _ora(lavoro.creato),
+            "avviato": _ora(lavoro.avviato),
+            "terminato": _ora(lavoro.terminato),
+            "durata_s": round(lavoro.durata(), 2),
+            "messaggi": lavoro.messaggi[-20:],
+        }
+        if lavoro.stato == lavori.ERRORE:
+            descrizione["errore"] = str(lavoro.errore)
+        return descrizione
+
+    async def stato_lavoro(self, request):
+        return _json(self._descrivi(self._lavoro(request)))
+
+    async def risultato_lavoro(self, request):
+        lavoro = self._lavoro(request)
+        if not lavoro.concluso:
+            return _json(self._descrivi(lavoro), status=202, headers={"Retry-After": "5"})
+        if lavoro.stato == lavori.ERRORE:
+            # Un video che il servizio non riesce a elaborare non è un errore del server.
+            status = 422 if isinstance(lavoro.errore, poller.ElaborazioneFallita) else 500
+            return _json(self._descrivi(lavoro), status=status)
+        return _json(dict(self._descrivi(lavoro), esito=lavoro.esito))
+
+    async def stato(self, request):
+        return _json({
+            "lavori": self.gestore.stats(),
+            "governatore": governatore.get_default_governatore().stats(),
+            "cache": result_cache.get_default_cache().stats(),
+            "linee_guida": linee_guida.get_default_registro().stats(),
+        })
+
+    async def metriche(self, request):
+        return web.Response(text=tracciamento.metriche_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ad-Visor: servizio HTTP delle analisi.")
+    parser.add_argument("--host", default=os.getenv("ADVISOR_HTTP_HOST", "127.0.0.1"), help="Indirizzo di ascolto")
+    parser.add_argument("--porta", type=int, default=int(os.getenv("ADVISOR_HTTP_PORT", "8080")), help="Porta (default 8080)")
+    parser.add_argument("--lavori", type=int, help="Analisi contemporanee (default ADVISOR_MAX_JOBS)")
+    parser.add_argument("--max-in-coda", type=int, default=int(os.getenv("ADVISOR_HTTP_MAX_PENDING", "500")),
+                        help="Lavori in coda oltre i quali gli invii ricevono 503 (default 500)")
+    parser.add_argument("--max-upload-mb", type=float, default=float(os.getenv("ADVISOR_HTTP_MAX_UPLOAD_MB", "2048")),
+                        help="Dimensione massima dei video di un invio (default 2048 MB)")
+    args = parser.parse_args(argv)
+
+    import backend
+
+    if not backend.configura():
+        print("Chiave API di Gemini non trovata. Assicurati di averla impostata nel file .env", file=sys.stderr)
+        return 2
+    if args.lavori:
+        os.environ["ADVISOR_MAX_JOBS"] = str(args.lavori)
+
+    servizio = Servizio(token=os.getenv("ADVISOR_HTTP_TOKEN") or None, max_upload_mb=args.max_upload_mb,
+                        max_in_coda=args.max_in_coda)
+    web.run_app(servizio.app(), host=args.host, port=args.porta)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+# store.py
+"""
+Archivio persistente delle analisi su SQLite. Ogni analisi conserva hash del
+video, mercato, impostazioni, verdetto, voci della checklist, tempi e JSON
+originale; gli indici su mercato, verdetto, data e hash permettono al Report
+Hub di filtrare e paginare lato database anche su migliaia di report.
+I testi di checklist, motivazioni e notizie sono indicizzati in un indice
+full-text (FTS5) aggiornato a ogni salvataggio, per ricerche ordinate per
+pertinenza con filtri su categoria, status e mercato. Le impronte percettive
+dei video analizzati (vedi impronte) sono indicizzate per banda per trovare
+rapidamente le versioni quasi identiche di uno spot.
+"""
+import contextlib
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analisi (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    creato TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    video_hash TEXT NOT NULL,
+    video_hash_competitor TEXT,
+    video_nome TEXT,
+    mercato TEXT,
+    impostazioni TEXT NOT NULL DEFAULT '{}',
+    verdetto TEXT,
+    motivazione_verdetto TEXT,
+    tempi TEXT NOT NULL DEFAULT '{}',
+    risultato TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analisi_creato ON analisi (creato, id);
+CREATE INDEX IF NOT EXISTS idx_analisi_mercato ON analisi (mercato, creato, id);
+CREATE INDEX IF NOT EXISTS idx_analisi_verdetto ON analisi (verdetto, creato, id);
+CREATE INDEX IF NOT EXISTS idx_analisi_video ON analisi (video_hash);
+
+CREATE TABLE IF NOT EXISTS elementi_checklist (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    analisi_id INTEGER NOT NULL REFERENCES analisi (id) ON DELETE CASCADE,
+    categoria TEXT,
+    punto_analizzato TEXT,
+    status TEXT,
+    motivazione TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_elementi_analisi ON elementi_checklist (analisi_id);
+CREATE INDEX IF NOT EXISTS idx_elementi_status ON elementi_checklist (status, categoria);
+"""
+
+SCHEMA_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS documenti_fts USING fts5(
+    testo,
+    categoria UNINDEXED,
+    status UNINDEXED,
+    mercato UNINDEXED,
+    analisi_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+SCHEMA_IMPRONTE = """
+CREATE TABLE IF NOT EXISTS impronte (
+    video_hash TEXT PRIMARY KEY,
+    creato TEXT NOT NULL,
+    frame BLOB NOT NULL,
+    audio BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS impronte_bande (
+    chiave INTEGER NOT NULL,
+    video_hash TEXT NOT NULL REFERENCES impronte (video_hash) ON DELETE CASCADE,
+    PRIMARY KEY (chiave, video_hash)
+) WITHOUT ROWID;
+"""
+
+# Colonne restituite negli elenchi (senza il JSON completo, letto solo nel dettaglio).
+COLONNE_ELENCO = "id, creato, tipo, video_nome, video_hash, mercato, verdetto, motivazione_verdetto"
+
+
+def _documenti(analisi_id, mercato, data):
+    """Documenti da indicizzare per un'analisi: verdetto, voci della checklist e notizie."""
+    documenti = []
+    if data.get("motivazione_verdetto"):
+        documenti.append((data["motivazione_verdetto"], "Verdetto", data.get("verdetto_complessivo"), mercato, analisi_id))
+    for item in data.get("checklist_analisi", []):
+        if isinstance(item, dict):
+            testo = " — ".join(t for t in (item.get("punto_analizzato"), item.get("motivazione")) if t)
+            documenti.append((testo, item.get("categoria"), item.get("status"), mercato, analisi_id))
+    for notizia in data.get("notizie_recenti", {}).get("notizie_rilevanti", []):
+        if isinstance(notizia, dict):
+            testo = " — ".join(t for t in (notizia.get("titolo"), notizia.get("descrizione")) if t)
+            documenti.append((testo, "Notizia", notizia.get("impatto"), mercato, analisi_id))
+    return [d for d in documenti if d[0]]
+
+
+def query_fts(testo):
+    """
+    Converte il testo cercato dall'utente in una query FTS5 sicura: ogni parola
+    diventa un prefisso tra virgolette (es. "simbol"* trova simbolo/simboli),
+    e tutte le parole devono essere presenti.
+    """
+    parole = [p.replace('"', '""') for p in testo.split()]
+    return " ".join(f'"{p}"*' for p in parole if p)
+
+
+def _adesso():
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class AnalysisStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connessione() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            conn.executescript(SCHEMA_FTS)
+            conn.executescript(SCHEMA_IMPRONTE)
+            if not conn.execute("SELECT 1 FROM documenti_fts LIMIT 1").fetchone():
+                self._reindicizza(conn)
+
+    def _reindicizza(self, conn):
+        """Ricostruisce l'indice full-text dalle analisi esistenti (archivi creati prima dell'indice)."""
+        for riga in conn.execute("SELECT id, mercato, risultato FROM analisi WHERE tipo = 'checker'"):
+            try:
+                data = json.loads(riga["risultato"])
+            except ValueError:
+                continue
+            conn.executemany(
+                "INSERT INTO documenti_fts (testo, categoria, status, mercato, analisi_id) VALUES (?, ?, ?, ?, ?)",
+                _documenti(riga["id"], riga["mercato"], data),
+            )
+
+    @contextlib.contextmanager
+    def _connessione(self):
+        # Una connessione per operazione: sicuro con i thread di Streamlit e della CLI.
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def salva(self, tipo, video_hash, risultato, mercato=None, impostazioni=None, tempi=None,
+              video_nome=None, video_hash_competitor=None):
+        """Registra un'analisi a partire dal testo JSON del risultato. Restituisce l'id."""
+        try:
+            data = json.loads(risultato)
+        except (TypeError, ValueError):
+            data = {}
+        if tipo == "benchmark":
+            principale = data.get("analisi_tuo_video", {})
+        else:
+            principale = data
+        checklist = [item for item in data.get("checklist_analisi", []) if isinstance(item, dict)]
+
+        with self._lock, self._connessione() as conn:
+            cursore = conn.execute(
+                "INSERT INTO analisi (creato, tipo, video_hash, video_hash_competitor, video_nome, mercato, "
+                "impostazioni, verdetto, motivazione_verdetto, tempi, risultato) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    _adesso(), tipo, video_hash, video_hash_competitor, video_nome, mercato,
+                    json.dumps(impostazioni or {}, ensure_ascii=False),
+                    principale.get("verdetto_complessivo"), principale.get("motivazione_verdetto"),
+                    json.dumps(tempi or {}, ensure_ascii=False), risultato,
+                ),
+            )
+            analisi_id = cursore.lastrowid
+            conn.executemany(
+                "INSERT INTO elementi_checklist (analisi_id, categoria, punto_analizzato, status, motivazione) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (analisi_id, item.get("categoria"), item.get("punto_analizzato"),
+                     item.get("status"), item.get("motivazione"))
+                    for item in checklist
+                ],
+            )
+            if tipo != "benchmark":
+                conn.executemany(
+                    "INSERT INTO documenti_fts (testo, categoria, status, mercato, analisi_id) VALUES (?, ?, ?, ?, ?)",
+                    _documenti(analisi_id, mercato, data),
+                )
+        return analisi_id
+
+    @staticmethod
+    def _where(filtri):
+        condizioni, parametri = [], []
+        filtri = filtri or {}
+        for colonna in ("tipo", "mercato", "verdetto", "video_hash"):
+            if filtri.get(colonna):
+                condizioni.append(f"{colonna} = ?")
+                parametri.append(filtri[colonna])
+        if filtri.get("dal"):
+            condizioni.append("creato >= ?")
+            parametri.append(str(filtri["dal"]))
+        if filtri.get("al"):
+            condizioni.append("creato < ?")
+            parametri.append(str(filtri["al"]))
+        return (" WHERE " + " AND ".join(condizioni)) if condizioni else "", parametri
+
+    def conta(self, filtri=None):
+        where, parametri = self._where(filtri)
+        with self._connessione() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM analisi{where}", parametri).fetchone()[0]
+
+    def pagina(self, filtri=None, limite=25, cursore=None):
+        """
+        Restituisce una pagina di analisi (dalla più recente) e il cursore della
+        pagina successiva (None se finita). La paginazione è per chiave
+        (creato, id), quindi il costo non cresce con il numero di pagina.
+        """
+        where, parametri = self._where(filtri)
+        if cursore is not None:
+            where += (" AND " if where else " WHERE ") + "(creato, id) < (?, ?)"
+            parametri += list(cursore)
+        with self._connessione() as conn:
+            righe = conn.execute(
+                f"SELECT {COLONNE_ELENCO} FROM analisi{where} ORDER BY creato DESC, id DESC LIMIT ?",
+                parametri + [limite + 1],
+            ).fetchall()
+        righe = [dict(riga) for riga in righe]
+        prossimo = (righe[limite - 1]["creato"], righe[limite - 1]["id"]) if len(righe) > limite else None
+        return righe[:limite], prossimo
+
+    def dettaglio(self, analisi_id):
+        with self._connessione() as conn:
+            riga = conn.execute("SELECT * FROM analisi WHERE id = ?", (analisi_id,)).fetchone()
+            if riga is None:
+                return None
+            dettaglio = dict(riga)
+            dettaglio["checklist"] = [
+                dict(r) for r in conn.execute(
+                    "SELECT categoria, punto_analizzato, status, motivazione FROM elementi_checklist "
+                    "WHERE analisi_id = ? ORDER BY id", (analisi_id,))
+            ]
+        dettaglio["impostazioni"] = json.loads(dettaglio["impostazioni"])
+        dettaglio["tempi"] = json.loads(dettaglio["tempi"])
+        return dettaglio
+
+    @staticmethod
+    def _where_ricerca(testo, filtri):
+        condizioni, parametri = ["documenti_fts MATCH ?"], [query_fts(testo)]
+        filtri = filtri or {}
+        for colonna in ("categoria", "status", "mercato"):
+            if filtri.get(colonna):
+                condizioni.append(f"documenti_fts.{colonna} = ?")
+                parametri.append(filtri[colonna])
+        if filtri.get("dal"):
+            condizioni.append("analisi.creato >= ?")
+            parametri.append(str(filtri["dal"]))
+        if filtri.get("al"):
+            condizioni.append("analisi.creato < ?")
+            parametri.append(str(filtri["al"]))
+        return " WHERE " + " AND ".join(condizioni), parametri
+
+    def cerca(self, testo, filtri=None, limite=25, offset=0):
+        """
+        Ricerca full-text ordinata per pertinenza (BM25) su motivazioni, voci
+        della checklist e notizie. `filtri` accetta categoria, status, mercato,
+        dal, al. Restituisce le righe con un estratto evidenziato.
+        """
+        if not query_fts(testo):
+            return []
+        where, parametri = self._where_ricerca(testo, filtri)
+        with self._connessione() as conn:
+            righe = conn.execute(
+                "SELECT documenti_fts.analisi_id AS analisi_id, documenti_fts.categoria AS categoria, "
+                "documenti_fts.status AS status, documenti_fts.mercato AS mercato, analisi.creato AS creato, "
+                "analisi.video_nome AS video_nome, "
+                "snippet(documenti_fts, 0, '**', '**', '…', 16) AS estratto, bm25(documenti_fts) AS punteggio "
+                "FROM documenti_fts JOIN analisi ON analisi.id = documenti_fts.analisi_id"
+                f"{where} ORDER BY punteggio LIMIT ? OFFSET ?",
+                parametri + [limite, offset],
+            ).fetchall()
+        return [dict(riga) for riga in righe]
+
+    def facette(self, testo, colonna, filtri=None):
+        """Conteggio dei risultati della ricerca per valore di una faccetta (categoria, status o mercato)."""
+        if colonna not in ("categoria", "status", "mercato"):
+            raise ValueError(f"Faccetta non valida: {colonna}")
+        if not query_fts(testo):
+            return {}
+        filtri = dict(filtri or {}, **{colonna: None})
+        where, parametri = self._where_ricerca(testo, filtri)
+        with self._connessione() as conn:
+            righe = conn.execute(
+                f"SELECT documenti_fts.{colonna}, COUNT(*) FROM documenti_fts "
+                f"JOIN analisi ON analisi.id = documenti_fts.analisi_id{where} "
+                f"GROUP BY documenti_fts.{colonna} ORDER BY COUNT(*) DESC",
+                parametri,
+            ).fetchall()
+        return {r[0]: r[1] for r in righe if r[0] is not None}
+
+    def analisi_per_video(self, video_hashes, tipo=None):
+        """Analisi (dalla più recente) di uno qualsiasi degli hash indicati."""
+        video_hashes = list(video_hashes)
+        condizione = "video_hash IN (SELECT value FROM json_each(?))"
+        parametri = [json.dumps(video_hashes)]
+        if tipo:
+            condizione += " AND tipo = ?"
+            parametri.append(tipo)
+        with self._connessione() as conn:
+            return [dict(r) for r in conn.execute(
+                f"SELECT {COLONNE_ELENCO} FROM analisi WHERE {condizione} ORDER BY creato DESC, id DESC", parametri)]
+
+    def ultimo_id(self):
+        with self._connessione() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM analisi").fetchone()[0]
+
+    def analisi_dopo(self, dopo_id=0, limite=1000):
+        """Analisi con id maggiore di `dopo_id`, in ordine di id, con il JSON completo (per l'esportazione colonnare)."""
+        with self._connessione() as conn:
+            return [dict(r) for r in conn.execute(
+                "SELECT id, creato, tipo, mercato, verdetto, risultato FROM analisi WHERE id > ? ORDER BY id LIMIT ?",
+                (dopo_id, limite))]
+
+    def salva_impronta(self, video_hash, frame, audio, bande):
+        """Registra (o sostituisce) l'impronta di un video e le sue chiavi nell'indice per bande."""
+        with self._lock, self._connessione() as conn:
+            conn.execute("DELETE FROM impronte WHERE video_hash = ?", (video_hash,))
+            conn.execute("INSERT INTO impronte (video_hash, creato, frame, audio) VALUES (?, ?, ?, ?)",
+                         (video_hash, _adesso(), frame, audio))
+            conn.executemany("INSERT INTO impronte_bande (chiave, video_hash) VALUES (?, ?)",
+                             [(chiave, video_hash) for chiave in bande])
+
+    def candidati_simili(self, bande, minimo_comuni=1, limite=20):
+        """Hash dei video che condividono almeno `minimo_comuni` chiavi, dal maggior numero di chiavi comuni."""
+        if not bande:
+            return []
+        with self._connessione() as conn:
+            return [r[0] for r in conn.execute(
+                "SELECT video_hash, COUNT(*) AS comuni FROM impronte_bande "
+                "WHERE chiave IN (SELECT value FROM json_each(?)) "
+                "GROUP BY video_hash HAVING comuni >= ? ORDER BY comuni DESC LIMIT ?",
+                (json.dumps(list(bande)), minimo_comuni, limite))]
+
+    def impronta(self, video_hash):
+        """Restituisce (frame, audio) dell'impronta come bytes, o None."""
+        with self._connessione() as conn:
+            riga = conn.execute("SELECT frame, audio FROM impronte WHERE video_hash = ?", (video_hash,)).fetchone()
+        return (riga["frame"], riga["audio"]) if riga else None
+
+    def valori_distinti(self, colonna):
+        """Valori distinti di una colonna indicizzata (per i filtri del Report Hub)."""
+        if colonna not in ("tipo", "mercato", "verdetto"):
+            raise ValueError(f"Colonna non filtrabile: {colonna}")
+        with self._connessione() as conn:
+            return [r[0] for r in conn.execute(
+                f"SELECT DISTINCT {colonna} FROM analisi WHERE {colonna} IS NOT NULL ORDER BY {colonna}")]
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_default_store():
+    """Archivio condiviso dal processo (ADVISOR_DB_PATH, default .advisor_cache/analisi.sqlite3)."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = AnalysisStore(os.getenv(
+                "ADVISOR_DB_PATH", os.path.join(os.getenv("ADVISOR_CACHE_DIR", ".advisor_cache"), "analisi.sqlite3")))
+        return _default_store
@@ -0,0 +1,123 @@
+# streaming_json.py
+"""
+Parser JSON incrementale per le risposte in streaming del modello.
+Riceve il testo a frammenti e segnala, appena sono completi, i valori delle
+chiavi di primo livello dell'oggetto radice e i singoli elementi degli array
+di primo livello (es. ogni voce di "checklist_analisi").
+"""
+import json
+
+# Eventi prodotti da feed()
+VALORE = "valore"      # (VALORE, chiave, valore) - chiave di primo livello completata
+ELEMENTO = "elemento"  # (ELEMENTO, chiave, elemento) - elemento di un array di primo livello completato
+# Non prodotto da feed(): chi ripete una richiesta in streaming lo invia prima del nuovo tentativo.
+RIPRISTINO = "ripristino"  # (RIPRISTINO, None, chiavi) - scartare gli eventi già ricevuti per queste chiavi
+
+
+class ParserJsonIncrementale:
+    def __init__(self):
+        self._testo = ""
+        self._pos = 0
+        self._radice_trovata = False
+        self._completato = False
+        self._profondita = 0
+        self._in_stringa = False
+        self._escape = False
+        # Stato dei membri dell'oggetto radice: chiave -> due_punti -> valore_atteso -> valore
+        self._stato = "chiave"
+        self._inizio_chiave = None
+        self._chiave = None
+        self._inizio_valore = None
+        self._chiave_array = None
+        self._inizio_elemento = None
+
+    @property
+    def completato(self):
+        return self._completato
+
+    def feed(self, frammento):
+        """Aggiunge un frammento di testo e restituisce la lista degli eventi completati."""
+        self._testo += frammento
+        testo = self._testo
+        eventi = []
+        while self._pos < len(testo) and not self._completato:
+            i = self._pos
+            c = testo[i]
+            self._pos += 1
+
+            if self._in_stringa:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_stringa = False
+                    if self._profondita == 1 and self._stato == "chiave" and self._inizio_chiave is not None:
+                        self._chiave = json.loads(testo[self._inizio_chiave:i + 1])
+                        self._inizio_chiave = None
+                        self._stato = "due_punti"
+                continue
+
+            if not self._radice_trovata:
+                # Salta eventuali delimitatori markdown prima dell'oggetto radice.
+                if c == "{":
+                    self._radice_trovata = True
+                    self._profondita = 1
+                continue
+
+            if c.isspace():
+                continue
+
+            if self._profondita == 1 and self._stato == "valore_atteso":
+                self._inizio_valore = i
+                self._stato = "valore"
+                if c == "[":
+                    self._chiave_array = self._chiave
+            elif (self._profondita == 2 and self._chiave_array is not None
+                  and self._inizio_elemento is None and c not in ",]"):
+                self._inizio_elemento = i
+
+            if c == '"':
+                self._in_stringa = True
+                if self._profondita == 1 and self._stato == "chiave":
+                    self._inizio_chiave = i
+            elif c in "{[":
+                self._profondita += 1
+            elif c in "}]":
+                self._profondita -= 1
+                if self._profondita == 1 and c == "]" and self._chiave_array is not None:
+                    self._emetti_elemento(testo[self._inizio_elemento:i] if self._inizio_elemento is not None else "", eventi)
+                elif self._profondita == 0:
+                    self._emetti_valore(testo[self._inizio_valore:i] if self._inizio_valore is not None else "", eventi)
+                    self._completato = True
+            elif c == ":" and self._profondita == 1 and self._stato == "due_punti":
+                self._stato = "valore_atteso"
+            elif c == ",":
+                if self._profondita == 1 and self._stato == "valore":
+                    self._emetti_valore(testo[self._inizio_valore:i], eventi)
+                elif self._profondita == 2 and self._chiave_array is not None:
+                    self._emetti_elemento(testo[self._inizio_elemento:i] if self._inizio_elemento is not None else "", eventi)
+        return eventi
+
+    def _emetti_elemento(self, testo, eventi):
+        self._inizio_elemento = None
+        if not testo.strip():
+            return
+        try:
+            eventi.append((ELEMENTO, self._chiave_array, json.loads(testo)))
+        except ValueError:
+            pass
+
+    def _emetti_valore(self, testo, eventi):
+        chiave = self._chiave
+        self._stato = "chiave"
+        self._chiave = None
+        self._inizio_valore = None
+        self._chiave_array = None
+        self._inizio_elemento = None
+        if chiave is None or not testo.strip():
+            return
+        try:
+            eventi.append((VALORE, chiave, json.loads(testo)))
+        except ValueError:
+            pass
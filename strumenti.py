@@ -0,0 +1,111 @@
+# strumenti.py
+"""
+Funzioni di supporto del motore di analisi senza dipendenze dall'interfaccia:
+hash del contenuto, upload e processamento dei video, pulizia e verifica delle
+risposte JSON. Le usano analisi, CLI batch e servizio HTTP senza caricare
+Streamlit; utils le riesporta per le pagine.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import time
+import backend
+import file_registry
+import governatore
+import poller
+import tracciamento
+import upload_stream
+
+
+def calcola_hash_video(uploaded_file, chunk_size=1024 * 1024):
+    """Calcola lo SHA-256 del contenuto del video leggendolo a blocchi."""
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for blocco in iter(lambda: uploaded_file.read(chunk_size), b""):
+        digest.update(blocco)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def prepara_video(uploaded_file, display_name="video", content_hash=None, log=None):
+    """
+    Carica (o riusa) il video su Gemini e attende la fine del processamento,
+    senza chiamate all'interfaccia: può essere eseguita in un thread separato.
+    Restituisce il file remoto e i tempi delle singole fasi.
+    Solleva poller.ElaborazioneFallita se il processamento fallisce.
+    """
+    log = log or (lambda messaggio: None)
+    inizio = time.perf_counter()
+    if content_hash is None:
+        content_hash = calcola_hash_video(uploaded_file)
+    registry = file_registry.get_default_registry()
+    caricato = False
+
+    def _upload():
+        nonlocal caricato
+        caricato = True
+        log(f"Caricamento di '{display_name}'...")
+        return upload_stream.carica_stream(
+            backend.get_default_backend(),
+            uploaded_file,
+            getattr(uploaded_file, "name", display_name),
+            display_name=f"{file_registry.PREFISSO_REMOTO}{content_hash[:16]}:{display_name}",
+            api_key=None if backend.locale() else os.getenv("GEMINI_API_KEY"),
+        )
+
+    with tracciamento.span("upload", video=display_name) as attributi:
+        file_gemini = registry.acquire(content_hash, _upload)
+        attributi["riusato"] = not caricato
+    fine_upload = time.perf_counter()
+
+    log(f"Processamento di '{display_name}'...")
+    try:
+        with tracciamento.span("processamento", video=display_name):
+            file_gemini = poller.get_default_poller().wait(file_gemini)
+    except poller.ElaborazioneFallita:
+        registry.invalidate(content_hash)
+        raise
+    fine = time.perf_counter()
+
+    tempi = {
+        "video": display_name,
+        "upload_s": round(fine_upload - inizio, 2),
+        "processamento_s": round(fine - fine_upload, 2),
+        "totale_s": round(fine - inizio, 2),
+        "riusato": not caricato,
+    }
+    return file_gemini, tempi
+
+
+def prepara_video_concorrenti(video):
+    """
+    Carica e processa più video in parallelo. `video` è una lista di tuple
+    (uploaded_file, display_name, content_hash). Restituisce (file, tempi)
+    nello stesso ordine. Se un video fallisce, gli upload non ancora avviati
+    vengono annullati e l'errore viene propagato; quelli già in corso
+    terminano in background e restano nel registro per essere riusati.
+    """
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(video), thread_name_prefix="advisor-upload")
+    try:
+        futures = [pool.submit(governatore.propaga(prepara_video), f, nome, h) for f, nome, h in video]
+        completati, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+        for future in futures:
+            if future in completati and future.exception() is not None:
+                raise future.exception()
+        return [future.result() for future in futures]
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def pulisci_risposta_json(testo):
+    """Rimuove i delimitatori di codice markdown attorno alla risposta JSON del modello."""
+    return testo.strip().replace("```json", "").replace("```", "")
+
+
+def is_valid_json(testo):
+    """Verifica che il testo sia un oggetto JSON valido (usato prima di salvare in cache)."""
+    try:
+        return isinstance(json.loads(testo), dict)
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,63 @@
+# tests/conftest.py
+"""
+Fixture comuni: ogni test usa il backend locale di fake_gemini (senza rete né
+quota, latenze a zero) e una cartella di cache temporanea, con i servizi
+condivisi del processo ricreati da capo.
+"""
+import collections
+import pytest
+import approfondimenti
+import backend
+import colonnare
+import file_registry
+import governatore
+import lavori
+import linee_guida
+import poller
+import result_cache
+import riduzione
+import store
+
+SINGLETON = [
+    (approfondimenti, "_default_gestore"),
+    (backend, "_default_backend"),
+    (colonnare, "_default_esportatore"),
+    (file_registry, "_default_registry"),
+    (governatore, "_default_governatore"),
+    (lavori, "_default_gestore"),
+    (linee_guida, "_default_registro"),
+    (poller, "_default_poller"),
+    (result_cache, "_default_cache"),
+    (riduzione, "_default_cache"),
+    (store, "_default_store"),
+]
+
+
+@pytest.fixture
+def ambiente(tmp_path, monkeypatch):
+    """Backend locale e cartelle di lavoro temporanee; restituisce la cartella della cache."""
+    cache = tmp_path / "cache"
+    variabili = {
+        "ADVISOR_BACKEND": "fake",
+        "ADVISOR_CACHE_DIR": str(cache),
+        "ADVISOR_DB_PATH": str(cache / "analisi.sqlite3"),
+        "ADVISOR_FAKE_UPLOAD_S": "0",
+        "ADVISOR_FAKE_PROCESSING_S": "0",
+        "ADVISOR_FAKE_FIRST_TOKEN_S": "0",
+        "ADVISOR_FAKE_GENERATION_S": "0",
+        "ADVISOR_RATE_LIMIT_RETRIES": "2",
+    }
+    for nome, valore in variabili.items():
+        monkeypatch.setenv(nome, valore)
+    for modulo, nome in SINGLETON:
+        monkeypatch.setattr(modulo, nome, None)
+    # Il file .env dello sviluppatore non deve influire sui test.
+    monkeypatch.setattr(backend, "_ambiente_caricato", True)
+    monkeypatch.setattr(backend, "_modelli", collections.OrderedDict())
+    return cache
+
+
+@pytest.fixture
+def fake(ambiente):
+    """Il backend locale condiviso dal processo per il test."""
+    return backend.get_default_backend()
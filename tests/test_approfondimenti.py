@@ -0,0 +1,89 @@
+# tests/test_approfondimenti.py
+import io
+import pytest
+import approfondimenti
+import fake_gemini
+import file_registry
+import riduzione
+import strumenti
+
+
+def _gestore(fake):
+    return approfondimenti.GestoreContesti(api=fake, ttl_s=600)
+
+
+def test_rifiuto_della_cache_ricordato_fino_alla_scadenza(fake):
+    gestore = _gestore(fake)
+    chiamate = []
+
+    def crea(ttl):
+        chiamate.append(ttl)
+        raise fake_gemini.InvalidArgument("Contesto troppo piccolo per la cache")
+
+    assert gestore.ottieni("chiave", crea) is None
+    assert gestore.ottieni("chiave", crea) is None
+    assert len(chiamate) == 1
+    assert gestore.stats()["senza_cache"] == 2
+
+
+@pytest.mark.parametrize("errore", [approfondimenti.VideoNonDisponibile("ricarica il video"),
+                                    ConnectionError("rete non raggiungibile")])
+def test_gli_altri_errori_si_propagano_senza_voce(fake, errore):
+    gestore = _gestore(fake)
+    contesto = object()
+    risposte = [errore, contesto]
+
+    def crea(ttl):
+        risposta = risposte.pop(0)
+        if isinstance(risposta, Exception):
+            raise risposta
+        return risposta
+
+    with pytest.raises(type(errore)):
+        gestore.ottieni("chiave", crea)
+    # Dopo aver ricaricato il video la domanda successiva crea il contesto.
+    assert gestore.ottieni("chiave", crea) is contesto
+
+
+def test_video_analizzato_tramite_proxy_ricaricato_come_proxy(fake, monkeypatch):
+    sorgente = io.BytesIO(b"master del video")
+    sorgente.name = "spot.mov"
+    hash_master = strumenti.calcola_hash_video(sorgente)
+    hash_analisi = riduzione.hash_proxy(hash_master, "bilanciato")
+
+    class ProxyCacheFinta:
+        def prepara(self, video, source_hash, preset):
+            assert (source_hash, preset) == (hash_master, "bilanciato")
+            proxy = io.BytesIO(b"proxy")
+            proxy.name = "spot.mp4"
+            return proxy, riduzione.hash_proxy(source_hash, preset), {}
+
+    monkeypatch.setattr(riduzione, "get_default_proxy_cache", ProxyCacheFinta)
+
+    file_remoto = approfondimenti._file_del_video(hash_analisi, sorgente)
+
+    registro = file_registry.get_default_registry()
+    assert registro.lookup(hash_analisi).name == file_remoto.name
+    assert registro.lookup(hash_master) is None
+    # La domanda successiva ritrova il proxy senza ricaricarlo.
+    assert approfondimenti._file_del_video(hash_analisi, None).name == file_remoto.name
+    assert fake.chiamate["upload_file"] == 1
+
+
+def test_senza_sorgente_il_video_non_e_disponibile(fake):
+    with pytest.raises(approfondimenti.VideoNonDisponibile):
+        approfondimenti._file_del_video("hash-sconosciuto", None)
+
+
+def test_domanda_su_contenuto_sotto_il_minimo_della_cache(fake):
+    sorgente = io.BytesIO(b"video")
+    sorgente.name = "spot.mp4"
+    fake.caching.token_minimi = 10 ** 9
+    gestore = _gestore(fake)
+
+    risposta, info = approfondimenti.chiedi(strumenti.calcola_hash_video(sorgente), '{"verdetto_complessivo": "OK"}',
+                                            "Cosa succede al secondo 3?", sorgente=sorgente, gestore=gestore)
+
+    assert risposta
+    assert info["da_contesto"] is False
+    assert gestore.stats()["senza_cache"] == 1
@@ -0,0 +1,44 @@
+# tests/test_benchmark_multiplo.py
+import io
+import analisi
+
+
+def _video(contenuto, nome):
+    f = io.BytesIO(contenuto)
+    f.name = nome
+    return f, nome, None
+
+
+def test_etichette_univoche_senza_collisioni():
+    assert analisi.etichette_univoche(["a.mp4", "a.mp4", "a.mp4 (2)"]) == ["a.mp4", "a.mp4 (3)", "a.mp4 (2)"]
+    assert analisi.etichette_univoche(["Il Tuo Video", "b.mp4", "Il Tuo Video"]) == [
+        "Il Tuo Video", "b.mp4", "Il Tuo Video (2)"]
+
+
+def test_video_con_lo_stesso_nome_restano_distinti(fake):
+    video = [_video(b"tuo", "a.mp4"), _video(b"competitor 1", "a.mp4"), _video(b"competitor 2", "a.mp4 (2)")]
+
+    esito = analisi.analizza_benchmark_multiplo(video, paese="Italia")
+
+    assert list(esito["estrazioni"]) == [0, 1, 2] and esito["errori"] == {}
+    assert len(set(esito["etichette"])) == 3 and esito["etichette"][0] == "a.mp4"
+    assert esito["richieste_eseguite"] == 3
+    # La seconda volta tutte e tre le estrazioni vengono dalla cache, ognuna per il proprio contenuto.
+    assert analisi.analizza_benchmark_multiplo(video, paese="Italia")["richieste_eseguite"] == 0
+
+
+def test_errore_di_un_competitor_per_posizione(fake, monkeypatch):
+    estrai = analisi._estrai_benchmark_video
+
+    def estrai_o_fallisci(sorgente, display_name, content_hash, prompt):
+        if sorgente.getvalue() == b"competitor 1":
+            raise RuntimeError("video danneggiato")
+        return estrai(sorgente, display_name, content_hash, prompt)
+
+    monkeypatch.setattr(analisi, "_estrai_benchmark_video", estrai_o_fallisci)
+    video = [_video(b"tuo", "spot.mp4"), _video(b"competitor 1", "spot.mp4"), _video(b"competitor 2", "spot.mp4")]
+
+    esito = analisi.analizza_benchmark_multiplo(video)
+
+    assert list(esito["estrazioni"]) == [0, 2]
+    assert esito["errori"] == {1: "video danneggiato"}
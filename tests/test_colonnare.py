@@ -0,0 +1,60 @@
+# tests/test_colonnare.py
+import json
+import os
+import pytest
+import colonnare
+import store
+
+
+def _risultato(*status):
+    return json.dumps({"verdetto_complessivo": "CONSIGLIATO", "checklist_analisi": [
+        {"categoria": "Simboli", "punto_analizzato": f"Punto {i}", "status": s} for i, s in enumerate(status)]})
+
+
+@pytest.fixture
+def archivio(tmp_path):
+    archivio = store.AnalysisStore(str(tmp_path / "analisi.sqlite3"))
+    for i in range(4):
+        archivio.salva("checker", f"hash-{i}", _risultato("OK", "CRITICO"), mercato="Italia")
+    return archivio
+
+
+def _esportatore(tmp_path, archivio):
+    return colonnare.EsportatoreColonnare(str(tmp_path / "colonnare"), archivio, blocco=1)
+
+
+def test_esportazione_compattata(tmp_path, archivio, monkeypatch):
+    monkeypatch.setattr(colonnare, "MAX_PARTI", 3)
+    esportatore = _esportatore(tmp_path, archivio)
+
+    tabelle = esportatore.tabelle()
+
+    assert len(tabelle["analisi"]) == 4 and len(tabelle["checklist"]) == 8
+    assert [(primo, ultimo) for primo, ultimo, _ in esportatore._file_parti("analisi")] == [(1, 4)]
+
+
+def test_compattazione_interrotta_non_conta_due_volte(tmp_path, archivio, monkeypatch):
+    monkeypatch.setattr(colonnare, "MAX_PARTI", 3)
+    rimuovi = os.remove
+
+    def interrotta(path):
+        # Il processo termina dopo aver scritto il file compattato, prima di eliminare le parti.
+        monkeypatch.setattr(colonnare.os, "remove", rimuovi)
+        raise OSError("processo interrotto")
+
+    monkeypatch.setattr(colonnare.os, "remove", interrotta)
+    with pytest.raises(OSError):
+        _esportatore(tmp_path, archivio).aggiorna()
+    assert len(_esportatore(tmp_path, archivio)._file_parti("checklist")) == 5
+
+    riavviato = _esportatore(tmp_path, archivio)
+    tabelle = riavviato.tabelle()
+    assert sorted(tabelle["analisi"]["id"]) == [1, 2, 3, 4]
+    assert len(tabelle["checklist"]) == 8
+    assert colonnare.categorie_critiche(tabelle["checklist"], tabelle["analisi"]).loc["Simboli", "voci"] == 4
+
+    # Alla compattazione successiva restano solo i file validi.
+    archivio.salva("checker", "hash-4", _risultato("CRITICO"), mercato="Italia")
+    assert riavviato.aggiorna() == 1
+    assert len(riavviato._file_parti("checklist")) == len(riavviato._parti("checklist")) == 2
+    assert len(riavviato.tabelle()["checklist"]) == 9
@@ -0,0 +1,132 @@
+# tests/test_file_registry.py
+import datetime
+import io
+from types import SimpleNamespace
+import fake_gemini
+import file_registry
+
+
+def _registro(tmp_path, api, **opzioni):
+    return file_registry.FileRegistry(str(tmp_path / "remote_files.json"), api, **opzioni)
+
+
+def _carica(api, display_name="advisor:video"):
+    return lambda: api.upload_file(io.BytesIO(b"video"), display_name=display_name)
+
+
+def test_riusa_il_file_caricato_per_lo_stesso_contenuto(tmp_path):
+    api = fake_gemini.FakeFileAPI()
+    registro = _registro(tmp_path, api)
+
+    primo = registro.acquire("hash-a", _carica(api))
+    secondo = registro.acquire("hash-a", _carica(api))
+
+    assert secondo.name == primo.name
+    assert api.chiamate["upload_file"] == 1
+    assert registro.stats() == {"file_attivi": 1, "riusi": 1, "upload": 1}
+
+
+def test_il_registro_sopravvive_al_riavvio(tmp_path):
+    api = fake_gemini.FakeFileAPI()
+    primo = _registro(tmp_path, api).acquire("hash-a", _carica(api))
+
+    riaperto = _registro(tmp_path, api)
+
+    assert riaperto.lookup("hash-a").name == primo.name
+
+
+def test_ricarica_il_file_vicino_alla_scadenza(tmp_path):
+    # Il file scade tra 100 secondi, meno del margine: non va più usato.
+    api = fake_gemini.FakeFileAPI(scadenza_secondi=100)
+    registro = _registro(tmp_path, api, margine_secondi=600)
+
+    primo = registro.acquire("hash-a", _carica(api))
+    secondo = registro.acquire("hash-a", _carica(api))
+
+    assert secondo.name != primo.name
+    assert api.chiamate["upload_file"] == 2
+    # La copia scaduta viene eliminata dal servizio.
+    assert primo.name not in {f.name for f in api.list_files()}
+
+
+def test_ricarica_se_il_file_remoto_non_esiste_piu(tmp_path):
+    api = fake_gemini.FakeFileAPI()
+    registro = _registro(tmp_path, api)
+    primo = registro.acquire("hash-a", _carica(api))
+    api.delete_file(primo.name)
+
+    assert registro.lookup("hash-a") is None
+    assert registro.acquire("hash-a", _carica(api)).name != primo.name
+
+
+def test_il_file_fallito_non_viene_riusato(tmp_path):
+    api = fake_gemini.FakeFileAPI()
+    registro = _registro(tmp_path, api)
+    primo = registro.acquire("hash-a", _carica(api))
+    api.fail(primo.name)
+
+    assert registro.lookup("hash-a") is None
+    assert registro.stats()["file_attivi"] == 0
+
+
+def test_gc_elimina_gli_orfani_di_advisor_e_le_voci_scadute(tmp_path):
+    api = fake_gemini.FakeFileAPI()
+    registro = _registro(tmp_path, api, grazia_orfani=0)
+    registrato = registro.acquire("hash-a", _carica(api))
+    orfano = _carica(api, "advisor:interrotto")()
+    legacy = _carica(api, "video_checker_file")()
+    estraneo = _carica(api, "caricato da un altro strumento")()
+    scaduto = SimpleNamespace(name="files/scaduto", display_name="advisor:vecchio",
+                              expiration_time=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc))
+    registro.register("hash-scaduto", scaduto)
+
+    eliminati = registro.collect_garbage(forza=True)
+
+    rimasti = {f.name for f in api.list_files()}
+    assert rimasti == {registrato.name, estraneo.name}
+    assert orfano.name not in rimasti and legacy.name not in rimasti
+    assert eliminati == 3
+    assert registro.lookup("hash-scaduto") is None
+    assert registro.lookup("hash-a").name == registrato.name
+
+
+def test_gc_rispetta_il_periodo_di_grazia_e_l_intervallo(tmp_path):
+    api = fake_gemini.FakeFileAPI()
+    registro = _registro(tmp_path, api, grazia_orfani=3600, intervallo_gc=900)
+    orfano = _carica(api, "advisor:in-corso")()
+
+    assert registro.collect_garbage(forza=True) == 0
+    assert orfano.name in {f.name for f in api.list_files()}
+    # Entro l'intervallo la raccolta non interroga nemmeno il servizio.
+    chiamate = api.chiamate["list_files"]
+    registro.collect_garbage()
+    assert api.chiamate["list_files"] == chiamate
+
+
+def test_due_processi_condividono_il_registro(tmp_path):
+    # Due istanze sullo stesso file, come la pagina Streamlit e il servizio HTTP.
+    api = fake_gemini.FakeFileAPI()
+    pagina = _registro(tmp_path, api, grazia_orfani=0)
+    servizio = _registro(tmp_path, api, grazia_orfani=0)
+
+    del_servizio = servizio.acquire("hash-servizio", _carica(api))
+    della_pagina = pagina.acquire("hash-pagina", _carica(api))
+    pagina.collect_garbage(forza=True)
+
+    rimasti = {f.name for f in api.list_files()}
+    assert {del_servizio.name, della_pagina.name} <= rimasti
+    riaperto = _registro(tmp_path, api)
+    assert riaperto.lookup("hash-servizio").name == del_servizio.name
+    assert riaperto.lookup("hash-pagina").name == della_pagina.name
+    assert pagina.acquire("hash-servizio", _carica(api)).name == del_servizio.name
+    assert api.chiamate["upload_file"] == 2
+
+
+def test_lock_per_hash_in_numero_fisso(tmp_path):
+    api = fake_gemini.FakeFileAPI()
+    registro = _registro(tmp_path, api)
+
+    for i in range(200):
+        registro.acquire(f"hash-{i}", _carica(api))
+
+    assert len(registro._hash_locks) == file_registry.STRISCE_LOCK
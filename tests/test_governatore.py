@@ -0,0 +1,133 @@
+# tests/test_governatore.py
+import threading
+import time
+import types
+import pytest
+import governatore
+
+
+class Orologio:
+    def __init__(self, ora=1000.0):
+        self.ora = ora
+
+    def __call__(self):
+        return self.ora
+
+
+class TroppeRichieste(Exception):
+    code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("quota esaurita")
+        self.headers = {"Retry-After": str(retry_after)}
+
+
+@pytest.fixture
+def orologio(monkeypatch):
+    """Il tempo del governatore avanza solo quando lo sposta il test."""
+    orologio = Orologio()
+    monkeypatch.setattr(governatore, "time", types.SimpleNamespace(monotonic=orologio))
+    return orologio
+
+
+def _attendi(condizione, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while not condizione():
+        assert time.monotonic() < limite, "condizione non raggiunta"
+        time.sleep(0.005)
+
+
+def _avanza(gov, orologio, secondi):
+    with gov._cond:
+        orologio.ora += secondi
+        gov._cond.notify_all()
+
+
+def _in_coda(gov):
+    return gov.stats()["in_coda_generazione"]
+
+
+def _richiesta(gov, id_sessione, serviti, **opzioni):
+    def esegui():
+        with governatore.sessione(id_sessione):
+            gov.genera(lambda: serviti.append(id_sessione), **opzioni)
+    thread = threading.Thread(target=esegui, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_bucket_si_ricarica_al_ritmo_configurato(orologio):
+    bucket = governatore.TokenBucket(capacita=10, ricarica=2)
+    bucket.preleva(10)
+
+    assert bucket.attesa(4, orologio.ora) == 2.0
+    assert bucket.attesa(4, orologio.ora + 1) == 1.0
+    assert bucket.attesa(4, orologio.ora + 2) == 0.0
+    # Oltre la capacità si attende solo il pieno, e il livello non la supera.
+    assert bucket.attesa(50, orologio.ora + 3) == 2.0
+    assert bucket.attesa(1, orologio.ora + 100) == 0.0
+    assert bucket.livello == 10
+
+
+def test_stima_dei_token_rettificata_con_quelli_effettivi(orologio):
+    gov = governatore.Governatore(tpm=600)
+
+    gov.genera(lambda: "risposta", token_stimati=500, token_effettivi=lambda _: 100)
+
+    assert gov._bucket["token"].livello == 500
+    assert gov.stats()["token_usati"] == 100
+
+
+def test_sessioni_servite_a_turno(orologio):
+    # Ogni richiesta consuma l'intero bucket: ne passa una per ogni minuto di ricarica.
+    gov = governatore.Governatore(tpm=60)
+    gov.genera(lambda: None, token_stimati=60)
+    serviti = []
+    threads = []
+    for id_sessione in ("A", "A", "A", "B"):
+        threads.append(_richiesta(gov, id_sessione, serviti, token_stimati=60))
+        _attendi(lambda: _in_coda(gov) == len(threads))
+
+    for n in range(1, 5):
+        _avanza(gov, orologio, 60)
+        _attendi(lambda: len(serviti) == n)
+
+    for thread in threads:
+        thread.join(timeout=5)
+    # B, arrivata per ultima, non attende che A abbia esaurito le sue richieste.
+    assert serviti == ["A", "B", "A", "A"]
+    assert gov.stats()["sessioni_in_attesa_generazione"] == 0
+
+
+def test_429_con_retry_after_mette_in_pausa_tutta_la_coda(orologio):
+    gov = governatore.Governatore()
+    serviti = []
+    risposte = [TroppeRichieste(retry_after=30)]
+
+    def prima():
+        if risposte:
+            raise risposte.pop()
+        serviti.append("A")
+
+    def esegui():
+        with governatore.sessione("A"):
+            gov.genera(prima)
+
+    thread_a = threading.Thread(target=esegui, daemon=True)
+    thread_a.start()
+    _attendi(lambda: _in_coda(gov) == 1)
+    thread_b = _richiesta(gov, "B", serviti)
+    _attendi(lambda: _in_coda(gov) == 2)
+
+    assert gov.stats()["pausa_generazione_s"] == 30.0
+    _avanza(gov, orologio, 29)
+    time.sleep(0.05)
+    assert serviti == [] and _in_coda(gov) == 2
+
+    _avanza(gov, orologio, 1)
+    thread_a.join(timeout=5)
+    thread_b.join(timeout=5)
+
+    assert serviti == ["A", "B"]
+    stats = gov.stats()
+    assert (stats["rate_limit"], stats["ripetute"], stats["richieste"]) == (1, 1, 2)
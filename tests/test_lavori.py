@@ -0,0 +1,97 @@
+# tests/test_lavori.py
+import os
+import threading
+import time
+import types
+import pytest
+import lavori
+
+
+class Orologio:
+    def __init__(self, ora=1_000_000.0):
+        self.ora = ora
+
+    def __call__(self):
+        return self.ora
+
+
+@pytest.fixture
+def orologio(monkeypatch):
+    orologio = Orologio()
+    monkeypatch.setattr(lavori, "time", types.SimpleNamespace(time=orologio))
+    return orologio
+
+
+@pytest.fixture
+def gestore():
+    gestore = lavori.GestoreLavori(max_concorrenti=1, conservazione_s=600)
+    yield gestore
+    gestore._pool.shutdown(wait=True)
+
+
+def _attendi(gestore, id_lavoro, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while not gestore.ottieni(id_lavoro).concluso:
+        assert time.monotonic() < limite, f"lavoro {id_lavoro} non concluso"
+        time.sleep(0.005)
+    return gestore.ottieni(id_lavoro)
+
+
+def test_lavori_oltre_il_massimo_restano_in_coda(gestore, orologio):
+    avviato, sblocca = threading.Event(), threading.Event()
+
+    def occupa(lavoro):
+        avviato.set()
+        return sblocca.wait(5)
+
+    primo = gestore.avvia("checker", "primo", occupa)
+    assert avviato.wait(5)
+    # Inviati nello stesso istante: l'ordine della coda è quello di invio.
+    secondo = gestore.avvia("checker", "secondo", lambda lavoro: "due")
+    terzo = gestore.avvia("checker", "terzo", lambda lavoro: "tre")
+
+    assert (gestore.stats()["in_coda"], gestore.stats()["max_concorrenti"]) == (2, 1)
+    assert [gestore.posizione_in_coda(i) for i in (primo, secondo, terzo)] == [0, 0, 1]
+
+    sblocca.set()
+    assert _attendi(gestore, terzo).esito == "tre"
+    assert _attendi(gestore, primo).esito is True
+    assert gestore.stats()["completati"] == 3
+
+
+def test_lavori_conclusi_dimenticati_dopo_la_conservazione(gestore, orologio):
+    vecchio = gestore.avvia("checker", "vecchio", lambda lavoro: "ok")
+    _attendi(gestore, vecchio)
+    orologio.ora += 500
+    recente = gestore.avvia("checker", "recente", lambda lavoro: "ok")
+    _attendi(gestore, recente)
+    sblocca = threading.Event()
+    in_corso = gestore.avvia("checker", "in corso", lambda lavoro: sblocca.wait(5))
+
+    orologio.ora += 200
+    gestore.avvia("checker", "successivo", lambda lavoro: "ok")
+
+    assert gestore.ottieni(vecchio) is None
+    assert gestore.ottieni(recente) is not None
+    assert gestore.ottieni(in_corso) is not None
+    sblocca.set()
+
+
+def test_errore_registrato_e_file_temporanei_eliminati(gestore, tmp_path):
+    file_temporaneo = tmp_path / "upload.mp4"
+    file_temporaneo.write_bytes(b"video")
+    cartella = tmp_path / "segmenti"
+    cartella.mkdir()
+    (cartella / "segmento_000.mp4").write_bytes(b"segmento")
+
+    def fallisce(lavoro):
+        lavoro.log("Caricamento del video...")
+        raise RuntimeError("elaborazione fallita")
+
+    lavoro = _attendi(gestore, gestore.avvia("checker", "video", fallisce,
+                                             file_temporanei=[str(file_temporaneo), str(cartella)]))
+
+    assert lavoro.stato == lavori.ERRORE
+    assert str(lavoro.errore) == "elaborazione fallita"
+    assert lavoro.messaggi == ["Caricamento del video..."]
+    assert not os.path.exists(file_temporaneo) and not os.path.exists(cartella)
@@ -0,0 +1,76 @@
+# tests/test_poller.py
+import io
+import pytest
+import fake_gemini
+import poller
+
+
+def _carica(api):
+    return api.upload_file(io.BytesIO(b"video"), display_name="advisor:video")
+
+
+def test_file_gia_attivo_senza_controlli():
+    api = fake_gemini.FakeFileAPI()
+    p = poller.ProcessingPoller(api)
+
+    file_remoto = _carica(api)
+
+    assert p.wait(file_remoto) is file_remoto
+    assert api.chiamate["get_file"] == 0
+
+
+def test_intervalli_crescenti_fino_ad_active():
+    # Pronto dopo 0,5 s: con intervalli fissi di 20 ms servirebbero ~25 controlli.
+    api = fake_gemini.FakeFileAPI(durata_processing=0.5)
+    p = poller.ProcessingPoller(api, intervallo_iniziale=0.02, fattore=2.0, intervallo_max=1.0)
+
+    attivo = p.wait(_carica(api), timeout=5)
+
+    assert attivo.state.name == "ACTIVE"
+    assert 1 <= api.chiamate["get_file"] <= 7
+    assert p.stats()["in_attesa"] == 0
+
+
+def test_stato_failed_durante_l_attesa():
+    api = fake_gemini.FakeFileAPI(durata_processing=60)
+    p = poller.ProcessingPoller(api, intervallo_iniziale=0.02)
+    file_remoto = _carica(api)
+    future = p.watch(file_remoto)
+    api.fail(file_remoto.name)
+
+    with pytest.raises(poller.ElaborazioneFallita):
+        future.result(timeout=5)
+
+
+def test_scadenza_massima():
+    api = fake_gemini.FakeFileAPI(durata_processing=60)
+    p = poller.ProcessingPoller(api, intervallo_iniziale=0.02, intervallo_max=0.05)
+
+    with pytest.raises(TimeoutError):
+        p.wait(_carica(api), timeout=0.2)
+    assert p.stats()["in_attesa"] == 0
+
+
+def test_attese_sullo_stesso_file_condividono_i_controlli():
+    api = fake_gemini.FakeFileAPI(durata_processing=0.3)
+    p = poller.ProcessingPoller(api, intervallo_iniziale=0.05, fattore=1.0, intervallo_max=0.05)
+    file_remoto = _carica(api)
+
+    futures = [p.watch(file_remoto, timeout=5) for _ in range(5)]
+
+    assert p.stats()["in_attesa"] == 1
+    assert all(f.result(timeout=5).name == file_remoto.name for f in futures)
+    # Un controllo ogni 50 ms per il file, non uno per attesa.
+    assert api.chiamate["get_file"] <= 10
+
+
+def test_molti_file_in_attesa_usano_list_files():
+    api = fake_gemini.FakeFileAPI(durata_processing=0.2)
+    p = poller.ProcessingPoller(api, intervallo_iniziale=0.05, soglia_batch=2)
+    file_remoti = [_carica(api) for _ in range(3)]
+
+    futures = [p.watch(f, timeout=5) for f in file_remoti]
+
+    assert [f.result(timeout=5).name for f in futures] == [f.name for f in file_remoti]
+    assert api.chiamate["list_files"] >= 1
+    assert api.chiamate["get_file"] == 0
@@ -0,0 +1,92 @@
+# tests/test_result_cache.py
+import pytest
+import result_cache
+
+
+class Orologio:
+    def __init__(self, ora=1_000_000.0):
+        self.ora = ora
+
+    def __call__(self):
+        return self.ora
+
+
+@pytest.fixture
+def orologio(monkeypatch):
+    orologio = Orologio()
+    monkeypatch.setattr(result_cache.time, "time", orologio)
+    return orologio
+
+
+def _cache(tmp_path, **opzioni):
+    return result_cache.ResultCache(str(tmp_path / "results"), **opzioni)
+
+
+def test_chiave_normalizzata():
+    base = result_cache.make_key("checker", ["h1"], paese=result_cache.normalizza_paese("Italia"),
+                                 controlli=result_cache.normalizza_controlli("Logo visibile\nNo competitor"))
+    stessa = result_cache.make_key("checker", ["h1"], controlli=result_cache.normalizza_controlli(
+        "  Logo   visibile \n\n No competitor\n"), paese="Italia")
+
+    assert stessa == base
+    assert result_cache.normalizza_paese("Nessuna selezione specifica") is None
+    assert result_cache.normalizza_controlli(None) == ""
+    assert result_cache.make_key("checker", ["h2"], paese="Italia", controlli="Logo visibile\nNo competitor") != base
+    assert result_cache.make_key("checker", ["h1", "h2"]) != result_cache.make_key("checker", ["h2", "h1"])
+    assert result_cache.make_key("benchmark", ["h1"], paese="Italia",
+                                 controlli="Logo visibile\nNo competitor") != base
+
+
+def test_scadenza_dalla_creazione(tmp_path, orologio):
+    cache = _cache(tmp_path, ttl_seconds=100)
+    cache.put("a", "risultato")
+
+    orologio.ora += 60
+    assert cache.get("a") == "risultato"
+    # Le letture non prolungano la validità del risultato.
+    orologio.ora += 60
+    assert cache.get("a") is None
+    assert cache.stats()["voci"] == 0
+
+
+def test_eviction_delle_voci_meno_usate_oltre_il_limite(tmp_path, orologio):
+    dimensione = len(b'{"creato": 1000000.0, "meta": {}, "valore": "xxxxxxxxxx"}')
+    cache = _cache(tmp_path, max_bytes=3 * dimensione)
+    for chiave in ("a", "b", "c"):
+        cache.put(chiave, "x" * 10)
+        orologio.ora += 1
+    assert cache.get("a") is not None
+    orologio.ora += 1
+
+    cache.put("d", "x" * 10)
+
+    assert cache.get("b") is None
+    assert [cache.get(chiave) is not None for chiave in ("a", "c", "d")] == [True, True, True]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_voci_scritte_da_un_altro_processo(tmp_path, orologio):
+    pagina = _cache(tmp_path)
+    servizio = _cache(tmp_path)
+
+    servizio.put("dal-servizio", "risultato")
+
+    assert pagina.get("dal-servizio") == "risultato"
+    orologio.ora += 60
+    assert pagina.stats()["voci"] == 1
+
+
+def test_il_limite_conta_anche_le_voci_degli_altri_processi(tmp_path, orologio):
+    dimensione = len(b'{"creato": 1000000.0, "meta": {}, "valore": "xxxxxxxxxx"}')
+    pagina = _cache(tmp_path, max_bytes=2 * dimensione)
+    servizio = _cache(tmp_path, max_bytes=2 * dimensione)
+    servizio.put("vecchia", "x" * 10)
+    orologio.ora += 1
+    servizio.put("recente", "x" * 10)
+    orologio.ora += 1
+
+    pagina.put("nuova", "x" * 10)
+
+    assert pagina.get("vecchia") is None
+    assert pagina.get("recente") == "x" * 10
+    assert pagina.stats()["voci"] == 2
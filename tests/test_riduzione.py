@@ -0,0 +1,87 @@
+# tests/test_riduzione.py
+import io
+import os
+import pytest
+import riduzione
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return riduzione.ProxyCache(str(tmp_path / "proxy"), max_bytes=300)
+
+
+def _sorgente(contenuto=b"x" * 1000, nome="spot.mov"):
+    sorgente = io.BytesIO(contenuto)
+    sorgente.name = nome
+    return sorgente
+
+
+def _proxy_su_disco(cache, source_hash, preset="bilanciato", size=100, mtime=None):
+    """Proxy già codificato in una richiesta precedente (i test non richiedono ffmpeg)."""
+    chiave = riduzione.hash_proxy(source_hash, preset)
+    path = cache._path(chiave)
+    with open(path, "wb") as f:
+        f.write(b"p" * size)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return chiave
+
+
+def _presenti(cache, *chiavi):
+    return [os.path.exists(cache._path(chiave)) for chiave in chiavi]
+
+
+def test_senza_riduzione_si_carica_il_sorgente(cache):
+    sorgente = _sorgente()
+
+    video, hash_video, report = cache.prepara(sorgente, "h-master", riduzione.NESSUNA_RIDUZIONE)
+
+    assert video is sorgente and hash_video == "h-master"
+    assert report["bytes_caricati"] == report["bytes_originale"] == 1000
+
+
+def test_proxy_riutilizzato_dalla_cache(cache):
+    chiave = _proxy_su_disco(cache, "h-master")
+
+    proxy, hash_video, report = cache.prepara(_sorgente(), "h-master", "bilanciato")
+
+    with proxy:
+        assert proxy.name == "spot.mp4" and proxy.read() == b"p" * 100
+    assert hash_video == chiave != riduzione.hash_proxy("h-master", "rapido")
+    assert report["proxy_da_cache"] and report["bytes_caricati"] == 100
+
+
+def test_proxy_non_piu_piccolo_del_sorgente(cache):
+    _proxy_su_disco(cache, "h-master", size=200)
+    sorgente = _sorgente(b"x" * 150)
+
+    video, hash_video, report = cache.prepara(sorgente, "h-master", "bilanciato")
+
+    assert video is sorgente and hash_video == "h-master"
+    assert report["proxy_non_conveniente"] and report["bytes_caricati"] == 150
+
+
+def test_eviction_dei_proxy_meno_recenti(cache):
+    vecchio = _proxy_su_disco(cache, "h1", mtime=1000)
+    usato_di_recente = _proxy_su_disco(cache, "h2", mtime=1001)
+    recente = _proxy_su_disco(cache, "h3", mtime=1002)
+    # Riutilizzarlo lo rende il più recente.
+    cache.prepara(_sorgente(), "h2", "bilanciato")[0].close()
+
+    nuovo = _proxy_su_disco(cache, "h4", size=200)
+    cache._evict()
+
+    assert _presenti(cache, vecchio, recente, usato_di_recente, nuovo) == [False, False, True, True]
+
+
+def test_proxy_in_uso_escluso_dall_eviction(cache):
+    in_uso = _proxy_su_disco(cache, "h1", mtime=1000)
+    libero = _proxy_su_disco(cache, "h2", mtime=1001)
+    _proxy_su_disco(cache, "h3", mtime=1002)
+    # Un'altra analisi lo sta preparando o aprendo.
+    cache._in_uso[in_uso] = 1
+
+    _proxy_su_disco(cache, "h4")
+    cache._evict()
+
+    assert _presenti(cache, in_uso, libero) == [True, False]
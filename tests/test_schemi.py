@@ -0,0 +1,137 @@
+# tests/test_schemi.py
+import json
+import pytest
+import analisi
+import fake_gemini
+import schemi
+
+
+def _base_valida():
+    return fake_gemini.esempio_da_schema(schemi.BASE)
+
+
+def test_risposta_conforme_senza_sezioni_difettose():
+    assert schemi.sezioni_non_valide(_base_valida(), schemi.BASE) == {}
+
+
+def test_sezione_mancante():
+    dati = _base_valida()
+    del dati["checklist_analisi"]
+
+    assert schemi.sezioni_non_valide(dati, schemi.BASE) == {"checklist_analisi": ["$.checklist_analisi: mancante"]}
+
+
+def test_errori_annidati_invalidano_solo_la_loro_sezione():
+    dati = _base_valida()
+    dati["checklist_analisi"][1]["status"] = "FORSE"
+    del dati["checklist_analisi"][0]["motivazione"]
+
+    difettose = schemi.sezioni_non_valide(dati, schemi.BASE)
+
+    assert list(difettose) == ["checklist_analisi"]
+    assert sorted(difettose["checklist_analisi"]) == [
+        "$.checklist_analisi[0].motivazione: mancante",
+        "$.checklist_analisi[1].status: valore 'FORSE' non ammesso",
+    ]
+
+
+def test_tipi_sbagliati():
+    dati = _base_valida()
+    dati["motivazione_verdetto"] = 3
+    dati["checklist_analisi"] = {"categoria": "x"}
+
+    difettose = schemi.sezioni_non_valide(dati, schemi.BASE)
+
+    assert set(difettose) == {"motivazione_verdetto", "checklist_analisi"}
+    assert difettose["motivazione_verdetto"] == ["$.motivazione_verdetto: atteso STRING, trovato int"]
+
+
+def test_un_booleano_non_vale_come_numero():
+    assert schemi.valida(True, schemi.NUMERO) == ["$: atteso NUMBER, trovato bool"]
+
+
+@pytest.mark.parametrize("dati", [None, [], "testo"])
+def test_risposta_non_oggetto_invalida_tutte_le_sezioni_obbligatorie(dati):
+    difettose = schemi.sezioni_non_valide(dati, schemi.BENCHMARK)
+
+    assert set(difettose) == {"analisi_tuo_video", "analisi_video_competitor", "tabella_comparativa",
+                              "analisi_comparativa"}
+
+
+def test_sottoschema_e_schema_sezione():
+    ridotto = schemi.sottoschema(schemi.BASE, ["checklist_analisi"])
+
+    assert ridotto["required"] == ["checklist_analisi"]
+    assert schemi.schema_sezione("notizie_recenti")["required"] == ["notizie_recenti"]
+    assert schemi.schema_sezione("base") is schemi.BASE
+
+
+# --- Riparazione mirata in analisi._genera_validato ---
+
+def _risposte(monkeypatch, *testi):
+    """Sostituisce _genera_json con risposte prefissate e registra le richieste."""
+    richieste = []
+    coda = list(testi)
+
+    def genera(contenuti, schema, timeout=600, eventi=None):
+        richieste.append((contenuti[0], schema))
+        return coda.pop(0)
+
+    monkeypatch.setattr(analisi, "_genera_json", genera)
+    return richieste
+
+
+def test_risposta_valida_senza_riparazione(monkeypatch):
+    richieste = _risposte(monkeypatch, json.dumps(_base_valida()))
+
+    testo, riparate, residui = analisi._genera_validato("prompt", [], schemi.BASE)
+
+    assert json.loads(testo) == _base_valida()
+    assert (riparate, residui) == ([], {})
+    assert len(richieste) == 1
+
+
+def test_ripara_solo_la_sezione_difettosa(monkeypatch):
+    dati = _base_valida()
+    dati["motivazione_verdetto"] = "Motivazione originale"
+    dati["checklist_analisi"][0]["status"] = "FORSE"
+    corretta = _base_valida()["checklist_analisi"]
+    richieste = _risposte(monkeypatch, json.dumps(dati), json.dumps({"checklist_analisi": corretta}))
+    prima = schemi.statistiche.stats()
+
+    testo, riparate, residui = analisi._genera_validato("prompt", [], schemi.BASE)
+
+    assert (riparate, residui) == (["checklist_analisi"], {})
+    finale = json.loads(testo)
+    assert finale["checklist_analisi"] == corretta
+    assert finale["motivazione_verdetto"] == "Motivazione originale"
+    prompt_riparazione, schema_riparazione = richieste[1]
+    assert schema_riparazione["required"] == ["checklist_analisi"]
+    assert "checklist_analisi" in prompt_riparazione and "FORSE" in prompt_riparazione
+    dopo = schemi.statistiche.stats()
+    assert dopo["sezioni_riparate"] - prima["sezioni_riparate"] == 1
+    assert dopo["rerun_evitati"] - prima["rerun_evitati"] == 1
+
+
+def test_riparazione_fallita_restituisce_i_residui(monkeypatch):
+    dati = _base_valida()
+    del dati["verdetto_complessivo"]
+    _risposte(monkeypatch, json.dumps(dati), "non è JSON")
+    prima = schemi.statistiche.stats()
+
+    testo, riparate, residui = analisi._genera_validato("prompt", [], schemi.BASE)
+
+    assert riparate == []
+    assert set(residui) == {"verdetto_complessivo"}
+    assert "verdetto_complessivo" not in json.loads(testo)
+    assert schemi.statistiche.stats()["riparazioni_fallite"] - prima["riparazioni_fallite"] == 1
+
+
+def test_risposta_non_decodificabile_riparata_per_intero(monkeypatch):
+    _risposte(monkeypatch, "```json\n{troncato", json.dumps(_base_valida()))
+
+    testo, riparate, residui = analisi._genera_validato("prompt", [], schemi.BASE)
+
+    assert riparate == ["verdetto_complessivo", "motivazione_verdetto", "checklist_analisi"]
+    assert residui == {}
+    assert json.loads(testo) == _base_valida()
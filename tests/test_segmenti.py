@@ -0,0 +1,120 @@
+# tests/test_segmenti.py
+import segmenti
+
+
+def _voce(punto, status, categoria="Simboli", **istanti):
+    return dict(categoria=categoria, punto_analizzato=punto, status=status, motivazione=f"{punto}: {status}", **istanti)
+
+
+def _analisi(verdetto, *voci, motivazione="m"):
+    return {"verdetto_complessivo": verdetto, "motivazione_verdetto": motivazione, "checklist_analisi": list(voci)}
+
+
+# --- Rianalisi delle sole parti modificate (base) ---
+
+def test_rimontaggio_che_elimina_una_segnalazione():
+    base = _analisi(
+        "NON_CONSIGLIATO",
+        dict(_voce("Call to action ingannevole", "CRITICO"), timestamp=[[40.0, 48.0]]),
+        dict(_voce("Casting", "OK", categoria="DE&I"), timestamp=[[0.0, 30.0]]),
+        motivazione="CTA ingannevole",
+    )
+    nuova_cta = _analisi("CONSIGLIATO", _voce("Logo finale", "OK", inizio_s=2, fine_s=6), motivazione="CTA corretta")
+
+    unito = segmenti.unisci_segmenti([(38.0, 50.0, nuova_cta)], base=base)
+
+    assert unito["verdetto_complessivo"] == "CONSIGLIATO"
+    assert "CTA ingannevole" not in unito["motivazione_verdetto"]
+    punti = {v["punto_analizzato"]: v for v in unito["checklist_analisi"]}
+    assert set(punti) == {"Casting", "Logo finale"}
+    assert punti["Logo finale"]["timestamp"] == [[40.0, 44.0]]
+
+
+def test_voce_ritrovata_prende_il_nuovo_status():
+    # Analisi precedente non segmentata: le voci non hanno istanti.
+    base = _analisi("NON_CONSIGLIATO", _voce("Gesto della mano", "CRITICO"))
+    corretta = _analisi("CONSIGLIATO", _voce("Gesto della mano", "OK"))
+
+    unito = segmenti.unisci_segmenti([(10.0, 20.0, corretta)], base=base)
+
+    voce, = unito["checklist_analisi"]
+    assert voce["status"] == "OK"
+    assert voce["timestamp"] == [[10.0, 20.0]]
+    assert unito["verdetto_complessivo"] == "CONSIGLIATO"
+
+
+def test_segnalazioni_fuori_dalle_parti_modificate_restano():
+    base = _analisi(
+        "NON_CONSIGLIATO",
+        dict(_voce("Gesto della mano", "CRITICO"), timestamp=[[5.0, 8.0], [42.0, 45.0]]),
+        dict(_voce("Musica", "ATTENZIONE", categoria="Audio"), timestamp=[[41.0, 44.0]]),
+    )
+
+    unito = segmenti.unisci_segmenti([(40.0, 50.0, _analisi("CONSIGLIATO"))], base=base)
+
+    voce, = unito["checklist_analisi"]
+    assert voce["status"] == "CRITICO"
+    assert voce["timestamp"] == [[5.0, 8.0]]
+    assert unito["verdetto_complessivo"] == "NON_CONSIGLIATO"
+
+
+def test_nuova_segnalazione_nelle_parti_modificate_peggiora_il_verdetto():
+    base = _analisi("CONSIGLIATO", dict(_voce("Casting", "OK"), timestamp=[[0.0, 60.0]]))
+    nuova = _analisi("NON_CONSIGLIATO", _voce("Claim non verificabile", "CRITICO", categoria="Legale"))
+
+    unito = segmenti.unisci_segmenti([(20.0, 30.0, nuova)], base=base)
+
+    assert unito["verdetto_complessivo"] == "NON_CONSIGLIATO"
+    assert {v["punto_analizzato"] for v in unito["checklist_analisi"]} == {"Casting", "Claim non verificabile"}
+
+
+# --- Fusione dei segmenti ---
+
+def test_finestre_sovrapposte_unite_in_un_solo_intervallo():
+    risultati = [
+        (0.0, 30.0, _analisi("CONSIGLIATO_CON_RISERVA", _voce("Gesto della mano", "ATTENZIONE", inizio_s=20, fine_s=30))),
+        (28.0, 60.0, _analisi("CONSIGLIATO", _voce("Gesto della mano", "OK", inizio_s=0, fine_s=5))),
+        (60.0, 90.0, _analisi("CONSIGLIATO", _voce("Gesto della mano", "OK", inizio_s=0, fine_s=4))),
+        (90.0, 120.0, _analisi("CONSIGLIATO", _voce("Gesto della mano", "OK", inizio_s=10, fine_s=12))),
+    ]
+
+    unito = segmenti.unisci_segmenti(risultati)
+
+    voce, = unito["checklist_analisi"]
+    assert voce["timestamp"] == [[20.0, 33.0], [60.0, 64.0], [100.0, 102.0]]
+    assert voce["status"] == "ATTENZIONE"
+    assert "inizio_s" not in voce and "fine_s" not in voce
+
+
+def test_status_e_verdetto_piu_gravi():
+    risultati = [
+        (0.0, 30.0, _analisi("CONSIGLIATO", _voce("Simbolo religioso", "OK"), motivazione="nulla da segnalare")),
+        (30.0, 60.0, _analisi("NON_CONSIGLIATO", _voce("Simbolo religioso", "CRITICO"), motivazione="simbolo offensivo")),
+        (60.0, 90.0, _analisi("CONSIGLIATO_CON_RISERVA", _voce("Simbolo religioso", "ATTENZIONE"))),
+    ]
+
+    unito = segmenti.unisci_segmenti(risultati)
+
+    voce, = unito["checklist_analisi"]
+    assert (voce["status"], voce["motivazione"]) == ("CRITICO", "Simbolo religioso: CRITICO")
+    assert unito["verdetto_complessivo"] == "NON_CONSIGLIATO"
+    assert unito["motivazione_verdetto"] == "[00:30–01:00] simbolo offensivo"
+    assert segmenti.unisci_segmenti([])["verdetto_complessivo"] == "N/D"
+
+
+def test_stesso_punto_tollera_piccole_differenze_ma_non_la_categoria():
+    voce = _voce("Gesto della mano", "OK")
+
+    assert segmenti._stesso_punto(voce, _voce("  gesto della mano ", "CRITICO"))
+    assert segmenti._stesso_punto(voce, _voce("Gesti della mano", "OK"))
+    assert not segmenti._stesso_punto(voce, _voce("Gesto della mano", "OK", categoria="Audio"))
+    assert not segmenti._stesso_punto(voce, _voce("Casting", "OK"))
+
+
+def test_intervallo_assoluto_limitato_al_segmento():
+    assert segmenti._intervallo_assoluto({"inizio_s": 2, "fine_s": 6}, 30.0, 60.0) == [32.0, 36.0]
+    assert segmenti._intervallo_assoluto({}, 30.0, 60.0) == [30.0, 60.0]
+    assert segmenti._intervallo_assoluto({"inizio_s": -5, "fine_s": 90}, 30.0, 60.0) == [30.0, 60.0]
+    # Fine prima dell'inizio: l'intervallo si riduce a un istante.
+    assert segmenti._intervallo_assoluto({"inizio_s": 10, "fine_s": 4}, 30.0, 60.0) == [40.0, 40.0]
+    assert segmenti._intervallo_assoluto({"inizio_s": "circa 3", "fine_s": None}, 30.0, 60.0) == [30.0, 60.0]
@@ -0,0 +1,108 @@
+# tests/test_servizio_http.py
+import asyncio
+import os
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+import lavori
+import servizio_http
+
+CARTELLA_LINEE_GUIDA = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cultural_guidelines")
+
+
+@pytest.fixture
+def servizio(fake, monkeypatch):
+    monkeypatch.setenv("ADVISOR_GUIDELINES_DIR", CARTELLA_LINEE_GUIDA)
+    gestore = lavori.GestoreLavori(max_concorrenti=2)
+    return servizio_http.Servizio(gestore=gestore, max_in_coda=10)
+
+
+def _esegui(servizio, scenario):
+    """Esegue `scenario(client)` con un client collegato all'app del servizio."""
+    async def principale():
+        async with TestClient(TestServer(servizio.app())) as client:
+            return await scenario(client)
+    return asyncio.run(principale())
+
+
+def _invio(paese="Italia", video=(b"video di prova", "spot.mp4"), **campi):
+    dati = aiohttp.FormData(default_to_multipart=True)
+    dati.add_field("paese", paese)
+    for nome, valore in campi.items():
+        dati.add_field(nome, valore)
+    if video is not None:
+        contenuto, nome = video
+        dati.add_field("video", contenuto, filename=nome, content_type="video/mp4")
+    return dati
+
+
+async def _attendi_risultato(client, url, tentativi=200):
+    for _ in range(tentativi):
+        risposta = await client.get(url)
+        if risposta.status != 202:
+            return risposta
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"{url} ancora in corso")
+
+
+def test_invio_stato_e_risultato_del_checker(servizio):
+    async def scenario(client):
+        invio = await client.post("/v1/checker", data=_invio(analisi_persuasiva="si"))
+        assert invio.status == 202
+        lavoro = await invio.json()
+        assert invio.headers["Location"] == lavoro["stato_url"]
+
+        stato = await client.get(lavoro["stato_url"])
+        assert stato.status == 200
+        assert (await stato.json())["parametri"]["video"] == "spot.mp4"
+
+        risultato = await _attendi_risultato(client, lavoro["risultato_url"])
+        return risultato.status, await risultato.json()
+
+    status, corpo = _esegui(servizio, scenario)
+
+    assert status == 200
+    assert corpo["stato"] == lavori.COMPLETATO
+    esito = corpo["esito"]
+    assert esito["video"] == "spot.mp4" and esito["stato"] == "ok"
+    assert esito["impostazioni"]["paese"] == "Italia"
+    assert esito["impostazioni"]["analisi_persuasiva"] is True
+    assert "verdetto_complessivo" in esito["risultato"]
+    assert "analisi_persuasiva" in esito["risultato"]
+
+
+def test_mercato_sconosciuto_rifiutato_con_400(servizio):
+    async def scenario(client):
+        risposta = await client.post("/v1/checker", data=_invio(paese="Atlantide"))
+        return risposta.status, await risposta.text()
+
+    status, testo = _esegui(servizio, scenario)
+
+    assert status == 400
+    assert "Atlantide" in testo and "Italia" in testo
+    assert servizio.gestore.stats()["in_coda"] == 0
+
+
+def test_invio_non_valido(servizio):
+    async def scenario(client):
+        senza_video = await client.post("/v1/checker", data=_invio(video=None))
+        non_multipart = await client.post("/v1/checker", json={"paese": "Italia"})
+        sconosciuto = await client.get("/v1/lavori/inesistente/risultato")
+        return senza_video.status, non_multipart.status, sconosciuto.status
+
+    assert _esegui(servizio, scenario) == (400, 415, 404)
+
+
+def test_token_richiesto(fake, monkeypatch):
+    monkeypatch.setenv("ADVISOR_GUIDELINES_DIR", CARTELLA_LINEE_GUIDA)
+    servizio = servizio_http.Servizio(gestore=lavori.GestoreLavori(), token="segreto")
+
+    async def scenario(client):
+        senza = await client.get("/v1/stato")
+        con = await client.get("/v1/stato", headers={"Authorization": "Bearer segreto"})
+        return senza.status, con.status, await con.json()
+
+    senza, con, stato = _esegui(servizio, scenario)
+
+    assert (senza, con) == (401, 200)
+    assert stato["linee_guida"]["mercati"] >= 1
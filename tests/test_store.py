@@ -0,0 +1,150 @@
+# tests/test_store.py
+import json
+import pytest
+import store
+
+
+def _risultato(verdetto="CONSIGLIATO", motivazione="Spot adatto al mercato", checklist=()):
+    return json.dumps({
+        "verdetto_complessivo": verdetto,
+        "motivazione_verdetto": motivazione,
+        "checklist_analisi": [
+            {"categoria": categoria, "punto_analizzato": punto, "status": status, "motivazione": testo}
+            for categoria, punto, status, testo in checklist
+        ],
+    })
+
+
+@pytest.fixture
+def archivio(tmp_path):
+    return store.AnalysisStore(str(tmp_path / "analisi.sqlite3"))
+
+
+def test_pagine_senza_doppioni_ne_buchi(archivio):
+    # Molte analisi nello stesso secondo: l'ordine è garantito dall'id.
+    ids = [archivio.salva("checker", f"hash-{i}", _risultato(), mercato="Italia") for i in range(23)]
+
+    visti, cursore, pagine = [], None, 0
+    while True:
+        righe, cursore = archivio.pagina(limite=10, cursore=cursore)
+        visti += [r["id"] for r in righe]
+        pagine += 1
+        if cursore is None:
+            break
+
+    assert pagine == 3
+    assert visti == sorted(ids, reverse=True)
+    assert archivio.conta() == 23
+
+
+def test_pagina_esatta_senza_cursore_successivo(archivio):
+    for i in range(10):
+        archivio.salva("checker", f"hash-{i}", _risultato())
+
+    righe, cursore = archivio.pagina(limite=10)
+
+    assert len(righe) == 10 and cursore is None
+    assert "risultato" not in righe[0]
+
+
+def test_filtri_e_date(archivio, monkeypatch):
+    date = iter(["2026-01-10 09:00:00", "2026-02-10 09:00:00", "2026-03-10 09:00:00", "2026-03-11 09:00:00"])
+    monkeypatch.setattr(store, "_adesso", lambda: next(date))
+    archivio.salva("checker", "a", _risultato(), mercato="Italia")
+    archivio.salva("checker", "b", _risultato("NON_CONSIGLIATO"), mercato="Giappone")
+    archivio.salva("checker", "c", _risultato("NON_CONSIGLIATO"), mercato="Italia")
+    archivio.salva("benchmark", "d", json.dumps({"analisi_tuo_video": {"verdetto_complessivo": "CONSIGLIATO"}}))
+
+    def hash_pagina(filtri):
+        return [r["video_hash"] for r in archivio.pagina(filtri)[0]]
+
+    assert hash_pagina({"mercato": "Italia"}) == ["c", "a"]
+    assert hash_pagina({"verdetto": "NON_CONSIGLIATO", "mercato": "Italia"}) == ["c"]
+    assert hash_pagina({"tipo": "benchmark"}) == ["d"]
+    assert hash_pagina({"dal": "2026-02-01", "al": "2026-03-11"}) == ["c", "b"]
+    assert archivio.conta({"verdetto": "CONSIGLIATO"}) == 2
+
+
+def test_dettaglio_con_checklist(archivio):
+    analisi_id = archivio.salva("checker", "a", _risultato(checklist=[("Simboli", "Gesti", "OK", "Nessun gesto")]),
+                                mercato="Italia", impostazioni={"paese": "Italia"}, video_nome="spot.mp4")
+
+    dettaglio = archivio.dettaglio(analisi_id)
+
+    assert dettaglio["video_nome"] == "spot.mp4"
+    assert dettaglio["impostazioni"] == {"paese": "Italia"}
+    assert dettaglio["checklist"] == [{"categoria": "Simboli", "punto_analizzato": "Gesti",
+                                       "status": "OK", "motivazione": "Nessun gesto"}]
+    assert archivio.dettaglio(analisi_id + 1) is None
+
+
+def test_analisi_dopo_un_id(archivio):
+    ids = [archivio.salva("checker", f"hash-{i}", _risultato()) for i in range(5)]
+
+    assert [r["id"] for r in archivio.analisi_dopo(ids[2])] == ids[3:]
+    assert archivio.ultimo_id() == ids[-1]
+
+
+# --- Ricerca full-text ---
+
+@pytest.fixture
+def archivio_ricerca(archivio, monkeypatch):
+    date = iter(["2026-01-10 09:00:00", "2026-02-10 09:00:00", "2026-03-10 09:00:00"])
+    monkeypatch.setattr(store, "_adesso", lambda: next(date))
+    archivio.salva("checker", "a", _risultato(checklist=[
+        ("Simboli", "Gesto della mano", "CRITICO", "Il gesto è offensivo in questo mercato"),
+        ("DE&I", "Casting", "OK", "Casting vario"),
+    ]), mercato="Giappone")
+    archivio.salva("checker", "b", _risultato(motivazione="Simbolo religioso usato con leggerezza", checklist=[
+        ("Simboli", "Simbolo religioso", "ATTENZIONE", "Da rivedere con il cliente"),
+    ]), mercato="Italia")
+    archivio.salva("benchmark", "c", json.dumps({"analisi_tuo_video": {"motivazione_verdetto": "simbolo ovunque"}}))
+    return archivio
+
+
+def test_ricerca_per_prefisso_e_senza_accenti(archivio_ricerca):
+    risultati = archivio_ricerca.cerca("simbol")
+
+    assert {r["mercato"] for r in risultati} == {"Italia"}
+    assert all("**" in r["estratto"] for r in risultati)
+    assert [r["categoria"] for r in archivio_ricerca.cerca("offensivo")] == ["Simboli"]
+    assert len(archivio_ricerca.cerca("e offensivo")) == 1
+    assert archivio_ricerca.cerca("offensivò gesto")[0]["status"] == "CRITICO"
+
+
+def test_ricerca_con_filtri_e_date(archivio_ricerca):
+    assert archivio_ricerca.cerca("casting", {"status": "CRITICO"}) == []
+    assert len(archivio_ricerca.cerca("casting", {"mercato": "Giappone", "categoria": "DE&I"})) == 1
+    assert archivio_ricerca.cerca("simbolo", {"al": "2026-02-10"}) == []
+    assert len(archivio_ricerca.cerca("simbolo", {"dal": "2026-02-01", "al": "2026-02-11"})) == 2
+
+
+def test_ricerca_con_testo_speciale_o_vuoto(archivio_ricerca):
+    assert archivio_ricerca.cerca("   ") == []
+    assert archivio_ricerca.cerca('"gesto" OR (') == []
+    assert archivio_ricerca.facette("", "status") == {}
+
+
+def test_pagine_della_ricerca(archivio_ricerca):
+    tutti = archivio_ricerca.cerca("simbolo")
+
+    assert archivio_ricerca.cerca("simbolo", limite=1) + archivio_ricerca.cerca("simbolo", limite=1, offset=1) == tutti
+
+
+def test_facette_ignorano_il_filtro_sulla_propria_colonna(archivio_ricerca):
+    # Il filtro sullo status non restringe la faccetta dello status, solo le altre.
+    assert archivio_ricerca.facette("simbolo", "status", {"status": "ATTENZIONE"}) == {"CONSIGLIATO": 1, "ATTENZIONE": 1}
+    assert archivio_ricerca.facette("simbolo", "categoria", {"status": "ATTENZIONE"}) == {"Simboli": 1}
+    assert archivio_ricerca.facette("casting", "mercato") == {"Giappone": 1}
+    assert archivio_ricerca.facette("gesto casting", "status") == {}
+    with pytest.raises(ValueError):
+        archivio_ricerca.facette("simbolo", "video_nome")
+
+
+def test_indice_ricostruito_per_archivi_esistenti(archivio_ricerca):
+    with archivio_ricerca._connessione() as conn:
+        conn.execute("DELETE FROM documenti_fts")
+
+    riaperto = store.AnalysisStore(archivio_ricerca.path)
+
+    assert len(riaperto.cerca("offensivo")) == 1
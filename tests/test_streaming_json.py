@@ -0,0 +1,134 @@
+# tests/test_streaming_json.py
+import json
+import queue
+from types import SimpleNamespace
+import pytest
+import analisi
+import governatore
+import lavori
+import schemi
+import streaming_json
+
+RISPOSTA = {
+    "verdetto_complessivo": "CONSIGLIATO_CON_RISERVA",
+    "motivazione_verdetto": "Testo con \"virgolette\", graffe {} e parentesi [] dentro la stringa \\ fine",
+    "checklist_analisi": [
+        {"categoria": "Simboli", "punto_analizzato": "Gesti", "status": "OK", "motivazione": "Nessun gesto {ambiguo}"},
+        {"categoria": "DE&I", "punto_analizzato": "Casting", "status": "ATTENZIONE", "motivazione": "Età: 20-30, [poca] varietà"},
+    ],
+    "annidato": {"lista": [1, 2, {"a": "]"}], "vuota": []},
+}
+
+
+def _leggi(testo, dimensione):
+    parser = streaming_json.ParserJsonIncrementale()
+    eventi = []
+    for i in range(0, len(testo), dimensione):
+        eventi += parser.feed(testo[i:i + dimensione])
+    return parser, eventi
+
+
+@pytest.mark.parametrize("dimensione", [1, 2, 3, 7, 64, 10_000])
+def test_eventi_indipendenti_dalla_dimensione_dei_frammenti(dimensione):
+    testo = json.dumps(RISPOSTA, ensure_ascii=False, indent=2)
+
+    parser, eventi = _leggi(testo, dimensione)
+
+    assert parser.completato
+    assert eventi == [
+        (streaming_json.VALORE, "verdetto_complessivo", RISPOSTA["verdetto_complessivo"]),
+        (streaming_json.VALORE, "motivazione_verdetto", RISPOSTA["motivazione_verdetto"]),
+        (streaming_json.ELEMENTO, "checklist_analisi", RISPOSTA["checklist_analisi"][0]),
+        (streaming_json.ELEMENTO, "checklist_analisi", RISPOSTA["checklist_analisi"][1]),
+        (streaming_json.VALORE, "checklist_analisi", RISPOSTA["checklist_analisi"]),
+        (streaming_json.VALORE, "annidato", RISPOSTA["annidato"]),
+    ]
+
+
+@pytest.mark.parametrize("dimensione", [1, 5, 10_000])
+def test_delimitatori_markdown_e_testo_dopo_la_radice(dimensione):
+    testo = "```json\n" + json.dumps({"a": [1, 2], "b": "x"}) + "\n```\n{\"ignorato\": 1}"
+
+    parser, eventi = _leggi(testo, dimensione)
+
+    assert parser.completato
+    assert [e[1] for e in eventi] == ["a", "a", "a", "b"]
+    assert eventi[-1] == (streaming_json.VALORE, "b", "x")
+
+
+def test_json_compatto_e_array_vuoto():
+    _, eventi = _leggi('{"lista":[],"n":1.5,"ok":true}', 4)
+
+    assert eventi == [
+        (streaming_json.VALORE, "lista", []),
+        (streaming_json.VALORE, "n", 1.5),
+        (streaming_json.VALORE, "ok", True),
+    ]
+
+
+def test_risposta_troncata_non_produce_valori_parziali():
+    testo = json.dumps(RISPOSTA)
+    troncato = testo[:testo.index('"Casting"')]
+
+    parser, eventi = _leggi(troncato, 16)
+
+    assert not parser.completato
+    assert [e[0] for e in eventi] == [streaming_json.VALORE, streaming_json.VALORE, streaming_json.ELEMENTO]
+
+
+def test_ripristino_scarta_gli_eventi_del_tentativo_fallito():
+    lavoro = lavori.Lavoro("checker", "prova")
+    lavoro.on_evento((streaming_json.VALORE, "verdetto_complessivo", "CONSIGLIATO"))
+    lavoro.on_evento((streaming_json.ELEMENTO, "checklist_analisi", {"n": 1}))
+    lavoro.on_evento((streaming_json.VALORE, "altro", 1))
+
+    lavoro.on_evento((streaming_json.RIPRISTINO, None, ["checklist_analisi", "verdetto_complessivo"]))
+    lavoro.on_evento((streaming_json.VALORE, "verdetto_complessivo", "NON_CONSIGLIATO"))
+
+    assert lavoro.eventi == [
+        (streaming_json.VALORE, "altro", 1),
+        (streaming_json.VALORE, "verdetto_complessivo", "NON_CONSIGLIATO"),
+    ]
+
+
+class _Quota(Exception):
+    code = 429
+
+
+class _ModelloInterrotto:
+    """Il primo streaming si interrompe con un 429 a metà risposta, il secondo arriva intero."""
+
+    def __init__(self, testo):
+        self.testo = testo
+        self.tentativi = 0
+
+    def generate_content(self, parti, stream=False, request_options=None):
+        self.tentativi += 1
+        tentativo = self.tentativi
+
+        def frammenti():
+            for i in range(0, len(self.testo), 20):
+                if tentativo == 1 and i > len(self.testo) // 2:
+                    raise _Quota("quota esaurita")
+                yield SimpleNamespace(text=self.testo[i:i + 20])
+        return frammenti()
+
+
+def test_streaming_ripetuto_dopo_429(monkeypatch):
+    dati = {"verdetto_complessivo": "CONSIGLIATO", "motivazione_verdetto": "ok",
+            "checklist_analisi": RISPOSTA["checklist_analisi"]}
+    modello = _ModelloInterrotto(json.dumps(dati))
+    monkeypatch.setattr(analisi.backend, "modello", lambda *a, **k: modello)
+    monkeypatch.setattr(analisi, "_token_usati", lambda risposta: None)
+    monkeypatch.setattr(governatore, "_default_governatore", governatore.Governatore(tentativi=2, attesa_base=0.01))
+    coda = queue.Queue()
+    lavoro = lavori.Lavoro("checker", "prova")
+
+    testo = analisi._genera_json(["prompt"], schemi.BASE, eventi=coda)
+    while not coda.empty():
+        lavoro.on_evento(coda.get())
+
+    assert modello.tentativi == 2
+    assert json.loads(testo) == dati
+    # Dopo il ripristino restano solo gli eventi del tentativo riuscito, senza doppioni.
+    assert lavoro.eventi == list(_leggi(json.dumps(dati), 20)[1])
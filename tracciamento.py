@@ -0,0 +1,311 @@
+# tracciamento.py
+"""
+Misura dei tempi per fase (scrittura su disco, upload, processamento, attesa
+della quota, generazione, validazione JSON, rendering...).
+
+- `span(nome)` misura una fase: la durata alimenta sempre gli istogrammi per
+  fase del processo (esportabili in formato testo Prometheus) e, se c'è una
+  traccia attiva nel contesto, diventa uno span della traccia, con padre e
+  attributi. Il contesto passa ai thread dei pool tramite governatore.propaga.
+- Le tracce sono esportabili come JSON nel formato OTLP di OpenTelemetry; con
+  ADVISOR_TRACE_FILE ogni traccia conclusa viene aggiunta a quel file (JSONL).
+- Profiler opzionale delle run delle pagine (cProfile): le run più lente di
+  ADVISOR_PROFILE_SLOW_S secondi vengono conservate con le funzioni più costose.
+"""
+import collections
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+
+# Limiti superiori degli intervalli degli istogrammi, in secondi.
+BUCKET_S = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+NOME_SERVIZIO = "ad-visor"
+
+_traccia_corrente = contextvars.ContextVar("traccia_corrente", default=None)
+_span_corrente = contextvars.ContextVar("span_corrente", default=None)
+
+
+class Span:
+    __slots__ = ("nome", "id", "padre", "inizio_ns", "fine_ns", "attributi", "thread")
+
+    def __init__(self, nome, padre, attributi):
+        self.nome = nome
+        self.id = uuid.uuid4().hex[:16]
+        self.padre = padre
+        self.inizio_ns = time.time_ns()
+        self.fine_ns = None
+        self.attributi = attributi
+        self.thread = threading.current_thread().name
+
+    @property
+    def durata_s(self):
+        return ((self.fine_ns or time.time_ns()) - self.inizio_ns) / 1e9
+
+
+class Traccia:
+    """Insieme degli span di un'operazione (un lavoro in background o una run di pagina)."""
+
+    def __init__(self, nome, **attributi):
+        self.id = uuid.uuid4().hex
+        self.radice = Span(nome, None, attributi)
+        self.span = [self.radice]
+        self._lock = threading.Lock()
+
+    @property
+    def nome(self):
+        return self.radice.nome
+
+    def aggiungi(self, span):
+        with self._lock:
+            self.span.append(span)
+
+    def chiudi(self):
+        if self.radice.fine_ns is None:
+            self.radice.fine_ns = time.time_ns()
+
+    def righe(self):
+        """Una riga per span, in ordine di inizio, con profondità, offset e durata in millisecondi."""
+        with self._lock:
+            span = sorted(self.span, key=lambda s: s.inizio_ns)
+        profondita = {}
+        righe = []
+        for s in span:
+            profondita[s.id] = profondita.get(s.padre, -1) + 1
+            righe.append({
+                "fase": "  " * profondita[s.id] + s.nome,
+                "inizio_ms": round((s.inizio_ns - self.radice.inizio_ns) / 1e6, 1),
+                "durata_ms": round(s.durata_s * 1000, 1),
+                "thread": s.thread,
+                "attributi": ", ".join(f"{k}={v}" for k, v in s.attributi.items()),
+            })
+        return righe
+
+    def durate_per_fase(self):
+        """Somma delle durate per nome di fase (le fasi parallele si sommano)."""
+        totali = collections.defaultdict(float)
+        with self._lock:
+            for s in self.span[1:]:
+                totali[s.nome] += s.durata_s
+        return dict(sorted(totali.items(), key=lambda voce: voce[1], reverse=True))
+
+    def come_otlp(self):
+        """La traccia nel formato JSON di OTLP (resourceSpans), importabile dai collector OpenTelemetry."""
+        with self._lock:
+            span = list(self.span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_attributo("service.name", NOME_SERVIZIO)]},
+            "scopeSpans": [{
+                "scope": {"name": "advisor.tracciamento"},
+                "spans": [{
+                    "traceId": self.id,
+                    "spanId": s.id,
+                    **({"parentSpanId": s.padre} if s.padre else {}),
+                    "name": s.nome,
+                    "kind": 1,
+                    "startTimeUnixNano": str(s.inizio_ns),
+                    "endTimeUnixNano": str(s.fine_ns or time.time_ns()),
+                    "attributes": [_attributo(k, v) for k, v in s.attributi.items()] + [_attributo("thread.name", s.thread)],
+                } for s in span],
+            }],
+        }]}
+
+
+def _attributo(chiave, valore):
+    if isinstance(valore, bool):
+        return {"key": chiave, "value": {"boolValue": valore}}
+    if isinstance(valore, int):
+        return {"key": chiave, "value": {"intValue": str(valore)}}
+    if isinstance(valore, float):
+        return {"key": chiave, "value": {"doubleValue": valore}}
+    return {"key": chiave, "value": {"stringValue": str(valore)}}
+
+
+class Istogrammi:
+    """Istogrammi cumulativi delle durate per fase, come quelli di Prometheus."""
+
+    def __init__(self, bucket=BUCKET_S):
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._fasi = {}
+
+    def osserva(self, fase, secondi):
+        with self._lock:
+            conteggi, somma = self._fasi.get(fase, ([0] * (len(self.bucket) + 1), 0.0))
+            for i, limite in enumerate(self.bucket):
+                if secondi <= limite:
+                    conteggi[i] += 1
+            conteggi[-1] += 1
+            self._fasi[fase] = (conteggi, somma + secondi)
+
+    def prometheus(self, nome="advisor_fase_durata_secondi"):
+        """Testo nel formato di esposizione di Prometheus."""
+        righe = [f"# HELP {nome} Durata delle fasi delle analisi Ad-Visor.", f"# TYPE {nome} histogram"]
+        with self._lock:
+            fasi = {fase: (list(c), s) for fase, (c, s) in self._fasi.items()}
+        for fase, (conteggi, somma) in sorted(fasi.items()):
+            for limite, conteggio in zip(self.bucket, conteggi):
+                righe.append(f'{nome}_bucket{{fase="{fase}",le="{limite}"}} {conteggio}')
+            righe.append(f'{nome}_bucket{{fase="{fase}",le="+Inf"}} {conteggi[-1]}')
+            righe.append(f'{nome}_sum{{fase="{fase}"}} {somma:.6f}')
+            righe.append(f'{nome}_count{{fase="{fase}"}} {conteggi[-1]}')
+        return "\n".join(righe) + "\n"
+
+    def riepilogo(self):
+        with self._lock:
+            return [{"fase": fase, "conteggio": c[-1], "totale_s": round(s, 2), "media_s": round(s / c[-1], 3)}
+                    for fase, (c, s) in sorted(self._fasi.items())]
+
+
+istogrammi = Istogrammi()
+
+
+@contextlib.contextmanager
+def span(nome, **attributi):
+    """
+    Misura una fase. Restituisce il dizionario degli attributi, a cui si possono
+    aggiungere valori noti solo durante la fase (es. byte caricati, riuso).
+    """
+    traccia = _traccia_corrente.get()
+    corrente = Span(nome, _span_corrente.get() or (traccia.radice.id if traccia else None), attributi)
+    token = _span_corrente.set(corrente.id)
+    inizio = time.perf_counter()
+    try:
+        yield attributi
+    except BaseException as e:
+        attributi["errore"] = type(e).__name__
+        raise
+    finally:
+        _span_corrente.reset(token)
+        corrente.fine_ns = time.time_ns()
+        istogrammi.osserva(nome, time.perf_counter() - inizio)
+        if traccia is not None:
+            traccia.aggiungi(corrente)
+
+
+def _esporta_su_file(traccia):
+    path = os.getenv("ADVISOR_TRACE_FILE")
+    if not path:
+        return
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(traccia.come_otlp(), ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+@contextlib.contextmanager
+def traccia(nome, **attributi):
+    """Apre una nuova traccia e la rende attiva nel contesto; alla fine la chiude e la esporta."""
+    nuova = Traccia(nome, **attributi)
+    token_traccia = _traccia_corrente.set(nuova)
+    token_span = _span_corrente.set(None)
+    try:
+        yield nuova
+    finally:
+        _span_corrente.reset(token_span)
+        _traccia_corrente.reset(token_traccia)
+        nuova.chiudi()
+        _esporta_su_file(nuova)
+
+
+def inizia_run(nome, **attributi):
+    """
+    Variante senza blocco `with` per gli script delle pagine: apre una traccia
+    attiva per il resto della run. Va chiusa con `termina_run`.
+    """
+    nuova = Traccia(nome, **attributi)
+    _traccia_corrente.set(nuova)
+    _span_corrente.set(None)
+    return nuova
+
+
+def termina_run(traccia_run):
+    traccia_run.chiudi()
+    istogrammi.osserva("run_pagina", traccia_run.radice.durata_s)
+    _esporta_su_file(traccia_run)
+
+
+def metriche_prometheus():
+    return istogrammi.prometheus()
+
+
+class ProfiloRun:
+    """
+    Profilo cProfile di una run di pagina, conservato solo se la run supera la
+    soglia. cProfile ammette un solo profiler attivo per processo: se è occupato
+    da un'altra sessione la run non viene profilata. Una run interrotta da
+    st.rerun o st.stop non arriva a `termina`: il suo profilo viene scartato
+    alla run successiva della stessa sessione (vedi `scarta`) o, dopo
+    SCADENZA_S secondi, dalla prima run che ne chiede uno.
+    """
+
+    SCADENZA_S = 600
+    _attivo = None
+    _lock = threading.Lock()
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.inizio = time.perf_counter()
+        self._profiler = None
+        with ProfiloRun._lock:
+            attivo = ProfiloRun._attivo
+            if attivo is not None and time.perf_counter() - attivo.inizio > self.SCADENZA_S:
+                attivo._ferma()
+            if ProfiloRun._attivo is not None:
+                return
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Un altro strumento di profiling è già attivo.
+                return
+            self._profiler = profiler
+            ProfiloRun._attivo = self
+
+    def _ferma(self):
+        """Da chiamare con ProfiloRun._lock acquisito."""
+        if self._profiler is not None:
+            self._profiler.disable()
+        if ProfiloRun._attivo is self:
+            ProfiloRun._attivo = None
+
+    def scarta(self):
+        with ProfiloRun._lock:
+            self._ferma()
+        self._profiler = None
+
+    def termina(self, soglia_s=None, righe=25):
+        """Ferma il profiler; se la run è stata lenta la aggiunge a `run_lente` e la restituisce."""
+        if self._profiler is None:
+            return None
+        with ProfiloRun._lock:
+            self._ferma()
+        profiler, self._profiler = self._profiler, None
+        durata = time.perf_counter() - self.inizio
+        soglia_s = soglia_profilo_s() if soglia_s is None else soglia_s
+        if durata < soglia_s:
+            return None
+        testo = io.StringIO()
+        pstats.Stats(profiler, stream=testo).sort_stats("cumulative").print_stats(righe)
+        voce = {"pagina": self.nome, "durata_s": round(durata, 2), "quando": time.strftime("%H:%M:%S"),
+                "profilo": testo.getvalue()}
+        run_lente.appendleft(voce)
+        return voce
+
+
+run_lente = collections.deque(maxlen=10)
+
+
+def profilo_abilitato():
+    return os.getenv("ADVISOR_PROFILE", "").lower() in ("1", "true", "si", "yes")
+
+
+def soglia_profilo_s():
+    return float(os.getenv("ADVISOR_PROFILE_SLOW_S", "2"))
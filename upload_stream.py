@@ -0,0 +1,192 @@
+# upload_stream.py
+"""
+Upload dei video a memoria limitata: il contenuto viene letto a blocchi di
+dimensione fissa e inviato direttamente all'API (o copiato in un file
+temporaneo univoco quando l'SDK accetta solo percorsi). I file grandi usano
+il protocollo di upload resumable, ripartendo dall'ultimo offset confermato
+in caso di errore di rete.
+"""
+import contextlib
+import inspect
+import io
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import governatore
+import tracciamento
+
+UPLOAD_URL = "https://generativelanguage.googleapis.com/upload/v1beta/files"
+GRANULARITA_DEFAULT = 8 * 1024 * 1024
+
+
+def chunk_size_configurato():
+    """Tetto di memoria per sessione durante l'upload (ADVISOR_UPLOAD_CHUNK_MB, default 8 MB)."""
+    return max(256 * 1024, int(float(os.getenv("ADVISOR_UPLOAD_CHUNK_MB", "8")) * 1024 * 1024))
+
+
+def soglia_resumable_configurata():
+    """Dimensione oltre la quale si usa l'upload resumable (ADVISOR_UPLOAD_RESUMABLE_MB, default 64 MB)."""
+    return int(float(os.getenv("ADVISOR_UPLOAD_RESUMABLE_MB", "64")) * 1024 * 1024)
+
+
+def dimensione(sorgente):
+    """Dimensione in byte di un file-like posizionabile, senza leggerne il contenuto."""
+    if hasattr(sorgente, "size") and sorgente.size is not None:
+        return sorgente.size
+    posizione = sorgente.tell()
+    sorgente.seek(0, os.SEEK_END)
+    size = sorgente.tell()
+    sorgente.seek(posizione)
+    return size
+
+
+def mime_type_per(nome, default="video/mp4"):
+    return mimetypes.guess_type(nome or "")[0] or default
+
+
+class FileConNome(io.BufferedReader):
+    """
+    File su disco aperto in lettura che espone come `name` un nome scelto
+    (es. quello del video caricato dall'utente), usato per il MIME type
+    dell'upload e per l'archivio.
+    """
+
+    def __init__(self, path, nome):
+        super().__init__(io.FileIO(path, "rb"))
+        self._nome = nome
+
+    @property
+    def name(self):
+        return self._nome
+
+
+@contextlib.contextmanager
+def file_temporaneo(sorgente, suffisso="", chunk_size=None):
+    """
+    Copia il file-like a blocchi in un file temporaneo con nome univoco
+    (sessioni concorrenti con lo stesso nome file non si sovrascrivono)
+    e lo elimina all'uscita dal contesto.
+    """
+    fd, path = tempfile.mkstemp(prefix="advisor_", suffix=suffisso)
+    try:
+        with tracciamento.span("scrittura_file_locale"):
+            sorgente.seek(0)
+            with os.fdopen(fd, "wb") as destinazione:
+                shutil.copyfileobj(sorgente, destinazione, chunk_size or chunk_size_configurato())
+        yield path
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def accetta_file_like(file_api):
+    """
+    True se upload_file accetta un file-like oltre a un percorso: dalla versione
+    0.7 l'SDK lo dichiara nell'annotazione del parametro `path` (IOBase).
+    """
+    try:
+        parametro = inspect.signature(file_api.upload_file).parameters["path"]
+    except (KeyError, TypeError, ValueError):
+        return False
+    annotazione = parametro.annotation
+    if annotazione is inspect.Parameter.empty:
+        return True
+    return "IO" in (annotazione if isinstance(annotazione, str) else repr(annotazione))
+
+
+def carica_stream(file_api, sorgente, nome, display_name, api_key=None):
+    """
+    Carica un file-like sulla File API mantenendo la memoria aggiuntiva entro
+    un blocco. Restituisce il file remoto come farebbe file_api.upload_file.
+    """
+    size = dimensione(sorgente)
+    mime_type = mime_type_per(nome)
+    chunk_size = chunk_size_configurato()
+
+    limiti = governatore.get_default_governatore()
+    if api_key and size >= soglia_resumable_configurata():
+        # La banda è riservata blocco per blocco dentro carica_resumable.
+        nome_remoto = limiti.carica(
+            lambda: carica_resumable(sorgente, size, mime_type, display_name, api_key, chunk_size))
+        return file_api.get_file(nome_remoto)
+
+    def _upload_file(path):
+        if hasattr(path, "seek"):
+            path.seek(0)
+        return file_api.upload_file(path=path, mime_type=mime_type, display_name=display_name)
+
+    if accetta_file_like(file_api):
+        return limiti.carica(lambda: _upload_file(sorgente), size)
+    # Versioni dell'SDK che accettano solo un percorso su disco.
+    suffisso = os.path.splitext(nome or "")[1]
+    with file_temporaneo(sorgente, suffisso, chunk_size) as path:
+        return limiti.carica(lambda: _upload_file(path), size)
+
+
+def _richiesta(url, comando, dati=b"", headers=None, timeout=120):
+    intestazioni = {"X-Goog-Upload-Command": comando}
+    intestazioni.update(headers or {})
+    req = urllib.request.Request(url, data=dati, method="POST", headers=intestazioni)
+    return urllib.request.urlopen(req, timeout=timeout)
+
+
+def _offset_confermato(upload_url):
+    """Chiede al server quanti byte ha già ricevuto per una sessione resumable."""
+    with _richiesta(upload_url, "query") as resp:
+        return int(resp.headers.get("X-Goog-Upload-Size-Received", "0"))
+
+
+def carica_resumable(sorgente, size, mime_type, display_name, api_key, chunk_size, tentativi=5):
+    """
+    Upload resumable a blocchi: in memoria resta al massimo un blocco
+    (arrotondato alla granularità richiesta dal server). Dopo un errore di rete
+    si interroga il server e si riprende dall'ultimo byte confermato.
+    Restituisce il nome del file remoto (es. "files/abc123").
+    """
+    metadati = json.dumps({"file": {"display_name": display_name}}).encode("utf-8")
+    with _richiesta(
+        f"{UPLOAD_URL}?key={api_key}",
+        "start",
+        metadati,
+        headers={
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Header-Content-Length": str(size),
+            "X-Goog-Upload-Header-Content-Type": mime_type,
+            "Content-Type": "application/json",
+        },
+    ) as resp:
+        upload_url = resp.headers["X-Goog-Upload-URL"]
+        granularita = int(resp.headers.get("X-Goog-Upload-Chunk-Granularity", GRANULARITA_DEFAULT))
+    blocco_size = max(granularita, chunk_size // granularita * granularita)
+
+    offset = 0
+    errori = 0
+    while True:
+        sorgente.seek(offset)
+        blocco = sorgente.read(blocco_size)
+        ultimo = offset + len(blocco) >= size
+        governatore.get_default_governatore().consuma_banda(len(blocco))
+        try:
+            with _richiesta(
+                upload_url,
+                "upload, finalize" if ultimo else "upload",
+                blocco,
+                headers={"X-Goog-Upload-Offset": str(offset), "Content-Length": str(len(blocco))},
+            ) as resp:
+                corpo = resp.read() if ultimo else b""
+        except (urllib.error.URLError, OSError):
+            errori += 1
+            if errori > tentativi:
+                raise
+            time.sleep(min(30, 2 ** errori))
+            offset = _offset_confermato(upload_url)
+            continue
+        if ultimo:
+            return json.loads(corpo)["file"]["name"]
+        offset += len(blocco)
+        errori = 0
@@ -1,82 +1,108 @@
 # utils.py
 import streamlit as st
-import google.generativeai as genai
 import json
 import os
-import time
-from dotenv import load_dotenv
+import uuid
+import backend
+import governatore
+import lavori
+import linee_guida
+import poller
+import result_cache
+import schemi
+import streaming_json
+import tracciamento
+# Funzioni del motore senza interfaccia, riesportate per le pagine.
+from strumenti import (calcola_hash_video, is_valid_json, prepara_video, prepara_video_concorrenti,
+                       pulisci_risposta_json)
 
 def configure_gemini():
-    """Carica le variabili d'ambiente e configura l'API di Gemini."""
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if api_key:
-        genai.configure(api_key=api_key)
+    """
+    Verifica che l'API di Gemini sia configurabile. La configurazione avviene una
+    sola volta per processo (vedi backend), non a ogni rerun.
+    """
+    if backend.configura():
         return True
-    else:
-        st.error("Chiave API di Gemini non trovata. Assicurati di averla impostata nel file .env")
-        st.stop()
-        return False
+    st.error("Chiave API di Gemini non trovata. Assicurati di averla impostata nel file .env")
+    st.stop()
+    return False
 
-def upload_and_process_video(uploaded_file, display_name="video"):
+def upload_and_process_video(uploaded_file, display_name="video", content_hash=None):
     """
     Salva, carica, processa e restituisce un file video per Gemini.
-    Gestisce anche la pulizia del file locale.
+    Se lo stesso contenuto è già stato caricato e il file remoto è ancora
+    valido, lo riusa senza un nuovo upload. Il video viene inviato a blocchi,
+    senza copie complete in memoria né file con nomi condivisi tra sessioni.
     """
-    file_gemini = None
-    local_path = uploaded_file.name
     try:
-        with open(local_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        
-        st.write(f"Caricamento di '{display_name}'...")
-        file_gemini = genai.upload_file(path=local_path, display_name=display_name)
-        
-        st.write(f"Processamento di '{display_name}'...")
-        while file_gemini.state.name == "PROCESSING":
-            time.sleep(5)
-            file_gemini = genai.get_file(file_gemini.name)
-        
-        if file_gemini.state.name == "FAILED":
-            st.error(f"Elaborazione del video '{display_name}' fallita.")
-            return None
-            
+        file_gemini, _ = prepara_video(uploaded_file, display_name, content_hash, log=st.write)
         return file_gemini
-    finally:
-        if os.path.exists(local_path):
-            os.remove(local_path)
-
-def carica_vincoli_culturali(paese):
-    """Carica le linee guida culturali da un file JSON."""
-    if not paese or paese == "Nessuna selezione specifica": return None
-    filename = f"cultural_guidelines/{paese.lower().replace(' ', '_')}.json"
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return json.dumps(data, indent=2, ensure_ascii=False)
-    except FileNotFoundError:
-        st.warning(f"File di linee guida per '{paese}' non trovato.")
+    except poller.ElaborazioneFallita:
+        st.error(f"Elaborazione del video '{display_name}' fallita.")
         return None
 
+def elenca_mercati():
+    """Elenca i mercati con linee guida culturali (dal registro, ricaricato quando i file cambiano)."""
+    return linee_guida.get_default_registro().mercati()
+
 # --- Funzioni di Visualizzazione ---
 
-def _display_single_analysis(analysis_data):
-    """Funzione helper per visualizzare una singola analisi."""
-    verdetto = analysis_data.get("verdetto_complessivo", "N/D")
-    motivazione_verdetto = analysis_data.get("motivazione_verdetto", "N/A")
+def mostra_errori_linee_guida():
+    """Segnala i file di linee guida esclusi dal registro perché non validi."""
+    for nome_file, errore in linee_guida.get_default_registro().errori().items():
+        st.warning(f"Linee guida in '{nome_file}' ignorate: {errore}")
+
+def mostra_statistiche_cache():
+    """Mostra nella sidebar lo stato della cache dei risultati."""
+    stats = result_cache.get_default_cache().stats()
+    st.sidebar.caption(
+        f"🗄️ Cache risultati: {stats['voci']} analisi salvate "
+        f"({stats['bytes'] / (1024 * 1024):.1f} MB) · hit {stats['hits']} / miss {stats['misses']}"
+    )
+    riparazioni = schemi.statistiche.stats()
+    if riparazioni["sezioni_riparate"] or riparazioni["riparazioni_fallite"]:
+        st.sidebar.caption(
+            f"🩹 Risposte riparate: {riparazioni['sezioni_riparate']} sezioni richieste di nuovo, "
+            f"{riparazioni['rerun_evitati']} analisi complete evitate, {riparazioni['riparazioni_fallite']} non riparabili"
+        )
+    quota = governatore.get_default_governatore().stats()
+    if quota["richieste"] or quota["in_coda_generazione"] or quota["in_coda_upload"]:
+        st.sidebar.caption(
+            f"🚦 Richieste al modello: {quota['in_coda_generazione']} in coda "
+            f"({quota['sessioni_in_attesa_generazione']} sessioni) · attesa media {quota['attesa_media_generazione_s']:.1f}s, "
+            f"p95 {quota['attesa_p95_generazione_s']:.1f}s · upload in coda {quota['in_coda_upload']} · "
+            f"429 ricevuti {quota['rate_limit']}"
+            + (f" · in pausa per {quota['pausa_generazione_s']:.0f}s" if quota["pausa_generazione_s"] else "")
+        )
+    stato_lavori = lavori.get_default_gestore().stats()
+    if stato_lavori["in_corso"] or stato_lavori["in_coda"]:
+        st.sidebar.caption(
+            f"⚙️ Analisi in background: {stato_lavori['in_corso']} in corso "
+            f"(max {stato_lavori['max_concorrenti']}), {stato_lavori['in_coda']} in coda"
+        )
 
+def _mostra_verdetto(verdetto, motivazione_verdetto):
     if verdetto == "CONSIGLIATO": st.success(f"✅ **Consigliato:** {motivazione_verdetto}")
     elif verdetto == "CONSIGLIATO_CON_RISERVA": st.warning(f"⚠️ **Consigliato con Riserva:** {motivazione_verdetto}")
     elif verdetto == "NON_CONSIGLIATO": st.error(f"❌ **Non Consigliato:** {motivazione_verdetto}")
 
-    checklist = analysis_data.get("checklist_analisi", [])
-    for item in checklist:
-        with st.expander(f"{item.get('categoria', '')}: {item.get('punto_analizzato', '')}", expanded=item.get('status') != "OK"):
-            status = item.get('status')
-            if status == "OK": st.markdown(f"**Status:** <span style='color:green;'>✅ OK</span>", unsafe_allow_html=True)
-            elif status == "ATTENZIONE": st.markdown(f"**Status:** <span style='color:orange;'>⚠️ ATTENZIONE</span>", unsafe_allow_html=True)
-            elif status == "CRITICO": st.markdown(f"**Status:** <span style='color:red;'>❌ CRITICO</span>", unsafe_allow_html=True)
-            st.markdown(f"**Motivazione:** {item.get('motivazione', 'N/A')}")
+def _mostra_elemento_checklist(item):
+    with st.expander(f"{item.get('categoria', '')}: {item.get('punto_analizzato', '')}", expanded=item.get('status') != "OK"):
+        status = item.get('status')
+        if status == "OK": st.markdown(f"**Status:** <span style='color:green;'>✅ OK</span>", unsafe_allow_html=True)
+        elif status == "ATTENZIONE": st.markdown(f"**Status:** <span style='color:orange;'>⚠️ ATTENZIONE</span>", unsafe_allow_html=True)
+        elif status == "CRITICO": st.markdown(f"**Status:** <span style='color:red;'>❌ CRITICO</span>", unsafe_allow_html=True)
+        st.markdown(f"**Motivazione:** {item.get('motivazione', 'N/A')}")
+        if item.get('timestamp'):
+            import segmenti
+            intervalli = ", ".join(f"{segmenti.formatta_tempo(da)}–{segmenti.formatta_tempo(a)}" for da, a in item['timestamp'])
+            st.markdown(f"**Momenti nel video:** {intervalli}")
+
+def _display_single_analysis(analysis_data):
+    """Funzione helper per visualizzare una singola analisi."""
+    _mostra_verdetto(analysis_data.get("verdetto_complessivo", "N/D"), analysis_data.get("motivazione_verdetto", "N/A"))
+    for item in analysis_data.get("checklist_analisi", []):
+        _mostra_elemento_checklist(item)
 
 def visualizza_analisi_persuasiva(data_persuasiva):
     st.markdown("---")
@@ -257,6 +283,12 @@ def visualizza_analisi_performance(data_performance):
         for insight in insights:
             st.info(f"• {insight}")
 
+SEZIONI_CHECKER = {
+    "analisi_persuasiva": visualizza_analisi_persuasiva,
+    "notizie_recenti": visualizza_notizie_recenti,
+    "analisi_performance": visualizza_analisi_performance,
+}
+
 def visualizza_risultati_checker(risultati):
     try:
         if isinstance(risultati, str):
@@ -268,16 +300,83 @@ def visualizza_risultati_checker(risultati):
             raise ValueError("I dati non sono nel formato dizionario atteso")
         st.subheader("Risultati dell'Analisi di Ad-Visor")
         _display_single_analysis(data)
-        if "analisi_persuasiva" in data:
-            visualizza_analisi_persuasiva(data["analisi_persuasiva"])
-        if "notizie_recenti" in data:
-            visualizza_notizie_recenti(data["notizie_recenti"])
-        if "analisi_performance" in data:
-            visualizza_analisi_performance(data["analisi_performance"])
+        for chiave, visualizza in SEZIONI_CHECKER.items():
+            if chiave in data:
+                visualizza(data[chiave])
     except Exception as e:
         st.error(f"Errore nella visualizzazione dei risultati: {e}")
         st.code(risultati)
 
+def visualizza_matrice_mercati(risultati, errori=None):
+    """Mostra la matrice dei verdetti per mercato e il dettaglio di ciascun mercato in schede."""
+    st.subheader("🌍 Verdetti per Mercato")
+    righe = []
+    for paese, testo in risultati.items():
+        try:
+            data = json.loads(testo)
+        except (TypeError, ValueError):
+            data = {}
+        stati = [item.get("status") for item in data.get("checklist_analisi", [])]
+        righe.append({
+            "Mercato": paese,
+            "Verdetto": data.get("verdetto_complessivo", "N/D"),
+            "❌ Critici": stati.count("CRITICO"),
+            "⚠️ Attenzione": stati.count("ATTENZIONE"),
+            "✅ OK": stati.count("OK"),
+            "Motivazione": data.get("motivazione_verdetto", (errori or {}).get(paese, "N/A")),
+        })
+    st.dataframe(righe, use_container_width=True, hide_index=True)
+
+    schede = st.tabs(list(risultati))
+    for scheda, (paese, testo) in zip(schede, risultati.items()):
+        with scheda:
+            visualizza_risultati_checker(testo)
+
+class VisualizzatoreProgressivo:
+    """
+    Rende i risultati del Video Checker man mano che arrivano dallo streaming:
+    prima verdetto e voci della checklist, poi le sezioni opzionali.
+    Va passato come callback `on_evento` ad analisi.analizza_checker.
+    """
+
+    def __init__(self):
+        st.subheader("Risultati dell'Analisi di Ad-Visor")
+        self._verdetto = st.empty()
+        self._spazio_checklist = st.empty()
+        self._checklist = self._spazio_checklist.container()
+        self._contenitori = {chiave: st.container() for chiave in SEZIONI_CHECKER}
+        self._valori = {}
+        self.elementi_mostrati = 0
+
+    def __call__(self, evento):
+        tipo, chiave, valore = evento
+        if tipo == streaming_json.RIPRISTINO:
+            # La richiesta riparte da capo: si toglie quanto mostrato dal tentativo precedente.
+            if "checklist_analisi" in valore:
+                self._checklist = self._spazio_checklist.container()
+            if {"verdetto_complessivo", "motivazione_verdetto"} & set(valore):
+                self._verdetto.empty()
+            for chiave_scartata in valore:
+                self._valori.pop(chiave_scartata, None)
+            return
+        if tipo == streaming_json.ELEMENTO and chiave == "checklist_analisi":
+            if isinstance(valore, dict):
+                with self._checklist:
+                    _mostra_elemento_checklist(valore)
+                self.elementi_mostrati += 1
+            return
+        if tipo != streaming_json.VALORE:
+            return
+        self._valori[chiave] = valore
+        if chiave in ("verdetto_complessivo", "motivazione_verdetto") and "verdetto_complessivo" in self._valori:
+            with self._verdetto.container():
+                _mostra_verdetto(self._valori["verdetto_complessivo"], self._valori.get("motivazione_verdetto", "..."))
+            self.elementi_mostrati += 1
+        elif chiave in SEZIONI_CHECKER and isinstance(valore, dict):
+            with self._contenitori[chiave]:
+                SEZIONI_CHECKER[chiave](valore)
+            self.elementi_mostrati += 1
+
 def visualizza_risultati_benchmark(risultati):
     try:
         if isinstance(risultati, str):
@@ -287,6 +386,10 @@ def visualizza_risultati_benchmark(risultati):
             
         if not isinstance(data, dict):
             raise ValueError("I dati non sono nel formato dizionario atteso")
+        if "estrazioni" in data:
+            # Benchmark a N video riaperto dall'archivio.
+            visualizza_benchmark_multiplo(data["estrazioni"], data["video_tuo"])
+            return
         
         # Header principale
         st.title("📊 Report Comparativo")
@@ -431,4 +534,148 @@ def visualizza_risultati_benchmark(risultati):
                     
     except Exception as e:
         st.error(f"Errore nella visualizzazione dei risultati: {e}")
-        st.code(risultati)
\ No newline at end of file
+        st.code(risultati)
+
+
+def visualizza_benchmark_multiplo(estrazioni, nostro, errori=None):
+    """Mostra classifica, tabella comparativa e SWOT del benchmark a N video, calcolati localmente."""
+    import confronto
+
+    tabella = confronto.tabella_caratteristiche(estrazioni)
+    st.title("📊 Report Comparativo")
+
+    st.header("🏆 Classifica")
+    st.dataframe(confronto.classifica(estrazioni, tabella), use_container_width=True)
+    for nome, errore in (errori or {}).items():
+        st.warning(f"{nome}: analisi non riuscita ({errore})")
+
+    st.header("⚖️ Verdetti")
+    for nome, dati in estrazioni.items():
+        st.markdown(f"### {'🎯' if nome == nostro else '🏢'} {nome}")
+        _mostra_verdetto(dati.get("verdetto_complessivo", "N/D"), dati.get("motivazione_verdetto", "N/A"))
+
+    st.header("🎯 Analisi SWOT Strategica")
+    swot = confronto.swot_locale(estrazioni, nostro, tabella)
+    swot_col1, swot_col2 = st.columns(2)
+    for colonna, titolo, chiave in (
+        (swot_col1, "#### 💪 **STRENGTHS** (Punti di Forza)", "punti_di_forza"),
+        (swot_col1, "#### ⚠️ **WEAKNESSES** (Aree di Miglioramento)", "debolezze"),
+        (swot_col2, "#### 🚀 **OPPORTUNITIES** (Opportunità)", "opportunita"),
+        (swot_col2, "#### 🚨 **THREATS** (Minacce)", "minacce"),
+    ):
+        with colonna:
+            st.markdown(titolo)
+            for item in swot[chiave] or ["Nessun elemento rilevato"]:
+                st.markdown(f"• {item}")
+
+    st.header("📋 Tabella Comparativa")
+    st.dataframe(tabella.replace({True: "✅", False: "❌"}).T, use_container_width=True)
+    differenze = confronto.differenze_chiave(tabella, nostro)
+    if not differenze.empty:
+        st.subheader("Dove il tuo video si discosta dalla maggioranza")
+        st.dataframe(differenze, use_container_width=True, hide_index=True)
+
+def avvia_lavoro(tipo, descrizione, funzione, *args, **kwargs):
+    """Avvia un lavoro in background e lo collega alla sessione e all'URL della pagina."""
+    sessione = st.session_state.setdefault("id_sessione", uuid.uuid4().hex)
+    id_lavoro = lavori.get_default_gestore().avvia(tipo, descrizione, funzione, *args, sessione=sessione, **kwargs)
+    st.session_state[f"lavoro_{tipo}"] = id_lavoro
+    st.query_params["lavoro"] = id_lavoro
+    return id_lavoro
+
+def lavoro_corrente(tipi):
+    """
+    Il lavoro a cui la pagina è collegata (dall'URL o dalla sessione), tra quelli
+    dei tipi indicati; None se non ce n'è o se il server lo ha già dimenticato.
+    """
+    gestore = lavori.get_default_gestore()
+    candidati = [st.query_params.get("lavoro")] + [st.session_state.get(f"lavoro_{tipo}") for tipo in tipi]
+    for id_lavoro in candidati:
+        lavoro = gestore.ottieni(id_lavoro) if id_lavoro else None
+        if lavoro is not None and lavoro.tipo in tipi:
+            return lavoro
+    if st.query_params.get("lavoro"):
+        st.caption("L'analisi richiesta non è più disponibile sul server: avviala di nuovo.")
+        del st.query_params["lavoro"]
+    return None
+
+def chiudi_lavoro(lavoro):
+    """Scollega la pagina dal lavoro (il risultato resta nella cache e nell'archivio)."""
+    st.session_state.pop(f"lavoro_{lavoro.tipo}", None)
+    if st.query_params.get("lavoro") == lavoro.id:
+        del st.query_params["lavoro"]
+
+@st.fragment(run_every=1.5)
+def mostra_avanzamento_lavoro(id_lavoro, streaming=False):
+    """
+    Mostra lo stato di un lavoro in corso aggiornandosi da solo; quando il lavoro
+    termina riesegue la pagina, che ne mostra il risultato. Con `streaming` i
+    risultati parziali vengono ricostruiti dagli eventi ricevuti finora.
+    """
+    gestore = lavori.get_default_gestore()
+    lavoro = gestore.ottieni(id_lavoro)
+    if lavoro is None or lavoro.concluso:
+        st.rerun()
+    if lavoro.stato == lavori.IN_CODA:
+        st.info(f"⏳ {lavoro.descrizione}: in coda ({gestore.posizione_in_coda(id_lavoro)} analisi prima di questa).")
+    else:
+        st.info(f"⚙️ {lavoro.descrizione}: in corso da {lavoro.durata():.0f}s. "
+                "Puoi cambiare le impostazioni o aggiornare la pagina: l'analisi prosegue.")
+    for messaggio in lavoro.messaggi[-5:]:
+        st.caption(messaggio)
+    if streaming and lavoro.eventi:
+        visualizzatore = VisualizzatoreProgressivo()
+        for evento in list(lavoro.eventi):
+            visualizzatore(evento)
+
+def inizia_pagina(nome):
+    """Apre la traccia della run della pagina e, se richiesto, il profilo delle run lente."""
+    run = tracciamento.inizia_run(f"pagina {nome}")
+    precedente = st.session_state.pop("profilo_in_corso", None)
+    if precedente is not None:
+        # La run precedente si è interrotta (st.rerun, st.stop) prima di chiudi_pagina.
+        precedente.scarta()
+    profilo = None
+    if tracciamento.profilo_abilitato() or st.session_state.get("profila_run", False):
+        profilo = st.session_state["profilo_in_corso"] = tracciamento.ProfiloRun(nome)
+    return run, profilo
+
+def debug_abilitato():
+    """Pannello di debug visibile con ADVISOR_DEBUG=1 oppure aggiungendo ?debug=1 all'URL."""
+    return os.getenv("ADVISOR_DEBUG", "").lower() in ("1", "true", "si", "yes") or st.query_params.get("debug") == "1"
+
+def chiudi_pagina(pagina, lavoro=None):
+    """Chiude traccia e profilo della run e, se abilitato, mostra il pannello di debug."""
+    run, profilo = pagina
+    tracciamento.termina_run(run)
+    if profilo is not None:
+        st.session_state.pop("profilo_in_corso", None)
+        profilo.termina()
+    if debug_abilitato():
+        mostra_pannello_debug(run, lavoro)
+
+def _mostra_traccia(traccia, chiave):
+    durate = traccia.durate_per_fase()
+    if durate:
+        st.bar_chart({"secondi": durate})
+    st.dataframe(traccia.righe(), hide_index=True, use_container_width=True)
+    st.download_button("Scarica la traccia (OTLP JSON)", json.dumps(traccia.come_otlp(), ensure_ascii=False),
+                       file_name=f"traccia_{traccia.id}.json", mime="application/json", key=f"otlp_{chiave}")
+
+def mostra_pannello_debug(run, lavoro=None):
+    with st.expander("🐞 Debug: tempi per fase e profilo"):
+        st.checkbox("Profila le run lente di questa pagina", key="profila_run",
+                    help=f"Conserva il profilo cProfile delle run più lente di {tracciamento.soglia_profilo_s():.0f}s.")
+        if lavoro is not None and lavoro.traccia is not None:
+            st.markdown(f"**Analisi `{lavoro.id[:8]}`** ({lavoro.descrizione}, {lavoro.durata():.1f}s)")
+            _mostra_traccia(lavoro.traccia, "lavoro")
+        st.markdown(f"**Run della pagina** ({run.radice.durata_s * 1000:.0f} ms)")
+        _mostra_traccia(run, "run")
+        st.markdown("**Fasi di tutto il processo**")
+        st.dataframe(tracciamento.istogrammi.riepilogo(), hide_index=True, use_container_width=True)
+        metriche = tracciamento.metriche_prometheus()
+        st.download_button("Scarica le metriche (Prometheus)", metriche, file_name="advisor_metrics.txt",
+                           mime="text/plain", key="prometheus")
+        for voce in tracciamento.run_lente:
+            st.markdown(f"🐢 **{voce['pagina']}** alle {voce['quando']}: {voce['durata_s']:.1f}s")
+            st.code(voce["profilo"])